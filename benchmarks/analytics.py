@@ -0,0 +1,63 @@
+"""Compare the loop-based profile methods with the NumPy analytics path
+
+Usage: python -m benchmarks.analytics [transactions]
+"""
+import sys
+import time
+from itertools import accumulate
+from models.profile import Profile
+from models.analytics import LedgerAnalytics, HAS_NUMPY
+from benchmarks.ledger_memory import build_ledger
+
+def monthly_totals(profile):
+    """Monthly income and expenses built one transaction object at a time"""
+    months = {}
+    for transaction in profile.transactions:
+        totals = months.setdefault((transaction.date.year, transaction.date.month), [0, 0])
+        totals[0 if transaction.get_type() == "Income" else 1] += transaction.amount
+    return sorted(months.items())
+
+def loop_reports(profile):
+    """The reports computed with the existing per-transaction methods"""
+    return {
+        'totals': lambda: profile.compute_totals(),
+        'running balance': lambda: list(accumulate(transaction.get_amount() for transaction in profile.transactions)),
+        'monthly totals': lambda: monthly_totals(profile),
+        'top 10 expenses': lambda: sorted((transaction for transaction in profile.transactions
+                                           if transaction.get_type() == "Expense"),
+                                          key=lambda transaction: transaction.amount, reverse=True)[:10]
+    }
+
+def analytics_reports(analytics):
+    return {
+        'totals': analytics.totals,
+        'running balance': analytics.running_balances,
+        'monthly totals': lambda: analytics.period_totals('month'),
+        'top 10 expenses': lambda: analytics.top_expenses(10)
+    }
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def main(transaction_count=1_000_000):
+    profile = Profile("Benchmark")
+    profile.set_ledger(build_ledger(transaction_count))
+    print(f"{transaction_count:,} transactions")
+    
+    columns = {'loops': loop_reports(profile),
+               'columns': analytics_reports(LedgerAnalytics(profile, use_numpy=False))}
+    if HAS_NUMPY:
+        numpy_analytics = LedgerAnalytics(profile)
+        print(f"NumPy export: {timed(numpy_analytics.totals):.3f}s (once per change)")
+        columns['numpy'] = analytics_reports(numpy_analytics)
+    else:
+        print("NumPy is not installed, only the pure Python paths are measured")
+    
+    print(f"{'report':>16}" + ''.join(f"  {name:>10}" for name in columns))
+    for report in columns['loops']:
+        print(f"{report:>16}" + ''.join(f"  {timed(reports[report]):>9.3f}s" for reports in columns.values()))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
\ No newline at end of file
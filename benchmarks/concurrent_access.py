@@ -0,0 +1,79 @@
+"""Stress test several processes saving to the same data file
+
+Every process adds transactions to its own profile and to one shared
+profile, saving after each batch, then the data is loaded again and
+checked for lost transactions.
+
+Usage: python -m benchmarks.concurrent_access [processes] [transactions per process]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from models.financial_manager import FinancialManager
+from models.profile import Profile
+from models.transaction import Income, Expense
+
+MODES = {
+    'full save': {},
+    'journal': {'use_journal': True, 'compact_threshold': 50},
+    'binary journal': {'use_journal': True, 'compact_threshold': 50, 'snapshot_format': 'binary', 'lazy': True},
+    'sharded': {'layout': 'sharded', 'compact_threshold': 50, 'lazy': True}
+}
+
+def worker(data_file, options, worker_id, transaction_count, batch_size):
+    """Add transactions from one process, merging and saving after every batch"""
+    manager = FinancialManager(data_file, **options)
+    own_name = f"Worker {worker_id}"
+    for number in range(transaction_count):
+        with manager.lock:
+            if not manager.has_profile(own_name):
+                manager.add_profile(Profile(own_name))
+            if not manager.has_profile("Shared"):
+                manager.add_profile(Profile("Shared"))
+            manager.get_profile(own_name).add_transaction(Expense(f"{own_name} #{number}", 1))
+            manager.get_profile("Shared").add_transaction(Income(f"{own_name} #{number}", 1))
+        if number % batch_size == batch_size - 1:
+            manager.write_data()
+    manager.close()
+    return manager.merge_count
+
+def run(mode, process_count, transaction_count, batch_size=10):
+    directory = tempfile.mkdtemp()
+    data_file = os.path.join(directory, 'financial_data.json')
+    options = MODES[mode]
+    try:
+        start = time.perf_counter()
+        with multiprocessing.Pool(process_count) as pool:
+            merges = pool.starmap(worker, [(data_file, options, worker_id, transaction_count, batch_size)
+                                           for worker_id in range(process_count)])
+        elapsed = time.perf_counter() - start
+        
+        manager = FinancialManager(data_file, **options)
+        problems = []
+        for worker_id in range(process_count):
+            profile = manager.get_profile(f"Worker {worker_id}")
+            count = profile.get_transaction_count() if profile else 0
+            if count != transaction_count:
+                problems.append(f"Worker {worker_id} has {count} transactions")
+        shared = manager.get_profile("Shared")
+        descriptions = [transaction.description for transaction in shared.transactions] if shared else []
+        if len(set(descriptions)) != len(descriptions) or len(descriptions) != process_count * transaction_count:
+            problems.append(f"Shared has {len(descriptions)} transactions, {len(set(descriptions))} distinct")
+        manager.close()
+        
+        status = "ok" if not problems else "; ".join(problems)
+        print(f"{mode:>15}: {elapsed:6.2f}s, {sum(merges)} merges, {status}")
+        return not problems
+    finally:
+        shutil.rmtree(directory)
+
+def main(process_count=4, transaction_count=500):
+    print(f"{process_count} processes x {transaction_count} transactions")
+    results = [run(mode, process_count, transaction_count) for mode in MODES]
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:3]]))
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Compare the memory used by different transaction layouts
+
+Usage: python -m benchmarks.ledger_memory [count ...]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+from models.transaction import Income, Expense
+from models.ledger import TransactionLedger
+
+DESCRIPTIONS = ["Salary", "Groceries", "Rent", "Electricity", "Internet", "Coffee",
+                "Transport", "Dinner", "Books", "Gift", "Freelance project", "Phone credit"]
+
+class DictTransaction:
+    """Transaction with an instance __dict__, like the layout before __slots__"""
+    
+    def __init__(self, description, amount, date, transaction_type):
+        self.description = description
+        self.amount = amount
+        self.date = date
+        self.transaction_type = transaction_type
+
+def generate_rows(count, seed=42):
+    """Yield (type, description, amount, date) tuples"""
+    rng = random.Random(seed)
+    date = datetime(2020, 1, 1)
+    for _ in range(count):
+        date += timedelta(seconds=rng.randint(60, 7200))
+        transaction_type = "Income" if rng.random() < 0.2 else "Expense"
+        yield transaction_type, rng.choice(DESCRIPTIONS), round(rng.uniform(1000, 5000000), 2), date
+
+def build_dict_objects(count):
+    return [DictTransaction(description, amount, date, transaction_type)
+            for transaction_type, description, amount, date in generate_rows(count)]
+
+def build_slot_objects(count):
+    transactions = []
+    for transaction_type, description, amount, date in generate_rows(count):
+        transaction = Income(description, amount) if transaction_type == "Income" else Expense(description, amount)
+        transaction.date = date
+        transactions.append(transaction)
+    return transactions
+
+def build_ledger(count):
+    ledger = TransactionLedger()
+    for transaction_type, description, amount, date in generate_rows(count):
+        transaction = Income(description, amount) if transaction_type == "Income" else Expense(description, amount)
+        transaction.date = date
+        ledger.append(transaction)
+    return ledger
+
+def measure(builder, count):
+    """Return the bytes still allocated by the structure a builder returns"""
+    gc.collect()
+    tracemalloc.start()
+    result = builder(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+def main(counts):
+    layouts = [("dict objects", build_dict_objects), ("slot objects", build_slot_objects),
+               ("columnar ledger", build_ledger)]
+    print(f"{'transactions':>12}  " + "  ".join(f"{name:>16}" for name, _ in layouts))
+    for count in counts:
+        sizes = [measure(builder, count) for _, builder in layouts]
+        print(f"{count:>12,}  " + "  ".join(f"{size / 1024 / 1024:>13.1f} MB" for size in sizes))
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""Compare save/load throughput and file size of the JSON and binary snapshot formats
+
+Usage: python -m benchmarks.snapshot_formats [transactions] [profiles]
+"""
+import os
+import sys
+import tempfile
+import time
+from models.financial_manager import FinancialManager
+from models.profile import Profile
+from models.transaction import Income, Expense
+from benchmarks.ledger_memory import generate_rows
+
+def build_profiles(transaction_count, profile_count):
+    """Spread generated transactions over a number of profiles"""
+    profiles = [Profile(f"Profile {number}") for number in range(profile_count)]
+    for position, (transaction_type, description, amount, date) in enumerate(generate_rows(transaction_count)):
+        transaction = Income(description, amount) if transaction_type == "Income" else Expense(description, amount)
+        transaction.date = date
+        profiles[position % profile_count].add_transaction(transaction)
+    return profiles
+
+def run(snapshot_format, profiles, directory):
+    """Time one save and one full load in the given format"""
+    data_file = os.path.join(directory, f"data_{snapshot_format}.json")
+    manager = FinancialManager(data_file, snapshot_format=snapshot_format)
+    manager.profiles = profiles
+    
+    start = time.perf_counter()
+    manager.storage.save_profiles(profiles)
+    save_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    loaded = FinancialManager(data_file)
+    load_seconds = time.perf_counter() - start
+    
+    assert loaded.get_summary_statistics()['total_transactions'] == sum(p.get_transaction_count() for p in profiles)
+    return save_seconds, load_seconds, os.path.getsize(data_file)
+
+def main(transaction_count=200_000, profile_count=4):
+    profiles = build_profiles(transaction_count, profile_count)
+    print(f"{transaction_count:,} transactions in {profile_count} profiles")
+    print(f"{'format':>8}  {'save':>10}  {'load':>10}  {'save tx/s':>12}  {'load tx/s':>12}  {'size':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for snapshot_format in ('json', 'binary'):
+            save_seconds, load_seconds, size = run(snapshot_format, profiles, directory)
+            print(f"{snapshot_format:>8}  {save_seconds:>9.2f}s  {load_seconds:>9.2f}s  "
+                  f"{transaction_count / save_seconds:>12,.0f}  {transaction_count / load_seconds:>12,.0f}  "
+                  f"{size / 1024 / 1024:>7.1f} MB")
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
\ No newline at end of file
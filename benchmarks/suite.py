@@ -0,0 +1,350 @@
+"""Benchmark suite for the load, save, aggregate, query and render paths
+
+Each case is run repeatedly on a synthetic data set (see
+benchmarks.synthetic) and reported as operations per second, p50/p99
+latency and the peak memory of one extra run traced with tracemalloc.
+Results are written to a JSON file; given a baseline file from an earlier
+run, the suite fails when a case got slower (p50) or needs more memory
+than the regression threshold allows.
+
+The render cases need Tk and a display; on a headless machine run the
+suite under xvfb-run, otherwise they are skipped.
+
+Usage: python -m benchmarks.suite [--profiles N] [--transactions M] [--output results.json]
+                                  [--baseline baseline.json] [--threshold 0.25] [--only GROUP ...]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from models.financial_manager import FinancialManager
+from models.transaction import Transaction
+from models.time_index import PeriodRollup
+from models.search_index import SearchIndex, CategoryTotals
+from models.profile import Profile
+from models.recurring import RecurringRule, BalanceForecast, add_months
+from benchmarks.synthetic import START_DATE, generate_profiles, generate_transactions
+
+GROUPS = ('load', 'save', 'aggregate', 'query', 'render')
+
+class Case:
+    """One benchmarked operation
+    
+    'prepare' runs untimed before every call of 'run', for operations that
+    need fresh state each time.
+    """
+    
+    def __init__(self, group, name, run, prepare=None):
+        self.group = group
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of already sorted samples"""
+    rank = max(0, min(len(sorted_samples) - 1, round(fraction * len(sorted_samples) + 0.5) - 1))
+    return sorted_samples[rank]
+
+def measure(case, max_iterations, max_seconds):
+    """Time a case and trace its memory; returns its result record"""
+    if case.prepare:
+        case.prepare()
+    case.run()  # Warm up caches and lazy imports
+    
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_iterations and (len(samples) < 5 or time.perf_counter() - started < max_seconds):
+        if case.prepare:
+            case.prepare()
+        start = time.perf_counter()
+        case.run()
+        samples.append(time.perf_counter() - start)
+    
+    if case.prepare:
+        case.prepare()
+    tracemalloc.start()
+    case.run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    samples.sort()
+    return {
+        'iterations': len(samples),
+        'ops_per_sec': len(samples) / sum(samples),
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'peak_memory_kb': peak / 1024
+    }
+
+def write_data_set(profiles, directory):
+    """Store the profiles once per storage layout and return the data file paths"""
+    paths = {}
+    for layout, options in (('json', {}), ('binary', {'snapshot_format': 'binary'}),
+                            ('sharded', {'layout': 'sharded'})):
+        paths[layout] = os.path.join(directory, layout, 'financial_data.json')
+        manager = FinancialManager(paths[layout], **options)
+        manager.profiles = profiles
+        manager.storage.invalidate()
+        manager.write_data()
+    return paths
+
+def load_cases(paths):
+    return [
+        Case('load', 'load.json', lambda: FinancialManager(paths['json'])),
+        Case('load', 'load.json_lazy', lambda: FinancialManager(paths['json'], use_journal=True, lazy=True)),
+        Case('load', 'load.binary', lambda: FinancialManager(paths['binary'])),
+        Case('load', 'load.binary_lazy', lambda: FinancialManager(paths['binary'], lazy=True)),
+        Case('load', 'load.sharded_lazy', lambda: FinancialManager(paths['sharded'], layout='sharded', lazy=True))
+    ]
+
+def save_cases(profiles, directory):
+    full = FinancialManager(os.path.join(directory, 'save', 'full.json'))
+    full.profiles = profiles
+    binary = FinancialManager(os.path.join(directory, 'save', 'binary.json'), snapshot_format='binary')
+    binary.profiles = profiles
+    journal = FinancialManager(os.path.join(directory, 'save', 'journal.json'), use_journal=True,
+                               compact_threshold=10 ** 9)
+    journal.profiles = profiles
+    journal.write_data()
+    sharded_profiles = generate_profiles(len(profiles), len(profiles[0].transactions), seed='sharded')
+    sharded = FinancialManager(os.path.join(directory, 'save', 'sharded.json'), layout='sharded',
+                               compact_threshold=10 ** 9)
+    sharded.profiles = sharded_profiles
+    sharded.write_data()
+    new_transactions = generate_transactions(10 ** 9, seed='save', start=START_DATE + timedelta(days=800))
+    
+    def add_transactions(profile):
+        for _ in range(100):
+            profile.add_transaction(next(new_transactions))
+    
+    rng = random.Random(0)
+    
+    def edit_transactions(profile):
+        ids = profile.transactions.ids
+        for _ in range(10):
+            transaction_id = ids[rng.randrange(len(ids))]
+            profile.update_transaction(transaction_id, amount=profile.get_transaction(transaction_id).amount + 1)
+    
+    return [
+        Case('save', 'save.full_json', full.write_data, prepare=full.storage.invalidate),
+        Case('save', 'save.full_binary', binary.write_data, prepare=binary.storage.invalidate),
+        Case('save', 'save.journal_append_100', journal.write_data, prepare=lambda: add_transactions(profiles[0])),
+        Case('save', 'save.journal_edit_10', journal.write_data, prepare=lambda: edit_transactions(profiles[0])),
+        Case('save', 'save.sharded_append_100', sharded.write_data,
+             prepare=lambda: add_transactions(sharded_profiles[0]))
+    ]
+
+def forecast_profile(ledger):
+    """A profile sharing a ledger, with the recurring rules of a typical household"""
+    profile = Profile("Forecast")
+    profile.set_ledger(ledger)
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    for description, amount, transaction_type, frequency, interval in [
+            ("Salary", 8_000_000, 'income', 'monthly', 1), ("Rent", 3_000_000, 'expense', 'monthly', 1),
+            ("Groceries", 250_000, 'expense', 'weekly', 1), ("Transport", 20_000, 'expense', 'daily', 1),
+            ("Internet", 350_000, 'expense', 'monthly', 1), ("Insurance", 1_200_000, 'expense', 'monthly', 3),
+            ("Gym", 150_000, 'expense', 'weekly', 2), ("Tax refund", 1_000_000, 'income', 'yearly', 1)]:
+        profile.add_recurring_rule(RecurringRule(description, amount, transaction_type, frequency, interval,
+                                                 today + timedelta(days=1)))
+    return profile
+
+def aggregate_cases(profiles):
+    ledger = profiles[0].transactions
+    transaction_dicts = [transaction.to_dict() for transaction in ledger[:10_000]]
+    forecasting = forecast_profile(ledger)
+    horizon = add_months(datetime.now().date(), 60)
+    rent = [forecasting.get_recurring_rules()[1]]
+    
+    def change_rule():
+        # One rule changes, the cached 5-year forecast only redoes that rule's share
+        rent[0] = forecasting.update_recurring_rule(rent[0], amount=rent[0].amount + 1000)
+        return forecasting.get_forecast(horizon, 'day')
+    
+    return [
+        Case('aggregate', 'aggregate.get_balance', lambda: [profile.get_balance() for profile in profiles]),
+        Case('aggregate', 'aggregate.compute_totals', lambda: [profile.compute_totals() for profile in profiles]),
+        Case('aggregate', 'aggregate.build_monthly_rollup', lambda: PeriodRollup(ledger, 'month')),
+        Case('aggregate', 'aggregate.monthly_rollup_cached', lambda: profiles[0].get_rollup('month')),
+        Case('aggregate', 'aggregate.build_category_totals', lambda: CategoryTotals(ledger)),
+        Case('aggregate', 'aggregate.category_totals_cached', lambda: profiles[0].get_category_totals()),
+        Case('aggregate', 'aggregate.build_forecast_5y_daily', lambda: BalanceForecast(forecasting, horizon, 'day')),
+        Case('aggregate', 'aggregate.forecast_5y_daily_cached', lambda: forecasting.get_forecast(horizon, 'day')),
+        Case('aggregate', 'aggregate.forecast_rule_change', change_rule),
+        Case('aggregate', 'aggregate.from_dict_10k',
+             lambda: [Transaction.from_dict(transaction_data) for transaction_data in transaction_dicts])
+    ]
+
+def query_cases(profiles, manager):
+    profile = profiles[0]
+    rng = random.Random(0)
+    names = [profile.name for profile in profiles]
+    
+    def month_between():
+        start = START_DATE + timedelta(days=rng.randrange(700))
+        return profile.get_transactions_between(start, start + timedelta(days=30))
+    
+    def running_balances():
+        count = profile.get_transaction_count()
+        return [profile.get_running_balance(rng.randrange(count)) for _ in range(100)]
+    
+    def edit_old_transaction():
+        # Changing an early amount moves every later balance; the last one is read back
+        transaction_id = profile.transactions.ids[rng.randrange(100)]
+        profile.update_transaction(transaction_id, amount=profile.get_transaction(transaction_id).amount + 1)
+        return profile.get_running_balance(-1)
+    
+    def type_ahead():
+        # Every keystroke of a query, as search-as-you-type runs it
+        return [profile.search_rows(query[:length]) for query in ('groceries', 'rent') for length in range(1, 5)]
+    
+    return [
+        Case('query', 'query.build_search_index', lambda: SearchIndex(profile.transactions)),
+        Case('query', 'query.search_type_ahead', type_ahead),
+        Case('query', 'query.search_category', lambda: profile.search_rows('lunch', 'Food')),
+        Case('query', 'query.month_between', month_between),
+        Case('query', 'query.recent_20', lambda: profile.get_recent_transactions(20)),
+        Case('query', 'query.running_balance_100', running_balances),
+        Case('query', 'query.edit_old_transaction', edit_old_transaction),
+        Case('query', 'query.get_profile', lambda: [manager.get_profile(name) for name in names]),
+        Case('query', 'query.profile_names', manager.get_profile_names)
+    ]
+
+def render_cases(profiles, directory):
+    """Cases for the history display, or [] if Tk cannot open a window"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"Skipping render benchmarks: {e}")
+        return []
+    root.withdraw()
+    
+    from main import PersonalFinanceApp
+    # The application opens data/financial_data.json relative to the working directory
+    working_directory = os.getcwd()
+    os.chdir(directory)
+    try:
+        app = PersonalFinanceApp(root)
+    finally:
+        os.chdir(working_directory)
+    app.financial_manager.worker.stop()
+    app.financial_manager.worker = None
+    app.current_profile = profiles[0]
+    rng = random.Random(0)
+    new_transactions = generate_transactions(10 ** 9, seed='render', start=START_DATE + timedelta(days=800))
+    
+    def update_display():
+        app.update_display()
+        root.update_idletasks()
+    
+    def scroll():
+        app.scroll_history_to(rng.randrange(profiles[0].get_transaction_count()))
+        root.update_idletasks()
+    
+    def append():
+        profiles[0].add_transaction(next(new_transactions))
+        app.update_display(appended=True)
+        root.update_idletasks()
+    
+    return [
+        Case('render', 'render.update_display', update_display),
+        Case('render', 'render.scroll', scroll),
+        Case('render', 'render.append', append)
+    ]
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Print the change against a baseline and return the names of regressed cases"""
+    regressions = []
+    print(f"\n{'case':<34} {'p50 base':>10} {'p50 now':>10} {'change':>8}  {'memory change':>13}")
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<34} {'(new)':>10}")
+            continue
+        time_change = result['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0
+        memory_change = result['peak_memory_kb'] / base['peak_memory_kb'] - 1 if base['peak_memory_kb'] else 0
+        slower = time_change > threshold and result['p50_ms'] - base['p50_ms'] > min_delta_ms
+        larger = memory_change > threshold and result['peak_memory_kb'] - base['peak_memory_kb'] > 64
+        flag = "  REGRESSION" if slower or larger else ""
+        print(f"{name:<34} {base['p50_ms']:>8.3f}ms {result['p50_ms']:>8.3f}ms {time_change:>+8.1%}  "
+              f"{memory_change:>+13.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    if baseline.get('meta', {}).get('data_set') != results['meta']['data_set']:
+        print("Warning: the baseline was measured on a different data set")
+    return regressions
+
+def run_suite(profile_count, transaction_count, groups, max_iterations, max_seconds):
+    print(f"Generating {profile_count} profiles x {transaction_count:,} transactions")
+    profiles = generate_profiles(profile_count, transaction_count)
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_data_set(profiles, directory)
+        manager = FinancialManager(paths['json'])
+        builders = {
+            'load': lambda: load_cases(paths),
+            'save': lambda: save_cases(generate_profiles(profile_count, transaction_count), directory),
+            'aggregate': lambda: aggregate_cases(manager.get_all_profiles()),
+            'query': lambda: query_cases(manager.get_all_profiles(), manager),
+            'render': lambda: render_cases(generate_profiles(1, transaction_count), directory)
+        }
+        
+        results = {}
+        for group in groups:
+            for case in builders[group]():
+                results[case.name] = measure(case, max_iterations, max_seconds)
+                result = results[case.name]
+                print(f"{case.name:<34} {result['ops_per_sec']:>12,.1f} ops/s  p50 {result['p50_ms']:>9.3f}ms  "
+                      f"p99 {result['p99_ms']:>9.3f}ms  peak {result['peak_memory_kb']:>10,.0f} KB")
+    finally:
+        shutil.rmtree(directory)
+    
+    return {
+        'meta': {
+            'data_set': {'profiles': profile_count, 'transactions_per_profile': transaction_count},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.now().isoformat(timespec='seconds')
+        },
+        'results': results
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument('--profiles', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=20_000, help="transactions per profile")
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS), help="groups to run")
+    parser.add_argument('--iterations', type=int, default=200, help="maximum timed runs per case")
+    parser.add_argument('--seconds', type=float, default=2.0, help="time budget per case (at least 5 runs)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown or memory growth as a fraction (default: 0.25)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help="ignore p50 changes smaller than this, to filter timer noise")
+    args = parser.parse_args(argv)
+    
+    results = run_suite(args.profiles, args.transactions, args.only, args.iterations, args.seconds)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
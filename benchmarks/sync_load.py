@@ -0,0 +1,160 @@
+"""Load test the sync server with many concurrent keep-alive clients
+
+Starts server.py on a temporary data file, lets every client send a mix
+of reads (profile list, delta sync, summaries) and appends for a fixed
+time, then prints requests per second and latency percentiles per kind
+of request and checks that no appended transaction was lost.
+
+Usage: python -m benchmarks.sync_load [clients] [seconds] [write percent]
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+PROFILES = ["Alice", "Bob", "Carol", "Dave"]
+
+class Client:
+    """One keep-alive HTTP/1.1 connection sending JSON requests in turn"""
+    
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+    
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+    
+    async def request(self, method, path, data=None):
+        """Send one request; returns (status, decoded JSON body)"""
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+    
+    def close(self):
+        self.writer.close()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def run_client(client_id, host, port, deadline, write_fraction, latencies, appended):
+    """Send requests until the deadline, syncing one profile by version like a device would"""
+    rng = random.Random(client_id)
+    client = Client(host, port)
+    await client.connect()
+    profile = PROFILES[client_id % len(PROFILES)]
+    version = 0
+    seen = 0
+    number = 0
+    try:
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < write_fraction:
+                kind = 'append'
+                number += 1
+                request = ('POST', f"/profiles/{profile}/transactions",
+                           {'type': 'expense', 'amount': rng.randint(1, 100),
+                            'description': f"Client {client_id} #{number}", 'category': 'load'})
+            elif roll < write_fraction + (1 - write_fraction) / 2:
+                kind = 'delta sync'
+                request = ('GET', f"/profiles/{profile}/transactions?since={version}", None)
+            elif roll < write_fraction + (1 - write_fraction) * 3 / 4:
+                kind = 'profiles'
+                request = ('GET', "/profiles", None)
+            else:
+                kind = 'summary'
+                request = ('GET', f"/profiles/{profile}/summary?period=month", None)
+            
+            start = time.perf_counter()
+            status, data = await client.request(*request)
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if status >= 400:
+                raise RuntimeError(f"{request[0]} {request[1]} failed with {status}: {data}")
+            if kind == 'append':
+                appended[profile] = appended.get(profile, 0) + 1
+            elif kind == 'delta sync':
+                seen = len(data['transactions']) if data['full'] else seen + len(data['transactions'])
+                version = data['version']
+    finally:
+        client.close()
+    return profile, version, seen
+
+async def load(host, port, client_count, seconds, write_fraction):
+    setup = Client(host, port)
+    await setup.connect()
+    for name in PROFILES:
+        await setup.request('POST', "/profiles", {'name': name})
+    setup.close()
+    
+    latencies = {}
+    appended = {}
+    start = time.perf_counter()
+    synced = await asyncio.gather(*(run_client(client_id, host, port, start + seconds, write_fraction, latencies, appended)
+                                    for client_id in range(client_count)))
+    elapsed = time.perf_counter() - start
+    
+    check = Client(host, port)
+    await check.connect()
+    problems = []
+    for name in PROFILES:
+        _, data = await check.request('GET', f"/profiles/{name}")
+        if data['transactions'] != appended.get(name, 0):
+            problems.append(f"{name} has {data['transactions']} transactions, {appended.get(name, 0)} appended")
+    # Every append has been answered, so one more delta sync must add up to the whole profile
+    for name, version, seen in synced:
+        _, data = await check.request('GET', f"/profiles/{name}/transactions?since={version}")
+        seen = len(data['transactions']) if data['full'] else seen + len(data['transactions'])
+        if seen != appended.get(name, 0):
+            problems.append(f"A client of {name} synced {seen} transactions, {appended.get(name, 0)} appended")
+    check.close()
+    return elapsed, latencies, problems
+
+def main(client_count=50, seconds=5, write_percent=20):
+    directory = tempfile.mkdtemp()
+    data_file = os.path.join(directory, 'financial_data.json')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, os.path.join(root, 'server.py'), '--data-file', data_file,
+                                '--port', '0'], stdout=subprocess.PIPE, text=True)
+    try:
+        address = urlsplit(json.loads(process.stdout.readline())['listening'])
+        elapsed, latencies, problems = asyncio.run(load(address.hostname, address.port, client_count,
+                                                        seconds, write_percent / 100))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(directory)
+    
+    total = sum(len(values) for values in latencies.values())
+    print(f"{client_count} clients, {seconds}s, {write_percent}% appends: "
+          f"{total} requests, {total / elapsed:,.0f} requests/s")
+    print(f"{'request':>12} {'count':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        print(f"{kind:>12} {len(values):>8} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.99) * 1000:>8.2f} {values[-1] * 1000:>8.2f}")
+    for problem in problems:
+        print(problem)
+    return 0 if not problems else 1
+
+if __name__ == "__main__":
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:4]]))
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Deterministic synthetic ledgers for benchmarks
+
+Transactions follow a rough student/household budget: frequent small
+expenses (coffee, meals, transport), weekly groceries, monthly bills and
+salary, and occasional large purchases. Amounts are log-normal around a
+typical value per description and rounded to whole hundreds of Rupiah;
+dates advance with exponential gaps, mostly in the daytime. The same
+arguments always produce the same data.
+
+Usage: python -m benchmarks.synthetic [profiles] [transactions per profile] [output file]
+"""
+import math
+import random
+import sys
+from datetime import datetime, timedelta
+from models.transaction import Income, Expense
+from models.ledger import TransactionLedger
+from models.profile import Profile
+
+START_DATE = datetime(2022, 1, 1)
+
+# (type, description, relative frequency, typical amount, spread, category)
+CATALOG = [
+    ("Expense", "Coffee", 18, 25_000, 0.3, "Food"),
+    ("Expense", "Lunch", 16, 35_000, 0.35, "Food"),
+    ("Expense", "Dinner", 10, 60_000, 0.5, "Food"),
+    ("Expense", "Transport", 14, 20_000, 0.6, "Transport"),
+    ("Expense", "Groceries", 6, 250_000, 0.5, "Groceries"),
+    ("Expense", "Phone credit", 2, 100_000, 0.3, "Bills"),
+    ("Expense", "Internet", 1, 350_000, 0.1, "Bills"),
+    ("Expense", "Electricity", 1, 400_000, 0.25, "Bills"),
+    ("Expense", "Rent", 1, 3_000_000, 0.1, "Housing"),
+    ("Expense", "Books", 1.5, 120_000, 0.5, "Education"),
+    ("Expense", "Clothes", 1, 300_000, 0.7, "Shopping"),
+    ("Expense", "Electronics", 0.3, 2_500_000, 0.8, "Shopping"),
+    ("Expense", "Gift", 0.8, 200_000, 0.8, "Gifts"),
+    ("Income", "Salary", 1, 8_000_000, 0.15, "Salary"),
+    ("Income", "Allowance", 1, 1_500_000, 0.2, "Allowance"),
+    ("Income", "Freelance project", 0.7, 2_000_000, 0.7, "Freelance"),
+    ("Income", "Refund", 0.5, 80_000, 0.8, "Refunds"),
+]
+
+def generate_transactions(count, seed=0, start=START_DATE, days=730):
+    """Yield 'count' transactions in date order, spread over about 'days' days"""
+    rng = random.Random(seed)
+    weights = [entry[2] for entry in CATALOG]
+    mean_gap = days * 86400 / max(count, 1)
+    date = start
+    for _ in range(count):
+        date += timedelta(seconds=rng.expovariate(1 / mean_gap))
+        if not 7 <= date.hour < 23:
+            # Few purchases at night: move them to the morning
+            date = date.replace(hour=7 + rng.randint(0, 3))
+        transaction_type, description, _, typical, spread, category = rng.choices(CATALOG, weights)[0]
+        amount = max(100, round(rng.lognormvariate(math.log(typical), spread), -2))
+        transaction_class = Income if transaction_type == "Income" else Expense
+        transaction = transaction_class(description, amount, category)
+        transaction.date = date
+        yield transaction
+
+def generate_ledger(count, seed=0, days=730):
+    """Build a TransactionLedger of 'count' generated transactions"""
+    return TransactionLedger(generate_transactions(count, seed=seed, days=days))
+
+def generate_profiles(profile_count, transaction_count, seed=0, days=730):
+    """Build 'profile_count' profiles with 'transaction_count' generated transactions each"""
+    profiles = []
+    for number in range(profile_count):
+        profile = Profile(f"Profile {number + 1}")
+        profile.created_date = START_DATE
+        profile.set_ledger(generate_ledger(transaction_count, seed=f"{seed}-{number}", days=days))
+        profiles.append(profile)
+    return profiles
+
+def main(profile_count=5, transaction_count=20_000, output=None):
+    from models.financial_manager import FinancialManager
+    profiles = generate_profiles(profile_count, transaction_count)
+    if output is None:
+        for profile in profiles:
+            print(profile)
+        return
+    manager = FinancialManager(output)
+    manager.profiles = profiles
+    manager.storage.invalidate()
+    manager.write_data()
+    print(f"Wrote {profile_count} profiles x {transaction_count:,} transactions to {output}")
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]], *sys.argv[3:4])
\ No newline at end of file
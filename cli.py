@@ -0,0 +1,410 @@
+"""Command line interface for the finance data, usable without a display
+
+Every command prints its results as JSON lines (one JSON object per line)
+so the output can be piped into other tools. Errors are printed to stderr
+as a JSON object with an "error" key and exit with status 1.
+
+Usage: python cli.py [--data-file PATH] <command> ...
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_DATA_FILE = 'data/financial_data.json'
+
+# The models package is only imported once a command runs, so --help and
+# argument errors never pay for it
+
+def open_manager(args):
+    """Open the data file the way the GUI does: journaled, reading histories on demand"""
+    from models.financial_manager import FinancialManager
+    return FinancialManager(args.data_file, use_journal=True, lazy=True, layout=args.layout)
+
+def save(manager):
+    """Save changes, raising any storage error, and let a started compaction finish"""
+    manager.write_data()
+    if hasattr(manager.storage, 'wait_for_compaction'):
+        manager.storage.wait_for_compaction()
+
+def parse_date(text):
+    """Parse a command line date in any of the formats statements may use"""
+    from models.importer import DateParser
+    try:
+        return DateParser()(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def get_profile(manager, name):
+    profile = manager.get_profile(name)
+    if profile is None:
+        raise ValueError(f"Profile '{name}' does not exist")
+    return profile
+
+def emit(record, file=None):
+    """Print one record as a JSON line"""
+    import json
+    print(json.dumps(record, ensure_ascii=False, default=lambda value: value.isoformat()), file=file)
+
+def transaction_record(transaction):
+    return {
+        'id': transaction.id,
+        'type': transaction.get_type(),
+        'description': transaction.description,
+        'amount': transaction.amount,
+        'date': transaction.date,
+        'category': transaction.category,
+        'tags': list(transaction.tags)
+    }
+
+def profile_record(profile):
+    return {
+        'profile': profile.name,
+        'created_date': profile.created_date,
+        'transactions': profile.get_transaction_count(),
+        'income': profile.get_total_income(),
+        'expenses': profile.get_total_expenses(),
+        'balance': profile.get_balance()
+    }
+
+def rule_record(number, rule):
+    return {
+        'rule': number,
+        'type': rule.transaction_type,
+        'description': rule.description,
+        'amount': rule.amount,
+        'schedule': rule.describe_schedule(),
+        'start': rule.start,
+        'end': rule.end,
+        'next_date': rule.next_date,
+        'category': rule.category,
+        'tags': list(rule.tags)
+    }
+
+def cmd_profiles(manager, args):
+    for name in manager.get_profile_names():
+        emit(profile_record(manager.get_profile(name)))
+
+def cmd_add_profile(manager, args):
+    from models.profile import Profile
+    manager.add_profile(Profile(args.name))
+    save(manager)
+    emit(profile_record(manager.get_profile(args.name)))
+
+def cmd_remove_profile(manager, args):
+    if not manager.remove_profile(args.name):
+        raise ValueError(f"Profile '{args.name}' does not exist")
+    save(manager)
+    emit({'removed': args.name})
+
+def cmd_add(manager, args):
+    from models.transaction import Income, Expense
+    if args.amount <= 0:
+        raise ValueError("Amount must be greater than 0")
+    transaction = (Income if args.type == 'income' else Expense)(args.description, args.amount,
+                                                                 args.category, args.tags)
+    if args.date is not None:
+        transaction.date = args.date
+    
+    with manager.lock:
+        profile = get_profile(manager, args.profile)
+        profile.add_transaction(transaction)
+    save(manager)
+    emit(dict(transaction_record(transaction), profile=profile.name, balance=profile.get_balance()))
+
+def cmd_edit(manager, args):
+    """Change fields of a transaction, found by the id 'list' shows"""
+    changes = {}
+    if args.type is not None:
+        changes['transaction_type'] = args.type
+    for field in ('amount', 'description', 'date', 'category', 'tags'):
+        if getattr(args, field) is not None:
+            changes[field] = getattr(args, field)
+    if not changes:
+        raise ValueError("Nothing to change; give at least one of --type, --amount, --description, "
+                         "--date, --category, --tags")
+    
+    with manager.lock:
+        profile = get_profile(manager, args.profile)
+        transaction = profile.update_transaction(args.id, **changes)
+    save(manager)
+    emit(dict(transaction_record(transaction), profile=profile.name, balance=profile.get_balance()))
+
+def cmd_delete(manager, args):
+    with manager.lock:
+        profile = get_profile(manager, args.profile)
+        transaction = profile.delete_transaction(args.id)
+    save(manager)
+    emit({'profile': profile.name, 'deleted': args.id, 'description': transaction.description,
+          'balance': profile.get_balance()})
+
+def cmd_list(manager, args):
+    profile = get_profile(manager, args.profile)
+    if args.category is not None:
+        transactions = [transaction for transaction in profile.search(category=args.category)
+                        if (args.start is None or transaction.date >= args.start)
+                        and (args.end is None or transaction.date < args.end)]
+        if args.last is not None:
+            transactions = transactions[-args.last:] if args.last > 0 else []
+    elif args.start is not None or args.end is not None:
+        transactions = profile.get_transactions_between(args.start, args.end)
+        if args.last is not None:
+            transactions = transactions[-args.last:] if args.last > 0 else []
+    elif args.last is not None:
+        transactions = profile.get_recent_transactions(args.last)
+    else:
+        transactions = profile.transactions
+    for transaction in transactions:
+        emit(transaction_record(transaction))
+
+def cmd_search(manager, args):
+    """List the transactions whose description, category or tags contain every word of the query"""
+    profile = get_profile(manager, args.profile)
+    for transaction in profile.search(args.query, args.category):
+        emit(transaction_record(transaction))
+
+def cmd_categories(manager, args):
+    names = None if args.profile is None else [get_profile(manager, args.profile).name]
+    for category_totals in manager.get_category_totals(names):
+        emit(category_totals)
+
+def cmd_recurring(manager, args):
+    profile = get_profile(manager, args.profile)
+    for number, rule in enumerate(profile.get_recurring_rules(), 1):
+        emit(rule_record(number, rule))
+
+def cmd_add_recurring(manager, args):
+    from models.recurring import RecurringRule
+    rule = RecurringRule(args.description, args.amount, args.type, args.every, args.interval,
+                         args.start, args.end, args.category, args.tags)
+    with manager.lock:
+        profile = get_profile(manager, args.profile)
+        profile.add_recurring_rule(rule)
+    save(manager)
+    emit(dict(rule_record(len(profile.get_recurring_rules()), rule), profile=profile.name))
+
+def cmd_remove_recurring(manager, args):
+    with manager.lock:
+        profile = get_profile(manager, args.profile)
+        rules = profile.get_recurring_rules()
+        if not 1 <= args.rule <= len(rules):
+            raise ValueError(f"Profile '{profile.name}' has no recurring rule {args.rule}")
+        profile.remove_recurring_rule(rules[args.rule - 1])
+    save(manager)
+    emit({'profile': profile.name, 'removed_rule': args.rule})
+
+def cmd_post_recurring(manager, args):
+    """Add the occurrences of recurring rules that are due, e.g. from a daily cron job"""
+    posted = manager.post_recurring(args.until)
+    save(manager)
+    for name, count in sorted(posted.items()):
+        emit({'profile': name, 'posted': count})
+
+def cmd_forecast(manager, args):
+    from datetime import date
+    from models.recurring import add_months
+    profile = get_profile(manager, args.profile)
+    for point in profile.get_forecast(add_months(date.today(), args.months), args.period):
+        emit(dict(point, profile=profile.name))
+
+def cmd_summary(manager, args):
+    if args.profile is None:
+        emit(manager.get_summary_statistics())
+        return
+    
+    profile = get_profile(manager, args.profile)
+    if args.period is None:
+        emit(profile_record(profile))
+        return
+    for bucket in profile.get_rollup(args.period, args.start, args.end):
+        emit(dict(bucket, profile=profile.name))
+
+def cmd_import(manager, args):
+    report = manager.import_statement(args.profile, args.path, file_format=args.format,
+                                      decimal_comma=args.decimal_comma)
+    save(manager)
+    emit({
+        'profile': args.profile,
+        'imported': report['imported'],
+        'duplicates': report['duplicates'],
+        'errors': len(report['errors'])
+    })
+    for line_number, message in report['errors']:
+        emit({'line': line_number, 'error': message})
+
+def cmd_export(manager, args):
+    """Write a profile's transactions as CSV (readable by 'import') or JSON lines"""
+    profile = get_profile(manager, args.profile)
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'jsonl':
+            import json
+            for transaction in profile.transactions:
+                output.write(json.dumps(transaction_record(transaction), ensure_ascii=False,
+                                        default=lambda value: value.isoformat()) + '\n')
+        else:
+            import csv
+            writer = csv.writer(output)
+            writer.writerow(['date', 'description', 'amount', 'type', 'category', 'tags'])
+            for transaction in profile.transactions:
+                writer.writerow([transaction.date.isoformat(), transaction.description,
+                                 transaction.amount, transaction.get_type().lower(),
+                                 transaction.category, ','.join(transaction.tags)])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.output:
+        emit({'profile': profile.name, 'exported': profile.get_transaction_count(), 'path': args.output})
+
+def cmd_compact(manager, args):
+    manager.compact()
+    emit({'compacted': manager.data_file})
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Personal Finance Tracker without the GUI; "
+                                                                "prints JSON lines")
+    parser.add_argument('--data-file', default=DEFAULT_DATA_FILE,
+                        help=f"data file to use (default: {DEFAULT_DATA_FILE})")
+    parser.add_argument('--layout', choices=['single', 'sharded'], default='single',
+                        help="one data file, or one set of files per profile in a directory named "
+                             "after the data file (default: single)")
+    parser.add_argument('--timings', action='store_true',
+                        help="print the time spent per operation to stderr as JSON lines")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+    
+    command = commands.add_parser('profiles', help="list profiles with their totals")
+    command.set_defaults(handler=cmd_profiles)
+    
+    command = commands.add_parser('add-profile', help="create a profile")
+    command.add_argument('name')
+    command.set_defaults(handler=cmd_add_profile)
+    
+    command = commands.add_parser('remove-profile', help="delete a profile and its transactions")
+    command.add_argument('name')
+    command.set_defaults(handler=cmd_remove_profile)
+    
+    command = commands.add_parser('add', help="add a transaction")
+    command.add_argument('profile')
+    command.add_argument('type', choices=['income', 'expense'])
+    command.add_argument('amount', type=float)
+    command.add_argument('description')
+    command.add_argument('--date', type=parse_date, help="transaction date (default: now)")
+    command.add_argument('--category', default='', help="category of the transaction")
+    command.add_argument('--tags', default='', help="comma-separated tags")
+    command.set_defaults(handler=cmd_add)
+    
+    command = commands.add_parser('edit', help="change a transaction")
+    command.add_argument('profile')
+    command.add_argument('id', type=int, help="id of the transaction as listed by 'list'")
+    command.add_argument('--type', choices=['income', 'expense'])
+    command.add_argument('--amount', type=float)
+    command.add_argument('--description')
+    command.add_argument('--date', type=parse_date)
+    command.add_argument('--category', help="new category (\"\" for uncategorized)")
+    command.add_argument('--tags', help="comma-separated tags, replacing the current ones")
+    command.set_defaults(handler=cmd_edit)
+    
+    command = commands.add_parser('delete', help="delete a transaction")
+    command.add_argument('profile')
+    command.add_argument('id', type=int, help="id of the transaction as listed by 'list'")
+    command.set_defaults(handler=cmd_delete)
+    
+    command = commands.add_parser('list', help="list transactions, oldest first")
+    command.add_argument('profile')
+    command.add_argument('--from', dest='start', type=parse_date, help="first date to include")
+    command.add_argument('--to', dest='end', type=parse_date, help="date to stop before")
+    command.add_argument('--last', type=int, help="only the most recent N transactions")
+    command.add_argument('--category', help="only transactions of this category (\"\" for uncategorized)")
+    command.set_defaults(handler=cmd_list)
+    
+    command = commands.add_parser('search', help="find transactions by words of their description, category or tags")
+    command.add_argument('profile')
+    command.add_argument('query', help="words to look for; each matches as a prefix")
+    command.add_argument('--category', help="only search this category")
+    command.set_defaults(handler=cmd_search)
+    
+    command = commands.add_parser('categories', help="income, expenses and count per category")
+    command.add_argument('profile', nargs='?', help="one profile (default: all profiles together)")
+    command.set_defaults(handler=cmd_categories)
+    
+    command = commands.add_parser('recurring', help="list a profile's recurring transactions")
+    command.add_argument('profile')
+    command.set_defaults(handler=cmd_recurring)
+    
+    command = commands.add_parser('add-recurring', help="add a transaction that repeats on a schedule")
+    command.add_argument('profile')
+    command.add_argument('type', choices=['income', 'expense'])
+    command.add_argument('amount', type=float)
+    command.add_argument('description')
+    command.add_argument('--every', choices=['daily', 'weekly', 'monthly', 'yearly'], default='monthly')
+    command.add_argument('--interval', type=int, default=1, help="repeat every N days/weeks/months/years")
+    command.add_argument('--start', type=parse_date, help="first occurrence (default: now)")
+    command.add_argument('--end', type=parse_date, help="date to stop before")
+    command.add_argument('--category', default='', help="category of the transactions")
+    command.add_argument('--tags', default='', help="comma-separated tags")
+    command.set_defaults(handler=cmd_add_recurring)
+    
+    command = commands.add_parser('remove-recurring', help="stop a recurring transaction")
+    command.add_argument('profile')
+    command.add_argument('rule', type=int, help="number of the rule as listed by 'recurring'")
+    command.set_defaults(handler=cmd_remove_recurring)
+    
+    command = commands.add_parser('post-recurring', help="add the recurring transactions that are due")
+    command.add_argument('--until', type=parse_date, help="add occurrences dated before this (default: now)")
+    command.set_defaults(handler=cmd_post_recurring)
+    
+    command = commands.add_parser('forecast', help="projected balance per period from recurring and future transactions")
+    command.add_argument('profile')
+    command.add_argument('--months', type=int, default=12, help="how far ahead (default: 12)")
+    command.add_argument('--period', choices=['day', 'week', 'month'], default='month')
+    command.set_defaults(handler=cmd_forecast)
+    
+    command = commands.add_parser('summary', help="totals of all profiles, one profile or per period")
+    command.add_argument('profile', nargs='?')
+    command.add_argument('--period', choices=['day', 'week', 'month'], help="roll up the profile per period")
+    command.add_argument('--from', dest='start', type=parse_date, help="first date to include")
+    command.add_argument('--to', dest='end', type=parse_date, help="date to stop before")
+    command.set_defaults(handler=cmd_summary)
+    
+    command = commands.add_parser('import', help="import a CSV or OFX/QFX bank statement")
+    command.add_argument('profile')
+    command.add_argument('path')
+    command.add_argument('--format', choices=['csv', 'ofx', 'qfx'], help="file format (default: from the extension)")
+    command.add_argument('--decimal-comma', action='store_true', default=None,
+                         help="amounts use '.' for thousands and ',' for decimals, like 50.000,00")
+    command.set_defaults(handler=cmd_import)
+    
+    command = commands.add_parser('export', help="export a profile's transactions")
+    command.add_argument('profile')
+    command.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    command.add_argument('--output', help="file to write (default: stdout)")
+    command.set_defaults(handler=cmd_export)
+    
+    command = commands.add_parser('compact', help="fold the journal into the data file")
+    command.set_defaults(handler=cmd_compact)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.timings:
+        # Instrumentation is switched on when the models package is imported
+        os.environ['PFT_INSTRUMENT'] = '1'
+    try:
+        manager = open_manager(args)
+        try:
+            args.handler(manager, args)
+        finally:
+            # Flushes what the command left unsaved and releases the journal and lock files
+            manager.close()
+    except (ValueError, OSError, RuntimeError) as e:
+        emit({'error': str(e)}, file=sys.stderr)
+        return 1
+    finally:
+        if args.timings:
+            from models.instrumentation import recorder
+            for row in recorder.summary():
+                emit({'span': row.pop('name'), **row}, file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
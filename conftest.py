@@ -0,0 +1,2 @@
+# Found by pytest at the project root, which puts this directory on sys.path so the
+# tests import the models package the same way with `pytest` and `python -m pytest`
@@ -1,13 +1,24 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import json
 import os
-from datetime import datetime
+import queue
+from datetime import date, datetime, time
 from models.transaction import Transaction, Income, Expense
 from models.profile import Profile
+from models.recurring import RecurringRule, FREQUENCIES, add_months
 from models.financial_manager import FinancialManager
+from models.persistence_worker import PersistenceWorker
+from models import instrumentation
+from models.instrumentation import instrumented
+from models.ledger import INCOME_FLAG
+from models.formatting import format_timestamp, format_rupiah
 
 class PersonalFinanceApp:
+    # Category filter choices that are not category names
+    ALL_CATEGORIES = "All categories"
+    UNCATEGORIZED = "Uncategorized"
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Personal Finance Tracker")
@@ -22,12 +33,21 @@ class PersonalFinanceApp:
         self.root.minsize(750, 550)  # Set minimum size
         
         # Initialize financial manager
-        self.financial_manager = FinancialManager()
+        self.financial_manager = FinancialManager(use_journal=True, lazy=True)
         self.current_profile = None
         
+        # Save on a background thread so disk I/O never blocks the event loop
+        self.persistence_worker = self.financial_manager.start_worker()
+        self.root.after(200, self.poll_worker_results)
+        
+        # Pick up changes other running instances saved to the same data file
+        self.merge_count = self.financial_manager.merge_count
+        self.root.after(2000, self.poll_external_changes)
+        
         # Create main frames
         self.create_widgets()
         self.load_profiles()
+        self.post_due_recurring()
         
         # Handle window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -53,6 +73,15 @@ class PersonalFinanceApp:
         # Buttons for profile management
         tk.Button(profile_frame, text="New Profile", command=self.create_new_profile,
                  bg='#4CAF50', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(profile_frame, text="Import Statement", command=self.import_statement,
+                 bg='#607D8B', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(profile_frame, text="Recurring", command=self.show_recurring_rules,
+                 bg='#009688', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(profile_frame, text="Forecast", command=self.show_forecast,
+                 bg='#3F51B5', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        if instrumentation.ENABLED:
+            tk.Button(profile_frame, text="Performance", command=self.show_performance,
+                     bg='#795548', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
         
         # Balance display
         self.balance_frame = tk.Frame(self.root, bg='#e8f5e8', relief='raised', bd=2)
@@ -95,6 +124,15 @@ class PersonalFinanceApp:
         self.amount_entry = tk.Entry(amount_frame, font=("Arial", 10), width=20)
         self.amount_entry.pack(side='left', padx=10)
         
+        # Category (pick an existing one or type a new one) and comma-separated tags
+        tk.Label(amount_frame, text="Category:", font=("Arial", 10), bg='#f0f0f0').pack(side='left')
+        self.category_var = tk.StringVar()
+        self.category_combo = ttk.Combobox(amount_frame, textvariable=self.category_var, width=14)
+        self.category_combo.pack(side='left', padx=10)
+        tk.Label(amount_frame, text="Tags:", font=("Arial", 10), bg='#f0f0f0').pack(side='left')
+        self.tags_entry = tk.Entry(amount_frame, font=("Arial", 10), width=16)
+        self.tags_entry.pack(side='left', padx=10)
+        
         # Add transaction button
         tk.Button(input_frame, text="Add Transaction", command=self.add_transaction,
                  bg='#2196F3', fg='white', font=("Arial", 10, "bold")).pack(pady=10)
@@ -104,20 +142,55 @@ class PersonalFinanceApp:
                                      font=("Arial", 12, "bold"), bg='#f0f0f0')
         history_frame.pack(pady=10, padx=20, fill='both', expand=True)
         
+        # Search as you type: the history only shows rows matching every word,
+        # optionally within one category
+        search_frame = tk.Frame(history_frame, bg='#f0f0f0')
+        search_frame.pack(side='top', fill='x', pady=(2, 4))
+        tk.Label(search_frame, text="Search:", font=("Arial", 10), bg='#f0f0f0').pack(side='left')
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(search_frame, textvariable=self.search_var, font=("Arial", 10), width=25)
+        self.search_entry.pack(side='left', padx=10)
+        self.search_var.trace_add('write', self.on_search_changed)
+        self.search_job = None
+        
+        self.category_filter_var = tk.StringVar(value=self.ALL_CATEGORIES)
+        self.category_filter_combo = ttk.Combobox(search_frame, textvariable=self.category_filter_var,
+                                                  state="readonly", width=18)
+        self.category_filter_combo.pack(side='left', padx=5)
+        self.category_filter_combo.bind('<<ComboboxSelected>>', lambda event: self.apply_history_filter())
+        tk.Button(search_frame, text="Categories", command=self.show_category_breakdown,
+                 bg='#FF9800', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        self.match_label = tk.Label(search_frame, text="", font=("Arial", 9), bg='#f0f0f0')
+        self.match_label.pack(side='left', padx=10)
+        # Ledger rows shown in the history, or None to show every row
+        self.history_rows = None
+        
         # Treeview for displaying transactions
-        columns = ('Date', 'Type', 'Description', 'Amount', 'Balance')
+        columns = ('Date', 'Type', 'Description', 'Category', 'Amount', 'Balance')
         self.transaction_tree = ttk.Treeview(history_frame, columns=columns, show='headings', height=10)
         
         for col in columns:
             self.transaction_tree.heading(col, text=col)
-            self.transaction_tree.column(col, width=120, anchor='center')
-        
-        # Scrollbar for treeview
-        scrollbar = ttk.Scrollbar(history_frame, orient='vertical', command=self.transaction_tree.yview)
-        self.transaction_tree.configure(yscrollcommand=scrollbar.set)
+            self.transaction_tree.column(col, width=110, anchor='center')
+        
+        # Scrollbar for treeview; only the visible window of rows exists as Tk items,
+        # so the scrollbar is driven by the row position instead of the treeview itself
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient='vertical', command=self.on_history_scroll)
+        self.history_first_row = 0
+        self.history_visible_rows = 10
+        self.history_items = []
+        self.history_item_rows = []
+        
+        self.transaction_tree.bind('<Configure>', self.on_history_resize)
+        self.transaction_tree.bind('<MouseWheel>', self.on_history_wheel)
+        self.transaction_tree.bind('<Button-4>', self.on_history_wheel)
+        self.transaction_tree.bind('<Button-5>', self.on_history_wheel)
+        # Double-click a transaction to edit or delete it; Delete removes the selected one
+        self.transaction_tree.bind('<Double-1>', self.edit_selected_transaction)
+        self.transaction_tree.bind('<Delete>', self.delete_selected_transaction)
         
         self.transaction_tree.pack(side='left', fill='both', expand=True)
-        scrollbar.pack(side='right', fill='y')
+        self.history_scrollbar.pack(side='right', fill='y')
         
         # Initially disable transaction inputs
         self.toggle_transaction_inputs(False)
@@ -175,7 +248,7 @@ class PersonalFinanceApp:
         def save_profile():
             name = name_entry.get().strip()
             if name:
-                if name not in [profile.name for profile in self.financial_manager.profiles]:
+                if not self.financial_manager.has_profile(name):
                     profile = Profile(name)
                     self.financial_manager.add_profile(profile)
                     self.load_profiles()
@@ -196,11 +269,48 @@ class PersonalFinanceApp:
         # Bind Enter key to save
         dialog.bind('<Return>', lambda e: save_profile())
         
+    def show_performance(self):
+        """Show the slowest recent operations with counts and cumulative time"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Performance")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        self.center_window(dialog, 700, 420)
+        
+        report_text = tk.Text(dialog, font=("Courier", 9), wrap='none')
+        button_frame = tk.Frame(dialog, bg='#f0f0f0')
+        button_frame.pack(side='bottom', pady=8)
+        report_text.pack(fill='both', expand=True, padx=10, pady=(10, 0))
+        
+        def refresh():
+            report_text.config(state='normal')
+            report_text.delete('1.0', 'end')
+            report_text.insert('1.0', instrumentation.recorder.report())
+            report_text.config(state='disabled')
+        
+        def reset():
+            instrumentation.recorder.reset()
+            refresh()
+        
+        def save_log():
+            path = filedialog.asksaveasfilename(parent=dialog, title="Save Performance Log",
+                                                defaultextension='.json', filetypes=[("JSON", "*.json")])
+            if path:
+                instrumentation.recorder.dump(path)
+        
+        tk.Button(button_frame, text="Refresh", command=refresh,
+                 bg='#2196F3', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Reset", command=reset,
+                 bg='#f44336', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Save Log", command=save_log,
+                 bg='#607D8B', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        refresh()
+    
     def load_profiles(self):
         """Load existing profiles into combobox"""
-        profile_names = [profile.name for profile in self.financial_manager.profiles]
-        self.profile_combo['values'] = profile_names
+        self.profile_combo['values'] = self.financial_manager.get_profile_names()
         
+    @instrumented('gui.select_profile')
     def on_profile_selected(self, event=None):
         """Handle profile selection"""
         selected_name = self.profile_var.get()
@@ -208,6 +318,7 @@ class PersonalFinanceApp:
             self.current_profile = self.financial_manager.get_profile(selected_name)
             if self.current_profile:
                 self.toggle_transaction_inputs(True)
+                self.clear_history_filter()
                 self.update_display()
             
     def toggle_transaction_inputs(self, enabled):
@@ -215,7 +326,10 @@ class PersonalFinanceApp:
         state = 'normal' if enabled else 'disabled'
         self.description_entry.config(state=state)
         self.amount_entry.config(state=state)
+        self.category_combo.config(state=state)
+        self.tags_entry.config(state=state)
         
+    @instrumented('gui.add_transaction')
     def add_transaction(self):
         """Add a new transaction"""
         if not self.current_profile:
@@ -240,34 +354,178 @@ class PersonalFinanceApp:
             
         # Create transaction based on type
         transaction_type = self.transaction_type.get()
+        category = self.category_var.get().strip()
+        tags = self.tags_entry.get()
         if transaction_type == "Income":
-            transaction = Income(description, amount)
+            transaction = Income(description, amount, category, tags)
         else:
-            transaction = Expense(description, amount)
+            transaction = Expense(description, amount, category, tags)
             
         # Add transaction to current profile
-        self.current_profile.add_transaction(transaction)
+        with self.financial_manager.lock:
+            self.current_profile.add_transaction(transaction)
         
-        # Save data
-        self.financial_manager.save_data()
+        # Save data in the background
+        self.financial_manager.request_save()
         
         # Clear inputs
         self.description_entry.delete(0, tk.END)
         self.amount_entry.delete(0, tk.END)
+        self.tags_entry.delete(0, tk.END)
         
         # Update display
-        self.update_display()
+        self.update_display(appended=True)
         
         self.show_message("Success", f"{transaction_type} added successfully!")
         
-    def update_display(self):
-        """Update balance and transaction history display"""
+    def import_statement(self):
+        """Import transactions from a CSV or OFX bank statement into the current profile"""
+        if not self.current_profile:
+            self.show_message("Error", "Please select a profile first!", "error")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="Import Statement",
+            filetypes=[("Bank statements", "*.csv *.ofx *.qfx"), ("CSV files", "*.csv"),
+                       ("OFX files", "*.ofx *.qfx"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        self.root.config(cursor='watch')
+        self.root.update_idletasks()
+        try:
+            report = self.financial_manager.import_statement(self.current_profile.name, path)
+        except (OSError, ValueError) as e:
+            self.show_message("Error", f"Could not import statement: {e}", "error")
+            return
+        finally:
+            self.root.config(cursor='')
+        
+        # One refresh for the whole import
+        self.update_display()
+        
+        message = f"Imported {report['imported']:,} transactions"
+        if report['duplicates']:
+            message += f"\nSkipped {report['duplicates']:,} duplicates"
+        if report['errors']:
+            message += f"\nRejected {len(report['errors']):,} rows:"
+            for line_number, error in report['errors'][:5]:
+                message += f"\n  line {line_number}: {error}"
+        self.show_message("Import Complete", message, "warning" if report['errors'] else "info")
+    
+    def selected_transaction_id(self, event=None):
+        """Get the id of the transaction under the mouse, or else the selected one, or None"""
+        item = self.transaction_tree.identify_row(event.y) if event is not None else ''
+        item = item or self.transaction_tree.focus()
+        if not self.current_profile or item not in self.history_items:
+            return None
+        row = self.history_item_rows[self.history_items.index(item)]
+        return None if row is None else self.current_profile.transactions.ids[row]
+    
+    def edit_selected_transaction(self, event=None):
+        """Change or delete a transaction of the history in a dialog"""
+        transaction_id = self.selected_transaction_id(event)
+        if transaction_id is None:
+            return
+        profile = self.current_profile
+        transaction = profile.get_transaction(transaction_id)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Edit Transaction")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        dialog.grab_set()
+        self.center_window(dialog, 360, 300)
+        dialog.resizable(False, False)
+        
+        form = tk.Frame(dialog, bg='#f0f0f0')
+        form.pack(pady=10, padx=15, fill='x')
+        type_var = tk.StringVar(value=transaction.get_type())
+        date_text = transaction.date.strftime('%Y-%m-%d')
+        fields = {}
+        for row, (label, value) in enumerate((("Description:", transaction.description),
+                                               ("Amount:", f"{transaction.amount:g}"),
+                                               ("Category:", transaction.category),
+                                               ("Tags:", ', '.join(transaction.tags)),
+                                               ("Date:", date_text))):
+            tk.Label(form, text=label, font=("Arial", 10), bg='#f0f0f0').grid(row=row + 1, column=0, sticky='w', pady=3)
+            entry = tk.Entry(form, font=("Arial", 10), width=25)
+            entry.insert(0, value)
+            entry.grid(row=row + 1, column=1, pady=3)
+            fields[label] = entry
+        tk.Label(form, text="Type:", font=("Arial", 10), bg='#f0f0f0').grid(row=0, column=0, sticky='w', pady=3)
+        ttk.Combobox(form, textvariable=type_var, values=("Income", "Expense"), state="readonly",
+                     width=10).grid(row=0, column=1, sticky='w', pady=3)
+        
+        def save_changes():
+            try:
+                amount = float(fields["Amount:"].get())
+                changes = {
+                    'transaction_type': type_var.get(),
+                    'description': fields["Description:"].get().strip(),
+                    'amount': amount,
+                    'category': fields["Category:"].get().strip(),
+                    'tags': fields["Tags:"].get()
+                }
+                # Only a changed date replaces the time of day the transaction was recorded at
+                if fields["Date:"].get().strip() != date_text:
+                    changes['date'] = datetime.combine(date.fromisoformat(fields["Date:"].get().strip()), time())
+                if not changes['description']:
+                    raise ValueError("Please enter a description!")
+                with self.financial_manager.lock:
+                    profile.update_transaction(transaction_id, **changes)
+            except ValueError as e:
+                self.show_message("Error", f"Invalid transaction: {e}", "error")
+                return
+            self.financial_manager.request_save()
+            dialog.destroy()
+            self.update_display(edited=True)
+        
+        def delete():
+            dialog.destroy()
+            self.delete_transaction(transaction_id)
+        
+        button_frame = tk.Frame(dialog, bg='#f0f0f0')
+        button_frame.pack(pady=10)
+        tk.Button(button_frame, text="Save", command=save_changes,
+                 bg='#4CAF50', fg='white', font=("Arial", 10, "bold")).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Delete", command=delete,
+                 bg='#f44336', fg='white', font=("Arial", 10)).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Cancel", command=dialog.destroy,
+                 bg='#607D8B', fg='white', font=("Arial", 10)).pack(side='left', padx=5)
+        dialog.bind('<Return>', lambda e: save_changes())
+    
+    def delete_selected_transaction(self, event=None):
+        """Delete the selected transaction of the history after asking"""
+        transaction_id = self.selected_transaction_id()
+        if transaction_id is not None:
+            self.delete_transaction(transaction_id)
+    
+    def delete_transaction(self, transaction_id):
+        profile = self.current_profile
+        transaction = profile.get_transaction(transaction_id)
+        if transaction is None or not messagebox.askyesno(
+                "Delete Transaction", f"Delete '{transaction.description}' ({format_rupiah(transaction.amount)})?"):
+            return
+        with self.financial_manager.lock:
+            profile.delete_transaction(transaction_id)
+        self.financial_manager.request_save()
+        self.update_display(edited=True)
+    
+    @instrumented('gui.update_display')
+    def update_display(self, appended=False, edited=False):
+        """Update balance and transaction history display
+        
+        After a profile switch the history is redrawn from the top; when a
+        transaction was just appended only the rows that changed are touched,
+        and after an edit or deletion every visible row is redrawn in place.
+        """
         if not self.current_profile:
             return
             
         # Update balance
         balance = self.current_profile.get_balance()
-        self.balance_label.config(text=f"Current Balance: Rp {balance:,.2f}")
+        self.balance_label.config(text=f"Current Balance: {format_rupiah(balance)}")
         
         # Update balance color based on value
         if balance >= 0:
@@ -277,44 +535,417 @@ class PersonalFinanceApp:
             self.balance_frame.config(bg='#ffebee')
             self.balance_label.config(bg='#ffebee', fg='#c62828')
         
-        # Clear existing items
-        for item in self.transaction_tree.get_children():
-            self.transaction_tree.delete(item)
+        self.update_category_choices()
+        self.history_rows = self.filter_history_rows()
+        
+        if appended:
+            # Follow the new row if the end of the history was in view
+            total = self.history_row_count()
+            if self.history_first_row + self.history_visible_rows >= total - 1:
+                self.history_first_row = max(0, total - self.history_visible_rows)
+        else:
+            if not edited:
+                self.history_first_row = 0
+            self.history_item_rows = [None] * len(self.history_items)
+        
+        self.render_history()
+    
+    def update_category_choices(self):
+        """Offer the profile's categories in the input and filter comboboxes"""
+        categories = self.current_profile.get_categories()
+        self.category_combo['values'] = categories
+        self.category_filter_combo['values'] = [self.ALL_CATEGORIES, self.UNCATEGORIZED] + categories
+    
+    def selected_category_filter(self):
+        """Get the category the history is limited to, '' for uncategorized or None for all"""
+        selected = self.category_filter_var.get()
+        if selected == self.ALL_CATEGORIES:
+            return None
+        if selected == self.UNCATEGORIZED:
+            return ''
+        return selected
+    
+    def filter_history_rows(self):
+        """Get the ledger rows matching the search box and category filter, or None without a filter"""
+        query = self.search_var.get()
+        category = self.selected_category_filter()
+        if not query.strip() and category is None:
+            self.match_label.config(text="")
+            return None
+        rows = self.current_profile.search_rows(query, category)
+        self.match_label.config(text=f"{len(rows):,} matching")
+        return rows
+    
+    def history_row_count(self):
+        """Get the number of rows the history shows"""
+        if self.history_rows is not None:
+            return len(self.history_rows)
+        return self.current_profile.get_transaction_count() if self.current_profile else 0
+    
+    def clear_history_filter(self):
+        """Show every transaction again, without triggering a search"""
+        self.search_var.set('')
+        # Setting the variable scheduled a search, which is not needed
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        self.category_filter_var.set(self.ALL_CATEGORIES)
+        self.history_rows = None
+    
+    def on_search_changed(self, *args):
+        """Search shortly after typing pauses, so fast typing runs one search instead of one per key"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(120, self.apply_history_filter)
+    
+    @instrumented('gui.search')
+    def apply_history_filter(self):
+        """Show the rows matching the current search and category filter from the top"""
+        self.search_job = None
+        if not self.current_profile:
+            return
+        self.history_rows = self.filter_history_rows()
+        self.history_first_row = 0
+        self.render_history()
+    
+    def show_category_breakdown(self):
+        """Show income, expenses and count per category of the current profile"""
+        if not self.current_profile:
+            self.show_message("Error", "Please select a profile first!", "error")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Categories - {self.current_profile.name}")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        self.center_window(dialog, 600, 360)
+        
+        columns = ('Category', 'Income', 'Expenses', 'Net', 'Count')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=110, anchor='center')
+        scrollbar = ttk.Scrollbar(dialog, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tk.Label(dialog, text="Double-click a category to show its transactions",
+                 font=("Arial", 9), bg='#f0f0f0').pack(side='bottom', pady=5)
+        tree.pack(side='left', fill='both', expand=True, padx=(10, 0), pady=10)
+        scrollbar.pack(side='right', fill='y', pady=10)
+        
+        # The totals are kept per category as transactions are added, nothing is recomputed here
+        for totals in self.current_profile.get_category_totals():
+            tree.insert('', 'end', values=(
+                totals['category'] or self.UNCATEGORIZED,
+                format_rupiah(totals['income']),
+                format_rupiah(totals['expenses']),
+                format_rupiah(totals['net']),
+                f"{totals['count']:,}"
+            ))
+        
+        def show_category(event):
+            item = tree.focus()
+            if item:
+                self.category_filter_var.set(tree.item(item, 'values')[0])
+                self.apply_history_filter()
+        
+        tree.bind('<Double-1>', show_category)
+    
+    def post_due_recurring(self):
+        """Add the recurring transactions that became due and show them if they belong to the current profile"""
+        posted = self.financial_manager.post_recurring()
+        if self.current_profile and self.current_profile.name in posted:
+            self.update_display(appended=True)
+    
+    def show_recurring_rules(self):
+        """List, add and remove the recurring transactions of the current profile"""
+        if not self.current_profile:
+            self.show_message("Error", "Please select a profile first!", "error")
+            return
+        profile = self.current_profile
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Recurring - {profile.name}")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        self.center_window(dialog, 820, 380)
+        
+        columns = ('Type', 'Description', 'Category', 'Amount', 'Schedule', 'Next')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings', height=8)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=110, anchor='center')
+        
+        form = tk.Frame(dialog, bg='#f0f0f0')
+        type_var = tk.StringVar(value="Expense")
+        ttk.Combobox(form, textvariable=type_var, values=("Income", "Expense"), state="readonly",
+                     width=8).pack(side='left', padx=3)
+        description_entry = tk.Entry(form, font=("Arial", 10), width=16)
+        description_entry.pack(side='left', padx=3)
+        amount_entry = tk.Entry(form, font=("Arial", 10), width=10)
+        amount_entry.pack(side='left', padx=3)
+        tk.Label(form, text="every", font=("Arial", 9), bg='#f0f0f0').pack(side='left')
+        interval_var = tk.StringVar(value="1")
+        tk.Spinbox(form, from_=1, to=365, textvariable=interval_var, width=4).pack(side='left', padx=3)
+        frequency_var = tk.StringVar(value="monthly")
+        ttk.Combobox(form, textvariable=frequency_var, values=FREQUENCIES, state="readonly",
+                     width=8).pack(side='left', padx=3)
+        category_var = tk.StringVar()
+        ttk.Combobox(form, textvariable=category_var, values=profile.get_categories(),
+                     width=10).pack(side='left', padx=3)
+        tk.Label(form, text="from", font=("Arial", 9), bg='#f0f0f0').pack(side='left')
+        start_entry = tk.Entry(form, font=("Arial", 10), width=11)
+        start_entry.insert(0, date.today().isoformat())
+        start_entry.pack(side='left', padx=3)
+        
+        button_frame = tk.Frame(dialog, bg='#f0f0f0')
+        button_frame.pack(side='bottom', pady=8)
+        form.pack(side='bottom', fill='x', padx=10)
+        tk.Label(dialog, text="Type, description, amount, category, schedule and first date of a new rule:",
+                 font=("Arial", 9), bg='#f0f0f0').pack(side='bottom', anchor='w', padx=10)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for rule in profile.get_recurring_rules():
+                tree.insert('', 'end', values=(
+                    rule.transaction_type,
+                    rule.description,
+                    rule.category,
+                    format_rupiah(rule.amount),
+                    rule.describe_schedule(),
+                    rule.next_date.strftime('%Y-%m-%d') if rule.next_date is not None else "ended"
+                ))
+        
+        def add_rule():
+            try:
+                amount = float(amount_entry.get())
+                start = datetime.combine(date.fromisoformat(start_entry.get().strip()), time())
+                rule = RecurringRule(description_entry.get().strip(), amount, type_var.get(),
+                                     frequency_var.get(), int(interval_var.get()), start,
+                                     category=category_var.get())
+            except ValueError as e:
+                self.show_message("Error", f"Invalid rule: {e}", "error")
+                return
+            if not rule.description:
+                self.show_message("Error", "Please enter a description!", "error")
+                return
+            with self.financial_manager.lock:
+                profile.add_recurring_rule(rule)
+            self.financial_manager.request_save()
+            # A rule starting in the past adds its occurrences so far right away
+            self.post_due_recurring()
+            description_entry.delete(0, tk.END)
+            amount_entry.delete(0, tk.END)
+            refresh()
+        
+        def remove_rule():
+            item = tree.focus()
+            if not item:
+                return
+            rule = profile.get_recurring_rules()[tree.index(item)]
+            with self.financial_manager.lock:
+                profile.remove_recurring_rule(rule)
+            self.financial_manager.request_save()
+            refresh()
+        
+        tk.Button(button_frame, text="Add Rule", command=add_rule,
+                 bg='#4CAF50', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Remove Selected", command=remove_rule,
+                 bg='#f44336', fg='white', font=("Arial", 9)).pack(side='left', padx=5)
+        refresh()
+    
+    def show_forecast(self):
+        """Draw the projected balance of the current profile from its recurring and future transactions"""
+        if not self.current_profile:
+            self.show_message("Error", "Please select a profile first!", "error")
+            return
+        profile = self.current_profile
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Forecast - {profile.name}")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        self.center_window(dialog, 720, 420)
+        
+        controls = tk.Frame(dialog, bg='#f0f0f0')
+        controls.pack(side='top', fill='x', padx=10, pady=5)
+        horizons = {"6 months": 6, "1 year": 12, "2 years": 24, "5 years": 60}
+        horizon_var = tk.StringVar(value="1 year")
+        period_var = tk.StringVar(value="month")
+        tk.Label(controls, text="Horizon:", font=("Arial", 10), bg='#f0f0f0').pack(side='left')
+        horizon_combo = ttk.Combobox(controls, textvariable=horizon_var, values=list(horizons),
+                                     state="readonly", width=9)
+        horizon_combo.pack(side='left', padx=5)
+        tk.Label(controls, text="Per:", font=("Arial", 10), bg='#f0f0f0').pack(side='left')
+        period_combo = ttk.Combobox(controls, textvariable=period_var, values=("day", "week", "month"),
+                                    state="readonly", width=7)
+        period_combo.pack(side='left', padx=5)
+        summary_label = tk.Label(controls, text="", font=("Arial", 9), bg='#f0f0f0')
+        summary_label.pack(side='left', padx=10)
+        
+        canvas = tk.Canvas(dialog, bg='white', highlightthickness=0)
+        canvas.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        
+        @instrumented('gui.forecast')
+        def draw(event=None):
+            # The forecast is cached per horizon and kept up to date, so redrawing only reads it
+            end = add_months(date.today(), horizons[horizon_var.get()])
+            points = profile.get_forecast(end, period_var.get())
+            canvas.delete('all')
+            width = canvas.winfo_width()
+            height = canvas.winfo_height()
+            if not points or width < 50 or height < 50:
+                return
             
-        # Add transactions to treeview
-        running_balance = 0
-        for transaction in self.current_profile.transactions:
-            running_balance += transaction.get_amount()
+            balances = [point['balance'] for point in points]
+            low = min(min(balances), 0)
+            high = max(max(balances), 0)
+            span = (high - low) or 1
+            margin = 30
             
-            # Format date
-            date_str = transaction.date.strftime("%Y-%m-%d %H:%M")
+            def y(balance):
+                return margin + (high - balance) * (height - 2 * margin) / span
             
-            # Format amount with color coding
-            amount_str = f"Rp {abs(transaction.amount):,.2f}"
+            step = (width - 2 * margin) / max(1, len(points) - 1)
+            canvas.create_line(margin, y(0), width - margin, y(0), fill='#9e9e9e', dash=(4, 2))
+            coordinates = []
+            for position, balance in enumerate(balances):
+                coordinates.extend((margin + position * step, y(balance)))
+            if len(coordinates) == 2:
+                coordinates.extend(coordinates)
+            canvas.create_line(*coordinates, fill='#3F51B5', width=2)
+            canvas.create_text(margin, margin / 2, anchor='w', text=format_rupiah(high), font=("Arial", 8))
+            canvas.create_text(margin, height - margin / 2, anchor='w', text=format_rupiah(low), font=("Arial", 8))
+            canvas.create_text(width - margin, height - margin / 2, anchor='e',
+                               text=points[-1]['period'].isoformat(), font=("Arial", 8))
             
-            # Insert into treeview
-            item = self.transaction_tree.insert('', 'end', values=(
-                date_str,
-                transaction.get_type(),
-                transaction.description,
-                amount_str,
-                f"Rp {running_balance:,.2f}"
+            lowest = min(points, key=lambda point: point['balance'])
+            summary_label.config(text=f"End: {format_rupiah(balances[-1])}   Lowest: "
+                                      f"{format_rupiah(lowest['balance'])} ({lowest['period'].isoformat()})")
+        
+        horizon_combo.bind('<<ComboboxSelected>>', draw)
+        period_combo.bind('<<ComboboxSelected>>', draw)
+        canvas.bind('<Configure>', draw)
+    
+    @instrumented('gui.render_history')
+    def render_history(self):
+        """Show the transactions of the visible window in the reused treeview items"""
+        profile = self.current_profile
+        total = self.history_row_count()
+        rows = self.history_rows
+        first = max(0, min(self.history_first_row, total - self.history_visible_rows))
+        self.history_first_row = first
+        
+        # One extra row so a partially visible last line is still filled
+        wanted = max(0, min(self.history_visible_rows + 1, total - first))
+        while len(self.history_items) < wanted:
+            self.history_items.append(self.transaction_tree.insert('', 'end'))
+            self.history_item_rows.append(None)
+        while len(self.history_items) > wanted:
+            self.transaction_tree.delete(self.history_items.pop())
+            self.history_item_rows.pop()
+        
+        # Rows are read straight from the ledger columns, without building transaction objects
+        ledger = profile.transactions if wanted else None
+        for position, item in enumerate(self.history_items):
+            row = first + position if rows is None else rows[first + position]
+            if self.history_item_rows[position] == row:
+                continue
+            self.transaction_tree.item(item, values=(
+                format_timestamp(ledger.timestamps[row]),
+                '+ Income' if ledger.type_flags[row] == INCOME_FLAG else '- Expense',
+                ledger.descriptions[ledger.description_ids[row]],
+                ledger.categories[ledger.category_ids[row]],
+                format_rupiah(ledger.amounts[row]),
+                format_rupiah(profile.get_running_balance(row))
             ))
-            
-            # Color coding for different transaction types
-            if isinstance(transaction, Income):
-                self.transaction_tree.set(item, 'Type', '+ Income')
-            else:
-                self.transaction_tree.set(item, 'Type', '- Expense')
+            self.history_item_rows[position] = row
+        
+        if total:
+            self.history_scrollbar.set(first / total, min(1.0, (first + self.history_visible_rows) / total))
+        else:
+            self.history_scrollbar.set(0.0, 1.0)
+    
+    def scroll_history_to(self, first_row):
+        """Move the history window so it starts at the given row"""
+        if first_row != self.history_first_row:
+            self.history_first_row = first_row
+            self.render_history()
+    
+    def on_history_scroll(self, action, amount, unit=None):
+        """Handle scrollbar drags and clicks"""
+        total = self.history_row_count()
+        if action == 'moveto':
+            self.scroll_history_to(max(0, int(float(amount) * total)))
+        elif action == 'scroll':
+            step = self.history_visible_rows if unit == 'pages' else 1
+            self.scroll_history_to(max(0, self.history_first_row + int(amount) * step))
+    
+    def on_history_wheel(self, event):
+        """Scroll the history window with the mouse wheel"""
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_history_to(max(0, self.history_first_row - 3))
+        else:
+            self.scroll_history_to(self.history_first_row + 3)
+        return 'break'
+    
+    def on_history_resize(self, event):
+        """Recompute how many rows fit in the treeview"""
+        row_height = ttk.Style().lookup('Treeview', 'rowheight') or 20
+        visible_rows = max(1, (event.height - row_height) // int(row_height))
+        if visible_rows != self.history_visible_rows:
+            self.history_visible_rows = visible_rows
+            if self.current_profile:
+                self.render_history()
+    
+    def poll_worker_results(self):
+        """Report the outcome of background saves and show changes merged in the background"""
+        self.report_save_results()
+        if self.financial_manager.merge_count != self.merge_count:
+            self.merge_count = self.financial_manager.merge_count
+            self.load_profiles()
+            if self.current_profile:
+                self.current_profile = self.financial_manager.get_profile(self.current_profile.name)
+                if self.current_profile:
+                    self.update_display()
+                else:
+                    self.profile_var.set('')
+                    self.toggle_transaction_inputs(False)
+        self.root.after(200, self.poll_worker_results)
+    
+    def poll_external_changes(self):
+        """Have changes saved by other instances merged in the background and add due recurring transactions"""
+        # Merged on the worker thread; poll_worker_results refreshes the display
+        self.persistence_worker.request_refresh()
+        self.post_due_recurring()
+        self.root.after(2000, self.poll_external_changes)
+    
+    def report_save_results(self):
+        """Show an error for the most recent failed background save, if any
+        
+        Failed refreshes are not shown, the next poll tries again.
+        """
+        error = None
+        while True:
+            try:
+                request, success, result = self.persistence_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if request == PersistenceWorker.SAVE:
+                error = None if success else result
+        
+        if error is not None:
+            self.show_message("Error", f"Could not save data: {error}", "error")
     
     def on_closing(self):
         """Handle application closing"""
         try:
-            # Save data before closing
+            # Wait for pending saves, then compact the journal before closing
             if self.financial_manager:
-                self.financial_manager.save_data()
+                self.financial_manager.close()
+                self.report_save_results()
         except Exception as e:
-            print(f"Error saving data on close: {e}")
+            self.show_message("Error", f"Could not save data on close: {e}", "error")
         finally:
             self.root.destroy()
 
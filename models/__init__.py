@@ -1,6 +1,15 @@
 # Models package initialization
 from .transaction import Transaction, Income, Expense
 from .profile import Profile
+from .recurring import RecurringRule
+from .profile_registry import ProfileRegistry
+from .storage import Storage, JSONStorage
+from .sqlite_storage import SQLiteStorage, migrate_json_to_sqlite
+from .sharded_storage import ShardedStorage, migrate_to_shards
+from .persistence_worker import PersistenceWorker
+from .backup import BackupStore
 from .financial_manager import FinancialManager
 
-__all__ = ['Transaction', 'Income', 'Expense', 'Profile', 'FinancialManager']
\ No newline at end of file
+__all__ = ['Transaction', 'Income', 'Expense', 'Profile', 'RecurringRule', 'ProfileRegistry', 'Storage',
+           'JSONStorage', 'SQLiteStorage', 'migrate_json_to_sqlite', 'ShardedStorage', 'migrate_to_shards',
+           'PersistenceWorker', 'BackupStore', 'FinancialManager']
\ No newline at end of file
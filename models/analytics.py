@@ -0,0 +1,145 @@
+import heapq
+from array import array
+from itertools import accumulate
+from .ledger import INCOME_FLAG
+from .time_index import PERIODS, PeriodRollup, next_period_start
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAS_NUMPY = np is not None
+
+class LedgerAnalytics:
+    """Reports over all transactions of one profile
+    
+    With NumPy the ledger columns are copied into arrays once and every
+    report is a vectorized operation; the arrays are exported again only
+    after the profile changes. Without NumPy the same reports are computed
+    with plain loops over the columns. This module is not imported by the
+    models package, so NumPy is only loaded when analytics are used.
+    """
+    
+    def __init__(self, profile, use_numpy=None):
+        self.profile = profile
+        self.use_numpy = HAS_NUMPY if use_numpy is None else use_numpy and HAS_NUMPY
+        self._version = None
+        self._amounts = None
+        self._signed = None
+        self._income_mask = None
+        self._timestamps = None
+    
+    def _ledger(self):
+        """Get the ledger, refreshing the exported arrays if the profile changed"""
+        ledger = self.profile.transactions
+        version = (ledger.origin, self.profile.version)
+        if self.use_numpy and version != self._version:
+            self._amounts = np.frombuffer(ledger.amounts, dtype=np.float64).copy()
+            self._timestamps = np.frombuffer(ledger.timestamps, dtype=np.int64).copy()
+            self._income_mask = np.frombuffer(ledger.type_flags, dtype=np.uint8) == INCOME_FLAG
+            self._signed = np.where(self._income_mask, self._amounts, -self._amounts)
+            self._version = version
+        return ledger
+    
+    def totals(self):
+        """Get (total income, total expenses)"""
+        ledger = self._ledger()
+        if not self.use_numpy:
+            return ledger.totals()
+        return float(self._amounts[self._income_mask].sum()), float(self._amounts[~self._income_mask].sum())
+    
+    def balance(self):
+        """Get the balance over all transactions"""
+        ledger = self._ledger()
+        if not self.use_numpy:
+            total_income, total_expenses = ledger.totals()
+            return total_income - total_expenses
+        return float(self._signed.sum())
+    
+    def running_balances(self):
+        """Get the balance after each transaction, in ledger order"""
+        ledger = self._ledger()
+        if not self.use_numpy:
+            return array('d', accumulate(ledger.signed_amount(row) for row in range(len(ledger))))
+        return np.cumsum(self._signed)
+    
+    def period_totals(self, period='month'):
+        """Get income, expenses, net and count per 'day', 'week' or 'month', oldest first
+        
+        The result has the same shape as Profile.get_rollup.
+        """
+        ledger = self._ledger()
+        if not self.use_numpy:
+            return PeriodRollup(ledger, period).summarize()
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+        
+        days = self._timestamps.astype('datetime64[us]').astype('datetime64[D]')
+        if period == 'week':
+            # 1970-01-01 was a Thursday, so day number + 3 counts from a Monday
+            days = days - (days.astype(np.int64) + 3) % 7
+        elif period == 'month':
+            days = days.astype('datetime64[M]').astype('datetime64[D]')
+        keys, buckets = np.unique(days, return_inverse=True)
+        
+        income = np.bincount(buckets, weights=np.where(self._income_mask, self._amounts, 0), minlength=len(keys))
+        expenses = np.bincount(buckets, weights=np.where(self._income_mask, 0, self._amounts), minlength=len(keys))
+        counts = np.bincount(buckets, minlength=len(keys))
+        return [{
+            'period': key,
+            'income': bucket_income,
+            'expenses': bucket_expenses,
+            'net': bucket_income - bucket_expenses,
+            'count': count
+        } for key, bucket_income, bucket_expenses, count
+            in zip(keys.tolist(), income.tolist(), expenses.tolist(), counts.tolist())]
+    
+    def moving_average(self, window, period='day'):
+        """Get (period start, average net) over each run of 'window' consecutive periods
+        
+        Periods without transactions between the first and the last one
+        count with a net of 0.
+        """
+        if window < 1:
+            raise ValueError("Window must be at least 1")
+        starts = []
+        nets = []
+        for bucket in self.period_totals(period):
+            if starts:
+                start = next_period_start(starts[-1], period)
+                while start < bucket['period']:
+                    starts.append(start)
+                    nets.append(0)
+                    start = next_period_start(start, period)
+            starts.append(bucket['period'])
+            nets.append(bucket['net'])
+        if len(nets) < window:
+            return []
+        
+        if self.use_numpy:
+            averages = np.convolve(np.array(nets, dtype=np.float64), np.full(window, 1 / window), mode='valid').tolist()
+        else:
+            averages = []
+            window_sum = sum(nets[:window - 1])
+            for position in range(window - 1, len(nets)):
+                window_sum += nets[position]
+                averages.append(window_sum / window)
+                window_sum -= nets[position - window + 1]
+        return list(zip(starts[window - 1:], averages))
+    
+    def top_expenses(self, count=10):
+        """Get the 'count' largest expenses, largest first"""
+        ledger = self._ledger()
+        if count <= 0:
+            return []
+        if not self.use_numpy:
+            rows = heapq.nlargest(count, (row for row in range(len(ledger)) if ledger.type_flags[row] != INCOME_FLAG),
+                                  key=ledger.amounts.__getitem__)
+            return [ledger[row] for row in rows]
+        
+        rows = np.flatnonzero(~self._income_mask)
+        if count < len(rows):
+            rows = rows[np.argpartition(self._amounts[rows], -count)[-count:]]
+        rows = rows[np.argsort(-self._amounts[rows], kind='stable')]
+        return [ledger[row] for row in rows.tolist()]
\ No newline at end of file
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import lzma
+import os
+import zlib
+from datetime import datetime, timedelta
+from .profile import Profile
+from .ledger import TransactionLedger
+from .recurring import RecurringRule
+from .binary_snapshot import VERSION as BLOCK_VERSION, encode_ledger, decode_ledger
+
+class BackupStore:
+    """Incremental, content-addressed backups of profile data
+    
+    Each profile's transactions are cut into fixed-size chunks that are
+    stored once under the hash of their content; a backup is a small
+    manifest listing the chunks of every profile. Chunks that did not
+    change since the previous backup are neither encoded nor written again,
+    and profiles that did not change at all are listed as in the previous
+    backup without reading their transactions.
+    """
+    
+    COMPRESSIONS = {
+        None: (b'n', lambda data: data, lambda data: data),
+        'zlib': (b'z', zlib.compress, zlib.decompress),
+        'lzma': (b'x', lzma.compress, lzma.decompress)
+    }
+    
+    def __init__(self, directory, compression='zlib', chunk_size=1000):
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+        self.directory = directory
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.manifests_dir = os.path.join(directory, 'manifests')
+        # (profile name, chunk index) -> ((ledger origin, edit_count), chunk hash) of full chunks
+        self._chunk_cache = {}
+        # profile name -> (profile version, manifest entry) of the last backup made here
+        self._last_entries = {}
+    
+    def _object_path(self, digest):
+        """Get the file path of a stored chunk"""
+        return os.path.join(self.objects_dir, digest[:2], digest)
+    
+    def _write_object(self, data):
+        """Store a chunk once under the hash of its content and return the hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            prefix, compress, _ = self.COMPRESSIONS[self.compression]
+            temp_file = path + '.tmp'
+            with open(temp_file, 'wb') as file:
+                file.write(prefix + compress(data))
+            os.replace(temp_file, path)
+        return digest
+    
+    def _read_object(self, digest):
+        """Read and decompress a stored chunk"""
+        with open(self._object_path(digest), 'rb') as file:
+            stored = file.read()
+        for prefix, _, decompress in self.COMPRESSIONS.values():
+            if stored[:1] == prefix:
+                return decompress(stored[1:])
+        raise ValueError(f"Backup object {digest} has an unknown encoding")
+    
+    def _profile_chunks(self, profile):
+        """Store the chunks of one profile and return their hashes"""
+        ledger = profile.transactions
+        digests = []
+        for index, start in enumerate(range(0, len(ledger), self.chunk_size)):
+            stop = min(start + self.chunk_size, len(ledger))
+            key = (profile.name, index)
+            version = (ledger.origin, profile.edit_count)
+            cached = self._chunk_cache.get(key)
+            if cached is not None and cached[0] == version and stop - start == self.chunk_size:
+                digests.append(cached[1])
+                continue
+            
+            chunk = TransactionLedger()
+            chunk.append_rows(ledger, start, stop)
+            digest = self._write_object(encode_ledger(chunk))
+            if stop - start == self.chunk_size:
+                self._chunk_cache[key] = (version, digest)
+            digests.append(digest)
+        return digests
+    
+    def backup(self, profiles):
+        """Create a backup of the given profiles and return its id"""
+        last_entries = {}
+        for profile in profiles:
+            version = profile.version
+            last = self._last_entries.get(profile.name)
+            if last is not None and last[0] == version:
+                last_entries[profile.name] = last
+                continue
+            last_entries[profile.name] = (version, {
+                'name': profile.name,
+                'created_date': profile.created_date.isoformat(),
+                'transaction_count': profile.get_transaction_count(),
+                'chunks': self._profile_chunks(profile),
+                'next_id': profile.transactions.next_id,
+                'recurring': [rule.to_dict() for rule in profile.get_recurring_rules()]
+            })
+        manifest = {
+            'created': datetime.now().isoformat(),
+            'chunk_size': self.chunk_size,
+            'block_version': BLOCK_VERSION,
+            'profiles': [last_entries[profile.name][1] for profile in profiles]
+        }
+        
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        backup_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(self.manifests_dir, backup_id + '.json')
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(temp_file, path)
+        self._last_entries = last_entries
+        return backup_id
+    
+    def list_backups(self):
+        """Get the ids of all backups, oldest first"""
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+    
+    def _read_manifest(self, backup_id):
+        """Read the manifest of one backup"""
+        with open(os.path.join(self.manifests_dir, backup_id + '.json'), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    
+    def restore(self, backup_id=None):
+        """Rebuild the profiles of a backup (the latest one by default)"""
+        if backup_id is None:
+            backups = self.list_backups()
+            if not backups:
+                raise ValueError("No backups available")
+            backup_id = backups[-1]
+        
+        manifest = self._read_manifest(backup_id)
+        # Backups made before the manifest recorded it used version 3 blocks
+        block_version = manifest.get('block_version', 3)
+        profiles = []
+        for profile_data in manifest['profiles']:
+            ledger = TransactionLedger()
+            for digest in profile_data['chunks']:
+                ledger.append_rows(decode_ledger(self._read_object(digest), block_version))
+            ledger.reserve_ids(profile_data.get('next_id', 1))
+            profile = Profile(profile_data['name'])
+            profile.created_date = datetime.fromisoformat(profile_data['created_date'])
+            profile.set_ledger(ledger)
+            for rule_data in profile_data.get('recurring', ()):
+                profile.add_recurring_rule(RecurringRule.from_dict(rule_data))
+            profiles.append(profile)
+        return profiles
+    
+    def prune(self, keep_last=10, keep_daily=7):
+        """Delete old backups and the chunks no remaining backup uses
+        
+        The newest 'keep_last' backups are kept, plus the newest backup of
+        each of the last 'keep_daily' days. Returns the removed backup ids.
+        """
+        backups = self.list_backups()
+        keep = set(backups[-keep_last:]) if keep_last > 0 else set()
+        oldest_day = (datetime.now() - timedelta(days=keep_daily)).strftime("%Y%m%d")
+        newest_per_day = {}
+        for backup_id in backups:
+            day = backup_id[:8]
+            if day > oldest_day:
+                newest_per_day[day] = backup_id
+        keep.update(newest_per_day.values())
+        
+        removed = [backup_id for backup_id in backups if backup_id not in keep]
+        for backup_id in removed:
+            os.remove(os.path.join(self.manifests_dir, backup_id + '.json'))
+        
+        if removed:
+            self._collect_garbage()
+        return removed
+    
+    def _collect_garbage(self):
+        """Delete chunks that are not listed in any manifest"""
+        referenced = set()
+        for backup_id in self.list_backups():
+            for profile_data in self._read_manifest(backup_id)['profiles']:
+                referenced.update(profile_data['chunks'])
+        
+        # Backups of profiles without transactions write no chunks
+        prefixes = os.listdir(self.objects_dir) if os.path.isdir(self.objects_dir) else []
+        for prefix in prefixes:
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, digest))
+        
+        self._chunk_cache = {key: value for key, value in self._chunk_cache.items() if value[1] in referenced}
+        self._last_entries = {name: value for name, value in self._last_entries.items()
+                              if referenced.issuperset(value[1]['chunks'])}
\ No newline at end of file
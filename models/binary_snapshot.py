@@ -0,0 +1,191 @@
+import json
+import struct
+import sys
+from array import array
+from .ledger import TransactionLedger
+from .instrumentation import instrumented
+
+MAGIC = b'PFTB'
+# Version 2 appends the category and tag columns to every ledger block,
+# version 3 the transaction id column; version 4 stores each tag set as
+# a string table instead of one space-joined string
+VERSION = 4
+
+# magic, version, flags, profile count, index offset, index length
+_HEADER = struct.Struct('<4sHHIQQ')
+_COUNT = struct.Struct('<I')
+
+def is_binary_snapshot(data_file):
+    """Check whether a snapshot file uses the binary format"""
+    try:
+        with open(data_file, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _little_endian(column):
+    """Get a column in little-endian byte order, as stored on disk"""
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+def _encode_strings(parts, strings):
+    """Append a string table: its length, then each string's length and UTF-8 bytes"""
+    parts.append(_COUNT.pack(len(strings)))
+    for string in strings:
+        encoded = string.encode('utf-8')
+        parts.append(_COUNT.pack(len(encoded)))
+        parts.append(encoded)
+
+def _decode_strings(view, position):
+    """Read a string table written by _encode_strings; returns (strings, next position)"""
+    (string_count,) = _COUNT.unpack_from(view, position)
+    position += _COUNT.size
+    strings = []
+    for _ in range(string_count):
+        (length,) = _COUNT.unpack_from(view, position)
+        position += _COUNT.size
+        strings.append(str(view[position:position + length], 'utf-8'))
+        position += length
+    return strings, position
+
+def _decode_tag_sets(view, position):
+    """Read the tag set table of a version 4 block; returns (tag sets, next position)"""
+    (set_count,) = _COUNT.unpack_from(view, position)
+    position += _COUNT.size
+    tag_sets = []
+    for _ in range(set_count):
+        tags, position = _decode_strings(view, position)
+        tag_sets.append(tuple(tags))
+    return tag_sets, position
+
+def _decode_ids(view, position, count):
+    """Read a column of 'count' unsigned ids; returns (column, next position)"""
+    column = array('I')
+    size = column.itemsize * count
+    column.frombytes(view[position:position + size])
+    return _little_endian(column), position + size
+
+def encode_ledger(ledger):
+    """Encode a ledger as a block
+    
+    Layout: description table, row count, the amount, timestamp, type and
+    description id columns, then the category table and column, the tag
+    set count with one string table per set and the tag set column, and
+    the id column.
+    """
+    parts = []
+    _encode_strings(parts, ledger.descriptions)
+    parts.append(_COUNT.pack(len(ledger)))
+    parts.append(_little_endian(ledger.amounts).tobytes())
+    parts.append(_little_endian(ledger.timestamps).tobytes())
+    parts.append(bytes(ledger.type_flags))
+    parts.append(_little_endian(ledger.description_ids).tobytes())
+    _encode_strings(parts, ledger.categories)
+    parts.append(_little_endian(ledger.category_ids).tobytes())
+    parts.append(_COUNT.pack(len(ledger.tag_sets)))
+    for tags in ledger.tag_sets:
+        _encode_strings(parts, tags)
+    parts.append(_little_endian(ledger.tag_set_ids).tobytes())
+    parts.append(_little_endian(ledger.ids).tobytes())
+    return b''.join(parts)
+
+@instrumented('binary.decode_ledger')
+def decode_ledger(block, version=VERSION):
+    """Decode a block written by encode_ledger with the given format version
+    
+    Blocks of version 1 snapshots and backups end after the description
+    ids; their rows are uncategorized and untagged. Blocks written before
+    version 3 have no id column, so their rows are numbered from 1, and
+    before version 4 each tag set is one string of space-separated tags.
+    """
+    view = memoryview(block)
+    descriptions, position = _decode_strings(view, 0)
+    (count,) = _COUNT.unpack_from(view, position)
+    position += _COUNT.size
+    columns = []
+    for typecode in ('d', 'q'):
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(view[position:position + size])
+        columns.append(_little_endian(column))
+        position += size
+    type_flags = bytearray(view[position:position + count])
+    position += count
+    description_ids, position = _decode_ids(view, position, count)
+    if position >= len(view):
+        return TransactionLedger.from_columns(columns[0], columns[1], type_flags, description_ids, descriptions)
+    
+    categories, position = _decode_strings(view, position)
+    category_ids, position = _decode_ids(view, position, count)
+    if version >= 4:
+        tag_sets, position = _decode_tag_sets(view, position)
+    else:
+        tag_sets, position = _decode_strings(view, position)
+        tag_sets = [tuple(tags.split()) for tags in tag_sets]
+    tag_set_ids, position = _decode_ids(view, position, count)
+    ids = None
+    if position < len(view):
+        ids = array('q')
+        ids.frombytes(view[position:position + ids.itemsize * count])
+        ids = _little_endian(ids)
+    return TransactionLedger.from_columns(columns[0], columns[1], type_flags, description_ids, descriptions,
+                                          category_ids, categories, tag_set_ids,
+                                          tag_sets, ids)
+
+def dump_binary_snapshot(profiles, file, extra=None):
+    """Write (name, created_date, ledger, recurring rule dicts) items as a binary snapshot and return its profile index
+    
+    Layout: a fixed header, one encoded ledger block per profile, then a
+    JSON index of per-profile offsets, totals, next transaction ids and
+    recurring rules that the header points to.
+    """
+    file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+    entries = []
+    for name, created_date, ledger, recurring in profiles:
+        block = encode_ledger(ledger)
+        total_income, total_expenses = ledger.totals()
+        entry = {
+            'name': name,
+            'created_date': created_date,
+            'transaction_count': len(ledger),
+            'total_income': total_income,
+            'total_expenses': total_expenses,
+            'next_id': ledger.next_id,
+            'offset': file.tell(),
+            'length': len(block)
+        }
+        if recurring:
+            entry['recurring'] = recurring
+        entries.append(entry)
+        file.write(block)
+    
+    index_offset = file.tell()
+    index = json.dumps({'profiles': entries, 'extra': extra or {}}, ensure_ascii=False).encode('utf-8')
+    file.write(index)
+    file.seek(0)
+    file.write(_HEADER.pack(MAGIC, VERSION, 0, len(entries), index_offset, len(index)))
+    file.seek(0, 2)
+    return entries
+
+def read_binary_index(data_file):
+    """Get (index entries, extra keys) of a binary snapshot"""
+    with open(data_file, 'rb') as file:
+        magic, version, _, _, index_offset, index_length = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{data_file}' is not a binary snapshot")
+        if version > VERSION:
+            raise ValueError(f"Unsupported binary snapshot version {version}")
+        file.seek(index_offset)
+        index = json.loads(file.read(index_length).decode('utf-8'))
+    return index['profiles'], index.get('extra', {})
+
+def read_binary_ledger(file, entry):
+    """Decode the ledger of the single profile an index entry points at in an open snapshot file"""
+    file.seek(0)
+    version = _HEADER.unpack(file.read(_HEADER.size))[1]
+    file.seek(entry['offset'])
+    ledger = decode_ledger(file.read(entry['length']), version)
+    ledger.reserve_ids(entry.get('next_id', 1))
+    return ledger
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Windows locks are mandatory, so lock a byte far past the generation counter
+_WINDOWS_LOCK_OFFSET = 2 ** 30
+
+class FileLock:
+    """Advisory lock shared by every process that uses the same data file
+    
+    Uses flock on POSIX systems and msvcrt on Windows (where shared locks
+    are exclusive as well). The lock is reentrant for the thread holding
+    it; other threads of the same process wait like other processes do.
+    
+    The lock file also stores a generation counter that writers bump
+    whenever they replace the snapshot, so other processes can tell
+    cheaply that their view of the data is out of date.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+    
+    def _open(self):
+        """Open the lock file, creating it if needed"""
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+    
+    def _lock(self, exclusive, blocking):
+        fd = self._open()
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+            return
+        os.lseek(fd, _WINDOWS_LOCK_OFFSET, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not blocking:
+                    raise BlockingIOError("Data file is locked by another process")
+                # LK_LOCK gives up after ten seconds; keep waiting
+    
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, _WINDOWS_LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+    
+    @contextmanager
+    def acquire(self, exclusive=True, blocking=True):
+        """Hold the lock for the duration of a with block
+        
+        Nested acquisitions by the same thread are counted; an exclusive
+        lock cannot be requested while only a shared one is held. With
+        blocking=False, BlockingIOError is raised instead of waiting.
+        """
+        if not self._thread_lock.acquire(blocking):
+            raise BlockingIOError("Data file is locked by another thread")
+        try:
+            if self._depth == 0:
+                self._lock(exclusive, blocking)
+                self._exclusive = exclusive
+            elif exclusive and not self._exclusive:
+                raise RuntimeError("Cannot upgrade a shared data file lock to an exclusive one")
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._unlock()
+        finally:
+            self._thread_lock.release()
+    
+    def read_generation(self):
+        """Get the generation counter, 0 if it was never written"""
+        try:
+            with open(self.path, 'rb') as file:
+                return int(file.read(32).strip() or 0)
+        except (OSError, ValueError):
+            return 0
+    
+    def bump_generation(self):
+        """Increment the generation counter; the exclusive lock must be held"""
+        generation = self.read_generation() + 1
+        fd = self._open()
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, f"{generation:>20}\n".encode('ascii'))
+        return generation
+    
+    def close(self):
+        """Close the lock file"""
+        with self._thread_lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
\ No newline at end of file
@@ -1,16 +1,73 @@
 import json
 import os
-from .profile import Profile
+import threading
+from contextlib import ExitStack
+from .profile_registry import ProfileRegistry
+from .storage import JSONStorage
+from .sharded_storage import ShardedStorage, migrate_to_shards
+from .persistence_worker import PersistenceWorker
+from .backup import BackupStore
+from .importer import import_statement
+from .instrumentation import instrumented
+from .formatting import format_rupiah
 
 class FinancialManager:
-    """Class to manage multiple user profiles and data persistence"""
+    """Class to manage multiple user profiles and data persistence
     
-    def __init__(self, data_file='data/financial_data.json'):
-        self.data_file = data_file
+    With layout='sharded' every profile is stored in its own files in a
+    directory named after the data file (data/financial_data/ by default),
+    see ShardedStorage; an existing single data file is copied there the
+    first time.
+    """
+    
+    LAYOUTS = ('single', 'sharded')
+    
+    def __init__(self, data_file='data/financial_data.json', use_journal=False, compact_threshold=1000,
+                 storage=None, lazy=False, snapshot_format='json', backup_on_save=False,
+                 backup_compression='zlib', case_insensitive_names=False, layout='single'):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown storage layout '{layout}'")
+        if storage is None and layout == 'sharded':
+            storage = ShardedStorage(os.path.splitext(data_file)[0], compact_threshold=compact_threshold,
+                                     lazy=lazy)
+            if not os.path.exists(storage.data_file) and os.path.exists(data_file):
+                migrate_to_shards(data_file, storage.directory)
+        elif storage is None:
+            storage = JSONStorage(data_file, use_journal=use_journal, compact_threshold=compact_threshold,
+                                  lazy=lazy, snapshot_format=snapshot_format)
+        self.storage = storage
+        self.data_file = storage.data_file
+        self.case_insensitive_names = case_insensitive_names
         self.profiles = []
+        self.lock = threading.RLock()
+        # Number of times changes stored by other processes were merged
+        self.merge_count = 0
+        self.worker = None
+        self.backup_on_save = backup_on_save
+        self.backup_compression = backup_compression
+        self.backup_store = None
         self.ensure_data_directory()
         self.load_data()
     
+    @property
+    def profiles(self):
+        """Registry of all profiles, indexed by name"""
+        return self._profiles
+    
+    @profiles.setter
+    def profiles(self, profiles):
+        registry = ProfileRegistry(case_insensitive=self.case_insensitive_names)
+        for profile in profiles:
+            if self.case_insensitive_names and profile.name in registry:
+                # Stored names that only differ in case: keep the profile under a free name,
+                # which the next save stores in place of the old one
+                name = registry.unique_name(profile.name)
+                print(f"Error loading profile '{profile.name}': the name is already taken when ignoring case; "
+                      f"renamed it to '{name}'")
+                profile.name = name
+            registry.add(profile)
+        self._profiles = registry
+    
     def ensure_data_directory(self):
         """Ensure the data directory exists"""
         data_dir = os.path.dirname(self.data_file)
@@ -19,67 +76,174 @@ class FinancialManager:
     
     def add_profile(self, profile):
         """Add a new profile"""
-        if isinstance(profile, Profile):
-            # Check if profile name already exists
-            existing_names = [p.name for p in self.profiles]
-            if profile.name not in existing_names:
-                self.profiles.append(profile)
-                self.save_data()
-                return True
-            else:
-                raise ValueError(f"Profile with name '{profile.name}' already exists")
-        else:
-            raise ValueError("Profile must be an instance of Profile class")
+        with self.lock:
+            # Raises ValueError for duplicate names or non-Profile objects
+            self.profiles.add(profile)
+        self.request_save()
+        return True
     
     def get_profile(self, name):
         """Get a profile by name"""
-        for profile in self.profiles:
-            if profile.name == name:
-                return profile
-        return None
+        return self.profiles.get(name)
+    
+    def has_profile(self, name):
+        """Check whether a profile with the given name exists"""
+        return name in self.profiles
+    
+    def get_profile_names(self):
+        """Get the sorted profile names, cached until profiles are added or removed"""
+        return self.profiles.names()
     
     def remove_profile(self, name):
         """Remove a profile by name"""
-        profile = self.get_profile(name)
+        with self.lock:
+            profile = self.profiles.remove(name)
         if profile:
-            self.profiles.remove(profile)
-            self.save_data()
+            self.request_save()
             return True
         return False
     
     def get_all_profiles(self):
         """Get all profiles"""
-        return self.profiles.copy()
+        return list(self.profiles)
+    
+    @instrumented('FinancialManager.import_statement')
+    def import_statement(self, profile_name, path, file_format=None, batch_size=5000, decimal_comma=None):
+        """Import a CSV or OFX bank statement into a profile and save once at the end
+        
+        The format is taken from the file extension unless given; see
+        parse_amount for decimal_comma. Returns a report with the imported,
+        duplicate and rejected rows.
+        """
+        profile = self.get_profile(profile_name)
+        if profile is None:
+            raise ValueError(f"Profile '{profile_name}' does not exist")
+        
+        report = import_statement(profile, path, file_format=file_format, lock=self.lock, batch_size=batch_size,
+                                  decimal_comma=decimal_comma)
+        if report['imported']:
+            self.request_save()
+        return report
+    
+    @instrumented('FinancialManager.post_recurring')
+    def post_recurring(self, until=None):
+        """Add the due occurrences of every profile's recurring rules as transactions
+        
+        Only profiles with due occurrences are read. Returns the number of
+        transactions added per profile name, for the profiles that got any.
+        """
+        posted = {}
+        with self.lock:
+            for profile in self.profiles:
+                if profile.has_due_recurring(until):
+                    posted[profile.name] = len(profile.post_recurring(until))
+        if posted:
+            self.request_save()
+        return posted
     
     def save_data(self):
-        """Save all profiles to JSON file"""
+        """Save all profiles through the storage backend"""
         try:
-            data = {
-                'profiles': [profile.to_dict() for profile in self.profiles]
-            }
-            
-            with open(self.data_file, 'w', encoding='utf-8') as file:
-                json.dump(data, file, indent=2, ensure_ascii=False)
-                
+            self.write_data()
         except Exception as e:
             print(f"Error saving data: {e}")
     
+    def get_dirty_profiles(self):
+        """Get the names of the profiles added, changed or removed since the last save"""
+        with self.lock:
+            return self.storage.changed_names(self.profiles)
+    
+    @instrumented('FinancialManager.save')
+    def write_data(self):
+        """Save the profiles that changed, raising any storage error
+        
+        Nothing is written when no profile changed. Changes other processes
+        stored in the meantime are merged first, while holding the data
+        file lock, so neither side's changes are lost. The profiles are
+        then copied and the manager lock released, so other threads can
+        keep changing them while the copies are written; afterwards the
+        profiles forget the edits that were stored.
+        """
+        if not self.get_dirty_profiles():
+            return
+        with ExitStack() as stack:
+            with self.lock:
+                stack.enter_context(self.storage.locked())
+                self._merge_external_changes()
+                profiles = [profile.snapshot() for profile in self.profiles]
+            self.storage.save_profiles(profiles)
+            if self.backup_on_save:
+                self.get_backup_store().backup(profiles)
+            with self.lock:
+                self.storage.release_edits(self.profiles)
+    
+    def start_worker(self):
+        """Move saving to a background thread; returns the PersistenceWorker"""
+        if self.worker is None:
+            self.worker = PersistenceWorker(self)
+        return self.worker
+    
+    def request_save(self):
+        """Save in the background if a worker is running, otherwise right away"""
+        if self.worker is not None:
+            self.worker.request_save()
+        else:
+            self.save_data()
+    
+    @instrumented('FinancialManager.load_data')
     def load_data(self):
-        """Load profiles from JSON file"""
+        """Load profiles through the storage backend"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    
-                self.profiles = []
-                for profile_data in data.get('profiles', []):
-                    profile = Profile.from_dict(profile_data)
-                    self.profiles.append(profile)
-                    
+            self.profiles = self.storage.load_profiles()
         except Exception as e:
             print(f"Error loading data: {e}")
             self.profiles = []
     
+    @instrumented('FinancialManager.refresh_data')
+    def refresh_data(self, blocking=True):
+        """Merge changes other processes stored since the last load or save
+        
+        Returns True if anything changed. With blocking=False nothing is
+        merged while another process holds the data file lock and False is
+        returned.
+        """
+        try:
+            with self.lock, self.storage.locked(exclusive=False, blocking=blocking):
+                return self._merge_external_changes()
+        except BlockingIOError:
+            return False
+    
+    def _merge_external_changes(self):
+        """Merge changes stored by other processes; the lock must be held"""
+        profiles = self.storage.merge_external_changes(list(self.profiles))
+        if profiles is None:
+            return False
+        self.profiles = profiles
+        self.merge_count += 1
+        return True
+    
+    @instrumented('FinancialManager.compact')
+    def compact(self, background=False):
+        """Compact the storage backend, if it supports it"""
+        if hasattr(self.storage, 'compact'):
+            with self.lock, self.storage.locked():
+                self._merge_external_changes()
+                self.storage.compact(self.profiles, background=background)
+        else:
+            self.save_data()
+    
+    def close(self):
+        """Flush pending changes and release the storage backend"""
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        if hasattr(self.storage, 'wait_for_compaction'):
+            # A running compaction needs the data file lock to finish
+            self.storage.wait_for_compaction()
+        with self.lock, self.storage.locked():
+            self._merge_external_changes()
+            self.storage.close(self.profiles)
+    
     def get_summary_statistics(self):
         """Get summary statistics for all profiles"""
         total_profiles = len(self.profiles)
@@ -92,12 +256,46 @@ class FinancialManager:
             'total_balance': total_balance
         }
     
+    def get_category_totals(self, profile_names=None):
+        """Get income, expenses, net and count per category over several profiles (all by default)
+        
+        Adds up the per-category totals each profile keeps, largest
+        expenses first; uncategorized transactions are reported under ''.
+        Profiles that were not read yet are summed by the storage backend
+        when it can, so their transactions stay on disk.
+        """
+        if profile_names is None:
+            profiles = list(self.profiles)
+        else:
+            profiles = [self.get_profile(name) for name in profile_names]
+        combined = {}
+        for profile in profiles:
+            if profile is None:
+                continue
+            if not profile.is_loaded() and hasattr(self.storage, 'get_category_totals'):
+                profile_totals = self.storage.get_category_totals(profile.name)
+            else:
+                profile_totals = profile.get_category_totals()
+            for totals in profile_totals:
+                merged = combined.setdefault(totals['category'], dict(totals, income=0, expenses=0, net=0, count=0))
+                for key in ('income', 'expenses', 'net', 'count'):
+                    merged[key] += totals[key]
+        return sorted(combined.values(), key=lambda totals: (-totals['expenses'], -totals['income'],
+                                                             totals['category']))
+    
     def backup_data(self, backup_file=None):
-        """Create a backup of the data"""
+        """Create a backup of the data
+        
+        Without a backup file an incremental backup is added to the backup
+        store and its id is returned; with one, a full JSON copy is written.
+        """
         if backup_file is None:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = f"data/backup_financial_data_{timestamp}.json"
+            try:
+                with self.lock:
+                    return self.get_backup_store().backup(self.profiles)
+            except Exception as e:
+                print(f"Error creating backup: {e}")
+                return None
         
         try:
             data = {
@@ -113,7 +311,27 @@ class FinancialManager:
             print(f"Error creating backup: {e}")
             return None
     
+    def get_backup_store(self):
+        """Get the incremental backup store kept next to the data file"""
+        if self.backup_store is None:
+            backup_dir = os.path.join(os.path.dirname(self.data_file), 'backups')
+            self.backup_store = BackupStore(backup_dir, compression=self.backup_compression)
+        return self.backup_store
+    
+    def restore_backup(self, backup_id=None):
+        """Replace all profiles with those of a backup (the latest one by default)"""
+        profiles = self.get_backup_store().restore(backup_id)
+        with self.lock:
+            self.profiles = profiles
+            self.storage.invalidate()
+        self.request_save()
+    
+    def prune_backups(self, keep_last=10, keep_daily=7):
+        """Apply the backup retention policy and return the removed backup ids"""
+        with self.lock:
+            return self.get_backup_store().prune(keep_last=keep_last, keep_daily=keep_daily)
+    
     def __str__(self):
         """String representation of financial manager"""
         stats = self.get_summary_statistics()
-        return f"Financial Manager - Profiles: {stats['total_profiles']}, Transactions: {stats['total_transactions']}, Total Balance: Rp {stats['total_balance']:,.2f}"
\ No newline at end of file
+        return f"Financial Manager - Profiles: {stats['total_profiles']}, Transactions: {stats['total_transactions']}, Total Balance: {format_rupiah(stats['total_balance'])}"
\ No newline at end of file
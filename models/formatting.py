@@ -0,0 +1,26 @@
+from functools import lru_cache
+from .timestamps import MINUTE, from_timestamp
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+# Display strings are cached by the value they show, so an edited
+# transaction simply looks up its new value; the caches are bounded so
+# long sessions do not grow them without limit.
+CACHE_SIZE = 4096
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_minute(minute):
+    return from_timestamp(minute * MINUTE).strftime(DATE_FORMAT)
+
+def format_timestamp(timestamp):
+    """Format integer epoch microseconds as 'YYYY-MM-DD HH:MM'"""
+    return _format_minute(timestamp // MINUTE)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_rupiah(amount):
+    return f"Rp {amount:,.2f}"
+
+def format_rupiah(amount):
+    """Format an amount as 'Rp 1,234.50'"""
+    # Adding 0.0 turns -0.0 into 0.0 and ints into floats, which share cache entries
+    return _format_rupiah(amount + 0.0)
\ No newline at end of file
@@ -0,0 +1,258 @@
+import csv
+import math
+import os
+import re
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+from .transaction import Income, Expense
+from .ledger import INCOME_FLAG
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y', '%d/%m/%Y %H:%M',
+                '%d-%m-%Y', '%Y/%m/%d')
+# Formats of dates written as digits only (OFX), by number of digits; strptime
+# would read '202401051030' as 10:03 if the length were not fixed first
+DIGIT_DATE_FORMATS = {8: '%Y%m%d', 12: '%Y%m%d%H%M', 14: '%Y%m%d%H%M%S'}
+
+INCOME_TYPES = ('income', 'credit', 'cr', 'kredit', 'pemasukan', 'deposit')
+EXPENSE_TYPES = ('expense', 'debit', 'db', 'dr', 'pengeluaran', 'withdrawal')
+
+# Accepted header names of each field in CSV exports
+CSV_COLUMNS = {
+    'date': ('date', 'tanggal', 'posted', 'transaction date', 'booking date'),
+    'description': ('description', 'keterangan', 'memo', 'payee', 'name', 'details'),
+    'amount': ('amount', 'jumlah', 'nominal', 'value'),
+    'type': ('type', 'jenis'),
+    'credit': ('credit', 'kredit'),
+    'debit': ('debit',),
+    'category': ('category', 'kategori'),
+    'tags': ('tags', 'tag', 'labels', 'label')
+}
+
+_OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+_OFX_DATE = re.compile(r'(\d{8,14})(?:\.\d+)?(?:\[.*\])?')
+
+def parse_amount(text, decimal_comma=None):
+    """Parse amounts such as '1,234.50', '1.234,50', 'Rp 50.000' or '(75.00)'
+    
+    With both separators, the last one is the decimal point. A lone dot
+    is a decimal point unless it groups thousands the Indonesian way:
+    '1.234.567' always does, '50.000' only with a Rupiah sign or when
+    decimal_comma is True. decimal_comma=False always reads a dot as the
+    decimal point.
+    """
+    rupiah = 'Rp' in text or 'IDR' in text
+    text = text.strip().replace('Rp', '').replace('IDR', '').replace(' ', '')
+    if not text:
+        raise ValueError("Missing amount")
+    negative = text.startswith('(') and text.endswith(')')
+    if negative:
+        text = text[1:-1]
+    
+    if ',' in text and '.' in text:
+        # Whichever separator comes last is the decimal point
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.') if re.search(r',\d{1,2}$', text) else text.replace(',', '')
+    elif decimal_comma is not False and re.fullmatch(r'[-+]?[1-9]\d{0,2}(\.\d{3})+', text) and (
+            decimal_comma or rupiah or text.count('.') > 1):
+        # Rupiah amounts use dots to group thousands
+        text = text.replace('.', '')
+    
+    amount = float(text)
+    if not math.isfinite(amount):
+        raise ValueError(f"Invalid amount '{text}'")
+    return -amount if negative else amount
+
+class DateParser:
+    """Parse dates in ISO format or any of DATE_FORMATS
+    
+    Statements use one format throughout, so the format that matched
+    last is tried first.
+    """
+    
+    def __init__(self):
+        self.last_format = None
+    
+    def __call__(self, text):
+        text = text.strip()
+        # OFX dates may carry fractional seconds and a time zone: 20240105120000.000[-7:MST]
+        match = _OFX_DATE.fullmatch(text)
+        if match:
+            text = match.group(1)
+            date_format = DIGIT_DATE_FORMATS.get(len(text))
+            if date_format is None:
+                raise ValueError(f"Unrecognized date '{text}'")
+            return datetime.strptime(text, date_format)
+        
+        if self.last_format is not None:
+            try:
+                return datetime.strptime(text, self.last_format)
+            except ValueError:
+                pass
+        for date_format in DATE_FORMATS:
+            try:
+                date = datetime.strptime(text, date_format)
+            except ValueError:
+                continue
+            self.last_format = date_format
+            return date
+        try:
+            return datetime.fromisoformat(text).replace(tzinfo=None)
+        except ValueError:
+            raise ValueError(f"Unrecognized date '{text}'")
+
+def read_csv(file):
+    """Yield (line number, fields) for each row of a CSV export
+    
+    The delimiter is detected from the start of the file and the columns
+    are matched by header name, see CSV_COLUMNS.
+    """
+    sample = file.read(4096)
+    file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    
+    reader = csv.reader(file, dialect)
+    header = [name.strip().lower() for name in next(reader, [])]
+    columns = {}
+    for field, names in CSV_COLUMNS.items():
+        for position, name in enumerate(header):
+            if name in names:
+                columns[field] = position
+                break
+    if 'date' not in columns or 'description' not in columns:
+        raise ValueError("CSV file needs a date and a description column")
+    if 'amount' not in columns and 'credit' not in columns and 'debit' not in columns:
+        raise ValueError("CSV file needs an amount column or credit/debit columns")
+    
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        yield reader.line_num, {field: row[position] if position < len(row) else ''
+                                for field, position in columns.items()}
+
+def read_ofx(file):
+    """Yield (line number, fields) for each <STMTTRN> block of an OFX/QFX statement
+    
+    Works line by line on the SGML and XML flavours alike, so the file is
+    never parsed as a whole.
+    """
+    fields = None
+    start = 0
+    for line_number, line in enumerate(file, 1):
+        for tag, value in _OFX_FIELD.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                fields = {}
+                start = line_number
+            elif fields is not None:
+                fields.setdefault(tag, value.strip())
+        if fields is not None and '</STMTTRN>' in line.upper():
+            yield start, {
+                'date': fields.get('DTPOSTED', ''),
+                'description': fields.get('NAME') or fields.get('MEMO') or fields.get('PAYEE', ''),
+                'amount': fields.get('TRNAMT', '')
+            }
+            fields = None
+
+def parse_transactions(records, errors, decimal_comma=None):
+    """Turn (line number, fields) records into (line number, transaction) pairs
+    
+    Rows that fail validation are skipped and reported in 'errors' as
+    (line number, message). 'decimal_comma' is passed on to parse_amount.
+    """
+    parse_date = DateParser()
+    for line_number, fields in records:
+        try:
+            description = fields.get('description', '').strip()
+            if not description:
+                raise ValueError("Missing description")
+            date = parse_date(fields.get('date', ''))
+            
+            if fields.get('credit', '').strip():
+                amount = abs(parse_amount(fields['credit'], decimal_comma))
+            elif fields.get('debit', '').strip():
+                amount = -abs(parse_amount(fields['debit'], decimal_comma))
+            else:
+                amount = parse_amount(fields.get('amount', ''), decimal_comma)
+                transaction_type = fields.get('type', '').strip().lower()
+                if transaction_type in INCOME_TYPES:
+                    amount = abs(amount)
+                elif transaction_type in EXPENSE_TYPES:
+                    amount = -abs(amount)
+                elif transaction_type:
+                    raise ValueError(f"Unknown transaction type '{fields['type']}'")
+            if amount == 0:
+                raise ValueError("Amount must not be zero")
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        
+        transaction_class = Income if amount > 0 else Expense
+        transaction = transaction_class(description, amount, fields.get('category', ''), fields.get('tags', ''))
+        transaction.date = date
+        yield line_number, transaction
+
+def transaction_key(transaction):
+    """Get the duplicate detection key of a transaction: (date, signed amount, description)"""
+    return transaction.timestamp, transaction.get_amount(), transaction.description
+
+def ledger_keys(ledger):
+    """Get the duplicate detection keys of all transactions in a ledger"""
+    descriptions = ledger.descriptions
+    return {(timestamp, amount if type_flag == INCOME_FLAG else -amount, descriptions[description_id])
+            for timestamp, amount, type_flag, description_id
+            in zip(ledger.timestamps, ledger.amounts, ledger.type_flags, ledger.description_ids)}
+
+def skip_duplicates(transactions, known_keys, report):
+    """Drop transactions whose key is already known, including repeats within the import"""
+    for _, transaction in transactions:
+        key = transaction_key(transaction)
+        if key in known_keys:
+            report['duplicates'] += 1
+            continue
+        known_keys.add(key)
+        yield transaction
+
+def read_statement(file, file_format):
+    """Get the record reader for a 'csv' or 'ofx' statement"""
+    if file_format == 'csv':
+        return read_csv(file)
+    if file_format in ('ofx', 'qfx'):
+        return read_ofx(file)
+    raise ValueError(f"Unsupported import format '{file_format}'")
+
+def import_statement(profile, path, file_format=None, lock=None, batch_size=5000, decimal_comma=None):
+    """Import a CSV or OFX bank statement into a profile
+    
+    Rows stream through the reader, validation and duplicate filter and
+    are added in batches of 'batch_size', holding 'lock' (if given) only
+    while a batch is added. Nothing is saved here; callers persist once
+    afterwards. Returns a report with the number of imported rows, the
+    number of skipped duplicates and a list of (line number, message)
+    errors. decimal_comma=True reads amounts such as '50.000' as
+    Indonesian statements write them, see parse_amount.
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip('.').lower()
+    report = {'imported': 0, 'duplicates': 0, 'errors': []}
+    
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        records = read_statement(file, file_format)
+        transactions = skip_duplicates(parse_transactions(records, report['errors'], decimal_comma),
+                                       ledger_keys(profile.transactions), report)
+        while True:
+            batch = list(islice(transactions, batch_size))
+            if not batch:
+                break
+            with lock if lock is not None else nullcontext():
+                for transaction in batch:
+                    profile.add_transaction(transaction)
+            report['imported'] += len(batch)
+    return report
\ No newline at end of file
@@ -0,0 +1,169 @@
+import atexit
+import cProfile
+import functools
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# PFT_INSTRUMENT=1 records spans and counters, PFT_INSTRUMENT_LOG=<file> also
+# writes the report there at exit, PFT_PROFILE=<file> captures a cProfile of
+# the main thread for the whole session. The variables are read once, when
+# the models package is imported.
+ENABLED = os.environ.get('PFT_INSTRUMENT', '') not in ('', '0')
+LOG_FILE = os.environ.get('PFT_INSTRUMENT_LOG') or None
+PROFILE_FILE = os.environ.get('PFT_PROFILE') or None
+
+# Spans shorter than this still count towards the totals but are not kept as recent
+RECENT_MIN_SECONDS = 0.001
+
+_NULL_SPAN = nullcontext()
+
+class Recorder:
+    """Thread-safe totals per span name, counters and a window of recent slow spans"""
+    
+    def __init__(self, recent_size=500):
+        self._lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.recent = deque(maxlen=recent_size)
+    
+    def record(self, name, seconds):
+        """Add one finished span"""
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                # [count, total seconds, slowest seconds]
+                stats = self.spans[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+            if seconds >= RECENT_MIN_SECONDS:
+                self.recent.append((name, seconds, time.time()))
+    
+    def increment(self, name, amount=1):
+        """Add to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def summary(self):
+        """Get per-span totals, largest cumulative time first"""
+        with self._lock:
+            spans = list(self.spans.items())
+        rows = [{
+            'name': name,
+            'count': count,
+            'total_ms': total * 1000,
+            'mean_ms': total * 1000 / count,
+            'max_ms': slowest * 1000
+        } for name, (count, total, slowest) in spans]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+    
+    def slowest_recent(self, count=10):
+        """Get (name, milliseconds, finished at) of the slowest of the recent spans"""
+        with self._lock:
+            recent = list(self.recent)
+        return [(name, seconds * 1000, finished)
+                for name, seconds, finished in heapq.nlargest(count, recent, key=lambda span: span[1])]
+    
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.recent.clear()
+    
+    def report(self, slowest=10):
+        """Format the totals, counters and slowest recent spans as text"""
+        lines = [f"{'span':<36} {'count':>8} {'total ms':>11} {'mean ms':>9} {'max ms':>9}"]
+        for row in self.summary():
+            lines.append(f"{row['name']:<36} {row['count']:>8} {row['total_ms']:>11.1f} "
+                         f"{row['mean_ms']:>9.2f} {row['max_ms']:>9.2f}")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        if counters:
+            lines.append("")
+            lines.extend(f"{name:<36} {value:>8}" for name, value in counters)
+        recent = self.slowest_recent(slowest)
+        if recent:
+            lines.append("")
+            lines.append("Slowest recent:")
+            lines.extend(f"  {time.strftime('%H:%M:%S', time.localtime(finished))} {name:<36} {ms:>9.2f} ms"
+                         for name, ms, finished in recent)
+        return "\n".join(lines)
+    
+    def dump(self, path):
+        """Write the report as JSON"""
+        with self._lock:
+            counters = dict(self.counters)
+        data = {
+            'spans': self.summary(),
+            'counters': counters,
+            'slowest_recent': [{'name': name, 'ms': ms, 'finished': finished}
+                               for name, ms, finished in self.slowest_recent()]
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=2)
+
+recorder = Recorder()
+
+class _Span:
+    __slots__ = ('name', 'start')
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+def span(name):
+    """Context manager timing a block as the named span; a shared no-op when disabled"""
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+def increment(name, amount=1):
+    """Add to a named counter when instrumentation is enabled"""
+    if ENABLED:
+        recorder.increment(name, amount)
+
+def instrumented(name):
+    """Decorator timing every call as the named span
+    
+    When instrumentation is disabled the function is returned unchanged,
+    so decorated hot paths cost nothing.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def _finish():
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_FILE)
+    if ENABLED and LOG_FILE:
+        recorder.dump(LOG_FILE)
+
+_profiler = None
+if PROFILE_FILE:
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+if _profiler is not None or ENABLED and LOG_FILE:
+    atexit.register(_finish)
\ No newline at end of file
@@ -0,0 +1,177 @@
+import glob
+import json
+import os
+import time
+
+class Journal:
+    """Append-only journal of data changes, stored as numbered segment files
+    
+    Several processes may share a journal as long as they only append or
+    read new records while holding the data file lock; 'read_position'
+    tracks how far this process has read, including its own records.
+    Appended records are forced to disk every 'sync_every' records, once
+    the oldest of them is 'sync_interval' seconds old, and on sync().
+    """
+    
+    def __init__(self, base_path, sync_every=50, sync_interval=1.0):
+        self.base_path = base_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.record_count = 0
+        self.read_position = (1, 0)
+        self._file = None
+        self._seq = None
+        self._unsynced = 0
+        # time.monotonic() when the oldest record not forced to disk yet was appended
+        self._unsynced_since = None
+    
+    def segment_path(self, seq):
+        """Get the file path of the segment with the given sequence number"""
+        return f"{self.base_path}.{seq}.journal"
+    
+    def segments(self, after=0):
+        """Get sorted (seq, path) pairs of segments newer than the given sequence"""
+        found = []
+        for path in glob.glob(glob.escape(self.base_path) + '.*.journal'):
+            seq_str = path[len(self.base_path) + 1:-len('.journal')]
+            if seq_str.isdigit() and int(seq_str) > after:
+                found.append((int(seq_str), path))
+        return sorted(found)
+    
+    def replay(self, after=0):
+        """Yield every complete record stored in segments newer than 'after'
+        
+        A torn tail left by a crash is cut off, so this must run while no
+        other process can append.
+        """
+        self.record_count = 0
+        self.read_position = (after + 1, 0)
+        for seq, path in self.segments(after):
+            end = 0
+            for record, end in self._read_segment(path, truncate=True):
+                self.record_count += 1
+                yield record
+            self._seq = max(self._seq or 0, seq)
+            self.read_position = (seq, end)
+    
+    def records(self, after=0, upto=None):
+        """Yield the complete records of segments after 'after' up to 'upto', without side effects"""
+        for seq, path in self.segments(after):
+            if upto is not None and seq > upto:
+                break
+            for record, _ in self._read_segment(path):
+                yield record
+    
+    def has_new(self):
+        """Check whether records were appended after the read position"""
+        seq, offset = self.read_position
+        for segment_seq, path in self.segments(after=seq - 1):
+            if segment_seq > seq:
+                return True
+            try:
+                if os.path.getsize(path) > offset:
+                    return True
+            except OSError:
+                pass
+        return False
+    
+    def read_new(self):
+        """Yield the complete records appended after the read position and advance it"""
+        seq, offset = self.read_position
+        for segment_seq, path in self.segments(after=seq - 1):
+            end = offset if segment_seq == seq else 0
+            for record, end in self._read_segment(path, start=end):
+                yield record
+            self.read_position = (segment_seq, end)
+    
+    def _read_segment(self, path, start=0, truncate=False):
+        """Yield (record, end offset) pairs from one segment
+        
+        Reading stops at an incomplete last line; with truncate=True that
+        torn tail is also removed from the file.
+        """
+        valid_size = start
+        torn = False
+        with open(path, 'rb') as file:
+            file.seek(start)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    torn = True
+                    break
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    torn = True
+                    break
+                valid_size += len(line)
+                yield record, valid_size
+        
+        if torn and truncate:
+            with open(path, 'r+b') as file:
+                file.truncate(valid_size)
+    
+    def append(self, record):
+        """Append one record to the newest segment
+        
+        The caller must have read every record before the read position's
+        end, so that it can move past the appended record.
+        """
+        if self._file is not None and self._seq < self.read_position[0]:
+            # Another process already writes to a newer segment
+            self.close()
+        if self._file is None:
+            self._seq = max((self._seq or 0) + 1, self.read_position[0])
+            self._file = open(self.segment_path(self._seq), 'ab')
+        
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        self._file.write(line.encode('utf-8'))
+        self._file.flush()
+        self.read_position = (self._seq, self._file.tell())
+        self.record_count += 1
+        if not self._unsynced:
+            self._unsynced_since = time.monotonic()
+        self._unsynced += 1
+        
+        if self._unsynced >= self.sync_every or time.monotonic() - self._unsynced_since >= self.sync_interval:
+            self.sync()
+    
+    def sync(self):
+        """Force buffered records of the active segment to disk"""
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+    
+    def rotate(self):
+        """Close the active segment and return the last sequence it used"""
+        self.close()
+        self.record_count = 0
+        seq, offset = self.read_position
+        # Segments read so far are complete; the next one is opened after them
+        self._seq = max(self._seq or 0, seq if offset else seq - 1)
+        return self._seq
+    
+    def start_after(self, seq):
+        """Make sure new segments are numbered after the given sequence"""
+        if self._file is not None and self._seq <= seq:
+            # The active segment was folded into a snapshot by another process
+            self.close()
+        self._seq = max(self._seq or 0, seq)
+        if self.read_position[0] <= seq:
+            self.read_position = (seq + 1, 0)
+    
+    def remove_segments(self, upto):
+        """Delete segments already folded into a snapshot"""
+        for seq, path in self.segments():
+            if seq <= upto:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def close(self):
+        """Sync and close the active segment"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
\ No newline at end of file
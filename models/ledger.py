@@ -0,0 +1,315 @@
+from array import array
+from collections.abc import Sequence
+from .transaction import Transaction, Income, Expense
+from .timestamps import parse_timestamp
+
+INCOME_FLAG = 1
+EXPENSE_FLAG = 0
+
+class TransactionLedger(Sequence):
+    """Column-oriented list of transactions
+    
+    Amounts, timestamps, type flags, description ids, category ids and
+    tag set ids are kept in compact arrays; Income/Expense objects are
+    only built when an item is read. Category 0 is '' (uncategorized)
+    and tag set 0 is () (no tags).
+    
+    Every row also has a transaction id that stays the same while rows
+    are added, changed or removed. Rows keep the id they come with unless
+    it is missing (data written before ids existed) or already taken;
+    those get the next id after the highest one so far.
+    """
+    
+    def __init__(self, transactions=()):
+        self.ids = array('q')
+        self.next_id = 1
+        # Shared with copies, so caches can tell a copy of this ledger from a different one
+        self.origin = object()
+        # id -> row, built on the first lookup by id
+        self._rows = None
+        self.amounts = array('d')
+        self.timestamps = array('q')
+        self.type_flags = bytearray()
+        self.description_ids = array('I')
+        self.descriptions = []
+        self._description_ids = {}
+        self.category_ids = array('I')
+        self.categories = ['']
+        self._category_ids = {'': 0}
+        self.tag_set_ids = array('I')
+        self.tag_sets = [()]
+        self._tag_set_ids = {(): 0}
+        for transaction in transactions:
+            self.append(transaction)
+    
+    @staticmethod
+    def from_columns(amounts, timestamps, type_flags, description_ids, descriptions,
+                     category_ids=None, categories=None, tag_set_ids=None, tag_sets=None, ids=None):
+        """Create a ledger directly from its column arrays and string tables
+        
+        Without category or tag columns every row is uncategorized and
+        untagged; without ids the rows are numbered from 1.
+        """
+        ledger = TransactionLedger()
+        if ids is not None:
+            ledger.ids = ids
+            ledger.next_id = max(ids) + 1 if ids else 1
+        else:
+            ledger.ids = array('q', range(1, len(amounts) + 1))
+            ledger.next_id = len(amounts) + 1
+        ledger.amounts = amounts
+        ledger.timestamps = timestamps
+        ledger.type_flags = type_flags
+        ledger.description_ids = description_ids
+        ledger.descriptions = descriptions
+        ledger._description_ids = {description: description_id
+                                   for description_id, description in enumerate(descriptions)}
+        if category_ids is not None:
+            ledger.category_ids = category_ids
+            ledger.categories = categories
+            ledger._category_ids = {category: category_id for category_id, category in enumerate(categories)}
+        else:
+            ledger.category_ids = array('I', bytes(4 * len(amounts)))
+        if tag_set_ids is not None:
+            ledger.tag_set_ids = tag_set_ids
+            ledger.tag_sets = tag_sets
+            ledger._tag_set_ids = {tags: tag_set_id for tag_set_id, tags in enumerate(tag_sets)}
+        else:
+            ledger.tag_set_ids = array('I', bytes(4 * len(amounts)))
+        return ledger
+    
+    def copy(self):
+        """Create an independent copy of the ledger with the same rows and ids"""
+        ledger = TransactionLedger.from_columns(
+            self.amounts[:], self.timestamps[:], self.type_flags[:], self.description_ids[:], list(self.descriptions),
+            self.category_ids[:], list(self.categories), self.tag_set_ids[:], list(self.tag_sets), self.ids[:])
+        ledger.next_id = self.next_id
+        ledger.origin = self.origin
+        return ledger
+    
+    @staticmethod
+    def from_dicts(transaction_dicts, next_id=1):
+        """Create a ledger from raw transaction dictionaries without building Transaction objects
+        
+        'next_id' is the stored next id of the profile, see reserve_ids.
+        """
+        ledger = TransactionLedger()
+        ledger.append_dicts(transaction_dicts)
+        ledger.reserve_ids(next_id)
+        return ledger
+    
+    def reserve_ids(self, next_id):
+        """Never give out ids below 'next_id', e.g. those of deleted rows that were stored
+        
+        Without it a reloaded ledger would hand the id of its deleted newest
+        row to the next new row.
+        """
+        if next_id > self.next_id:
+            self.next_id = next_id
+    
+    def _intern(self, description):
+        """Get the id of a description, adding it to the string table if new"""
+        description_id = self._description_ids.get(description)
+        if description_id is None:
+            description_id = len(self.descriptions)
+            self.descriptions.append(description)
+            self._description_ids[description] = description_id
+        return description_id
+    
+    def _intern_category(self, category):
+        """Get the id of a category, adding it to the category table if new"""
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = len(self.categories)
+            self.categories.append(category)
+            self._category_ids[category] = category_id
+        return category_id
+    
+    def _intern_tags(self, tags):
+        """Get the id of a tuple of tags, adding it to the tag set table if new"""
+        tag_set_id = self._tag_set_ids.get(tags)
+        if tag_set_id is None:
+            tag_set_id = len(self.tag_sets)
+            self.tag_sets.append(tags)
+            self._tag_set_ids[tags] = tag_set_id
+        return tag_set_id
+    
+    def _take_id(self, transaction_id):
+        """Store the id of a new row, replacing a missing or taken one, and return it"""
+        if transaction_id is None or transaction_id < self.next_id and self.find_id(transaction_id) >= 0:
+            transaction_id = self.next_id
+        if transaction_id >= self.next_id:
+            self.next_id = transaction_id + 1
+        if self._rows is not None:
+            self._rows[transaction_id] = len(self.ids)
+        self.ids.append(transaction_id)
+        return transaction_id
+    
+    def find_id(self, transaction_id):
+        """Get the row of the transaction with the given id, or -1"""
+        if self._rows is None:
+            self._rows = {transaction_id: row for row, transaction_id in enumerate(self.ids)}
+        return self._rows.get(transaction_id, -1)
+    
+    def find_category(self, category):
+        """Get the id of a category in the category table, or -1"""
+        return self._category_ids.get(category, -1)
+    
+    def append(self, transaction):
+        """Store a transaction as a new row and set its id to the row's"""
+        transaction.id = self._take_id(transaction.id)
+        self.amounts.append(transaction.amount)
+        self.timestamps.append(transaction.timestamp)
+        self.type_flags.append(INCOME_FLAG if transaction.get_type() == "Income" else EXPENSE_FLAG)
+        self.description_ids.append(self._intern(transaction.description))
+        self.category_ids.append(self._intern_category(transaction.category))
+        self.tag_set_ids.append(self._intern_tags(transaction.tags))
+    
+    def append_dicts(self, transaction_dicts):
+        """Store raw transaction dictionaries (see Transaction.to_dict) as new rows"""
+        amounts = self.amounts
+        timestamps = self.timestamps
+        type_flags = self.type_flags
+        description_ids = self.description_ids
+        category_ids = self.category_ids
+        tag_set_ids = self.tag_set_ids
+        for data in transaction_dicts:
+            self._take_id(data.get('id'))
+            amounts.append(abs(data['amount']))
+            timestamp = data.get('timestamp')
+            timestamps.append(parse_timestamp(data['date']) if timestamp is None else timestamp)
+            type_flags.append(INCOME_FLAG if data['type'] == 'Income' else EXPENSE_FLAG)
+            description_ids.append(self._intern(data['description']))
+            category = data.get('category')
+            category_ids.append(0 if category is None else self._intern_category(category))
+            tags = data.get('tags')
+            tag_set_ids.append(0 if tags is None else self._intern_tags(tuple(tags)))
+    
+    def append_rows(self, other, start=0, stop=None):
+        """Copy rows of another ledger onto the end of this one"""
+        if stop is None:
+            stop = len(other)
+        ids = other.ids[start:stop]
+        if ids and min(ids) >= self.next_id and len(set(ids)) == len(ids):
+            # None of the ids is taken, so the column is copied as it is
+            if self._rows is not None:
+                self._rows.update((transaction_id, row) for row, transaction_id in enumerate(ids, len(self.ids)))
+            self.ids.extend(ids)
+            self.next_id = max(ids) + 1
+        else:
+            for transaction_id in ids:
+                self._take_id(transaction_id)
+        self.amounts.extend(other.amounts[start:stop])
+        self.timestamps.extend(other.timestamps[start:stop])
+        self.type_flags.extend(other.type_flags[start:stop])
+        self.description_ids.extend(self._intern(other.descriptions[description_id])
+                                    for description_id in other.description_ids[start:stop])
+        self.category_ids.extend(self._intern_category(other.categories[category_id])
+                                 for category_id in other.category_ids[start:stop])
+        self.tag_set_ids.extend(self._intern_tags(other.tag_sets[tag_set_id])
+                                for tag_set_id in other.tag_set_ids[start:stop])
+    
+    def signed_amount(self, row):
+        """Get the amount at a row, negative for expenses"""
+        amount = self.amounts[row]
+        return amount if self.type_flags[row] == INCOME_FLAG else -amount
+    
+    def totals(self):
+        """Get (total income, total expenses) straight from the columns"""
+        total_income = 0
+        total_expenses = 0
+        for amount, type_flag in zip(self.amounts, self.type_flags):
+            if type_flag == INCOME_FLAG:
+                total_income += amount
+            else:
+                total_expenses += amount
+        return total_income, total_expenses
+    
+    def _materialize(self, row):
+        """Build the transaction object stored at a row"""
+        transaction_class = Income if self.type_flags[row] == INCOME_FLAG else Expense
+        transaction = transaction_class.__new__(transaction_class)
+        transaction.id = self.ids[row]
+        transaction.description = self.descriptions[self.description_ids[row]]
+        transaction.amount = self.amounts[row]
+        transaction.timestamp = self.timestamps[row]
+        transaction._date = None
+        transaction.category = self.categories[self.category_ids[row]]
+        transaction.tags = self.tag_sets[self.tag_set_ids[row]]
+        return transaction
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._materialize(row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return self._materialize(index)
+    
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self._materialize(row)
+    
+    def find(self, transaction):
+        """Get the row of the first transaction equal to the given one, or -1"""
+        if not isinstance(transaction, Transaction):
+            return -1
+        description_id = self._description_ids.get(transaction.description)
+        if description_id is None:
+            return -1
+        type_flag = INCOME_FLAG if transaction.get_type() == "Income" else EXPENSE_FLAG
+        timestamp = transaction.timestamp
+        for row in range(len(self)):
+            if (self.timestamps[row] == timestamp and self.amounts[row] == transaction.amount
+                    and self.description_ids[row] == description_id and self.type_flags[row] == type_flag):
+                return row
+        return -1
+    
+    def index(self, transaction):
+        """Get the row of the first transaction equal to the given one"""
+        row = self.find(transaction)
+        if row < 0:
+            raise ValueError("transaction is not in ledger")
+        return row
+    
+    def __contains__(self, transaction):
+        return self.find(transaction) >= 0
+    
+    def set_row(self, row, transaction):
+        """Overwrite the values of a row with those of a transaction; the row keeps its id"""
+        self.amounts[row] = transaction.amount
+        self.timestamps[row] = transaction.timestamp
+        self.type_flags[row] = INCOME_FLAG if transaction.get_type() == "Income" else EXPENSE_FLAG
+        self.description_ids[row] = self._intern(transaction.description)
+        self.category_ids[row] = self._intern_category(transaction.category)
+        self.tag_set_ids[row] = self._intern_tags(transaction.tags)
+    
+    def remove(self, transaction):
+        """Remove the first transaction equal to the given one"""
+        self.pop(self.index(transaction))
+    
+    def pop(self, index=-1):
+        """Remove and return the transaction at a row"""
+        transaction = self[index]
+        if index < 0:
+            index += len(self)
+        del self.ids[index]
+        if self._rows is not None:
+            # Only the rows after the removed one move
+            del self._rows[transaction.id]
+            for row in range(index, len(self.ids)):
+                self._rows[self.ids[row]] = row
+        del self.amounts[index]
+        del self.timestamps[index]
+        del self.type_flags[index]
+        del self.description_ids[index]
+        del self.category_ids[index]
+        del self.tag_set_ids[index]
+        return transaction
+    
+    def __repr__(self):
+        return f"TransactionLedger({len(self)} transactions)"
\ No newline at end of file
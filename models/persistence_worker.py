@@ -0,0 +1,95 @@
+import queue
+import threading
+
+class PersistenceWorker:
+    """Background thread that saves and refreshes a FinancialManager off the caller's thread
+    
+    Save requests that pile up while a write is running are coalesced into
+    a single write, and refresh requests into a single merge. Outcomes are
+    put on the 'results' queue as (request, success, result) triples for
+    the owner to pick up: request is SAVE or REFRESH, and result is the
+    error of a failed request, or for a refresh whether anything changed.
+    """
+    
+    SAVE = 'save'
+    REFRESH = 'refresh'
+    _STOP = 'stop'
+    
+    def __init__(self, financial_manager):
+        self.financial_manager = financial_manager
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='persistence-worker', daemon=True)
+        self._thread.start()
+    
+    def request_save(self):
+        """Ask for the current data to be saved soon"""
+        self.requests.put(self.SAVE)
+    
+    def request_refresh(self):
+        """Ask for changes other processes stored to be merged soon"""
+        self.requests.put(self.REFRESH)
+    
+    def flush(self, timeout=None):
+        """Block until every save requested so far has been written"""
+        if not self._thread.is_alive():
+            return True
+        barrier = threading.Event()
+        self.requests.put(barrier)
+        return barrier.wait(timeout)
+    
+    def stop(self, timeout=None):
+        """Write pending saves and stop the thread"""
+        if self._thread.is_alive():
+            self.requests.put(self._STOP)
+            self._thread.join(timeout)
+    
+    def _run(self):
+        """Wait for requests and write once per burst"""
+        running = True
+        while running:
+            pending = [self.requests.get()]
+            while True:
+                try:
+                    pending.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            
+            barriers = [request for request in pending if isinstance(request, threading.Event)]
+            running = self._STOP not in pending
+            if self.SAVE in pending or barriers or not running:
+                self._save()
+            if self.REFRESH in pending and running:
+                self._refresh()
+            if self.requests.empty():
+                # Nothing more to write for now, so what was written goes to disk
+                self._sync()
+            
+            for barrier in barriers:
+                barrier.set()
+    
+    def _save(self):
+        """Write the data and report the outcome"""
+        try:
+            self.financial_manager.write_data()
+            self.results.put((self.SAVE, True, None))
+        except Exception as e:
+            self.results.put((self.SAVE, False, e))
+    
+    def _sync(self):
+        """Force saved data to disk, reporting a failure like a failed save"""
+        try:
+            # Compacting, which closes journal segments, holds the manager lock
+            with self.financial_manager.lock:
+                self.financial_manager.storage.sync()
+        except Exception as e:
+            self.results.put((self.SAVE, False, e))
+    
+    def _refresh(self):
+        """Merge changes other processes stored and report whether anything changed"""
+        try:
+            # Never waits for another process, the next request tries again
+            changed = self.financial_manager.refresh_data(blocking=False)
+            self.results.put((self.REFRESH, True, changed))
+        except Exception as e:
+            self.results.put((self.REFRESH, False, e))
\ No newline at end of file
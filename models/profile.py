@@ -1,73 +1,548 @@
-from datetime import datetime
-from .transaction import Transaction
+import math
+from datetime import date, datetime
+from .transaction import Transaction, Income, Expense
+from .ledger import TransactionLedger, INCOME_FLAG
+from .running_balance import RunningBalances
+from .formatting import format_rupiah
+from .time_index import TimeIndex, PeriodRollup
+from .search_index import SearchIndex, CategoryTotals
+from .recurring import RecurringRule, BalanceForecast
+from .instrumentation import instrumented
 
 class Profile:
     """Class representing a user profile with their financial transactions"""
     
     def __init__(self, name):
         self.name = name
-        self.transactions = []
+        self._transactions = TransactionLedger()
+        self._loader = None
+        self._lazy_count = 0
         self.created_date = datetime.now()
+        self._balance = 0
+        self._total_income = 0
+        self._total_expenses = 0
+        # Number of changes to the recurring rules, for storage to pick up
+        self.rule_change_count = 0
+        # (op, transaction id, row) of the edits and deletions storage has not released yet
+        self._edits = []
+        # Number of edits released from the front of _edits
+        self._edit_base = 0
+        self._running_balances = RunningBalances()
+        self._time_index = None
+        self._rollups = {}
+        self._search_index = None
+        self._category_totals = None
+        self._recurring_rules = []
+        # (period, horizon) -> BalanceForecast, for the day they were built on
+        self._forecasts = {}
+    
+    @property
+    def transactions(self):
+        """Transactions of the profile, read on first access for lazily loaded profiles"""
+        if self._loader is not None:
+            self._load_transactions()
+        return self._transactions
+    
+    @staticmethod
+    def lazy(name, created_date, transaction_count, total_income, total_expenses, loader, recurring_rules=()):
+        """Create a profile whose transactions are only read when first accessed
+        
+        'loader' is called without arguments and returns a TransactionLedger;
+        until then the given totals are reported.
+        """
+        profile = Profile(name)
+        profile.created_date = created_date
+        profile._recurring_rules = list(recurring_rules)
+        profile._lazy_count = transaction_count
+        profile._total_income = total_income
+        profile._total_expenses = total_expenses
+        profile._balance = total_income - total_expenses
+        profile._running_balances = None
+        profile._loader = loader
+        return profile
+    
+    def snapshot(self):
+        """Create a copy of the profile that storage can write while this one keeps changing
+        
+        The copy has its own ledger and rules and the same edits and rule
+        change count; an unloaded profile stays unloaded and shares its loader.
+        """
+        if self._loader is not None:
+            copy = Profile.lazy(self.name, self.created_date, self._lazy_count, self._total_income,
+                                self._total_expenses, self._loader, self._copy_rules())
+        else:
+            copy = Profile(self.name)
+            copy.created_date = self.created_date
+            copy._recurring_rules = self._copy_rules()
+            copy._transactions = self._transactions.copy()
+            copy._total_income = self._total_income
+            copy._total_expenses = self._total_expenses
+            copy._balance = self._balance
+            copy._running_balances = None
+        copy.rule_change_count = self.rule_change_count
+        copy._edits = list(self._edits)
+        copy._edit_base = self._edit_base
+        return copy
+    
+    def _copy_rules(self):
+        """Get copies of the recurring rules"""
+        return [RecurringRule.from_dict(rule.to_dict()) for rule in self._recurring_rules]
+    
+    @property
+    def version(self):
+        """Value that changes whenever the transactions or rules of the profile may have changed
+        
+        Needs no transactions, so unloaded profiles stay unloaded. Copies
+        from snapshot() have the same version; reading the transactions of
+        a lazily loaded profile gives it a new one.
+        """
+        source = self._loader if self._loader is not None else self._transactions.origin
+        return (source, self.get_transaction_count(), self.edit_count, self.rule_change_count)
+    
+    def is_loaded(self):
+        """Check whether the transactions have been read"""
+        return self._loader is None
+    
+    def ensure_loaded(self):
+        """Read the transactions now if the profile was loaded lazily"""
+        if self._loader is not None:
+            self._load_transactions()
+    
+    def _load_transactions(self):
+        """Read the transactions of a lazily loaded profile"""
+        loader = self._loader
+        self._loader = None
+        self.set_ledger(loader())
+    
+    def set_ledger(self, ledger):
+        """Replace all transactions with a TransactionLedger and recompute the totals"""
+        self._transactions = ledger
+        self._total_income, self._total_expenses = ledger.totals()
+        self._balance = self._total_income - self._total_expenses
+        self._running_balances = None
+        self._time_index = None
+        self._rollups = {}
+        self._search_index = None
+        self._category_totals = None
+        self._forecasts = {}
     
     def add_transaction(self, transaction):
         """Add a transaction to the profile"""
         if isinstance(transaction, Transaction):
             self.transactions.append(transaction)
+            self._update_totals(transaction, 1)
+            if self._running_balances is not None:
+                self._running_balances.append(transaction.get_amount())
+            if self._time_index is not None:
+                self._time_index.add(len(self._transactions) - 1, transaction.timestamp)
+            for rollup in self._rollups.values():
+                rollup.add(transaction)
+            if self._search_index is not None:
+                self._search_index.add(len(self._transactions) - 1)
+            if self._category_totals is not None:
+                self._category_totals.add(transaction)
+            for forecast in self._forecasts.values():
+                forecast.add_transaction(transaction)
         else:
             raise ValueError("Transaction must be an instance of Transaction class")
     
+    def remove_transaction(self, transaction):
+        """Remove a transaction from the profile"""
+        row = self.transactions.find(transaction)
+        if row < 0:
+            raise ValueError("Transaction does not belong to this profile")
+        self._remove_row(row)
+    
+    def get_transaction(self, transaction_id):
+        """Get the transaction with the given id, or None"""
+        ledger = self.transactions
+        row = ledger.find_id(transaction_id)
+        return ledger[row] if row >= 0 else None
+    
+    def find_row(self, transaction_id):
+        """Get the ledger row of the transaction with the given id, or -1"""
+        return self.transactions.find_id(transaction_id)
+    
+    def _row_of(self, transaction_id):
+        row = self.transactions.find_id(transaction_id)
+        if row < 0:
+            raise ValueError(f"Profile '{self.name}' has no transaction {transaction_id}")
+        return row
+    
+    def update_transaction(self, transaction_id, **changes):
+        """Change some fields of a transaction and return the changed transaction
+        
+        Accepts transaction_type ('Income' or 'Expense'), description,
+        amount, date, category and tags. The transaction keeps its id and
+        row; totals, running balances and indexes are updated for that one
+        row rather than recomputed.
+        """
+        row = self._row_of(transaction_id)
+        old = self.transactions[row]
+        values = {
+            'transaction_type': old.get_type(),
+            'description': old.description,
+            'amount': old.amount,
+            'date': old.date,
+            'category': old.category,
+            'tags': old.tags
+        }
+        unknown = set(changes) - set(values)
+        if unknown:
+            raise ValueError(f"Transactions have no field '{sorted(unknown)[0]}'")
+        values.update(changes)
+        transaction_type = values['transaction_type'].capitalize()
+        if transaction_type not in ('Income', 'Expense'):
+            raise ValueError("Transaction type must be 'Income' or 'Expense'")
+        if not values['amount'] > 0:
+            raise ValueError("Amount must be greater than 0")
+        
+        transaction = (Income if transaction_type == 'Income' else Expense)(
+            values['description'], values['amount'], values['category'], values['tags'])
+        transaction.date = values['date']
+        transaction.id = old.id
+        self._replace_row(row, old, transaction)
+        return transaction
+    
+    def _replace_row(self, row, old, transaction):
+        """Store new values for a row and update every total and index kept for it"""
+        ledger = self._transactions
+        text_changed = (old.description, old.category, old.tags) != (transaction.description,
+                                                                    transaction.category, transaction.tags)
+        if self._search_index is not None and text_changed:
+            self._search_index.discard(row)
+        ledger.set_row(row, transaction)
+        if self._search_index is not None and text_changed:
+            self._search_index.insert(row)
+        
+        self._update_totals(old, -1)
+        self._update_totals(transaction, 1)
+        if self._running_balances is not None:
+            self._running_balances.set(row, transaction.get_amount())
+        if self._time_index is not None and old.timestamp != transaction.timestamp:
+            self._time_index.move(row, old.timestamp, transaction.timestamp)
+        for rollup in self._rollups.values():
+            rollup.add(old, -1)
+            rollup.add(transaction)
+        if self._category_totals is not None:
+            self._category_totals.add(old, -1)
+            self._category_totals.add(transaction)
+        for forecast in self._forecasts.values():
+            forecast.add_transaction(old, -1)
+            forecast.add_transaction(transaction)
+        self._edits.append(('update', transaction.id, row))
+    
+    def delete_transaction(self, transaction_id):
+        """Remove the transaction with the given id and return it"""
+        return self._remove_row(self._row_of(transaction_id))
+    
+    def _remove_row(self, row):
+        """Remove a row and update every total and index kept for the profile"""
+        ledger = self.transactions
+        if self._search_index is not None:
+            # Reads the row's words, so before the row leaves the ledger
+            self._search_index.remove(row)
+        transaction = ledger.pop(row)
+        self._update_totals(transaction, -1)
+        if self._running_balances is not None:
+            self._running_balances.remove(row)
+        if self._time_index is not None:
+            self._time_index.remove(row, transaction.timestamp)
+        for rollup in self._rollups.values():
+            rollup.add(transaction, -1)
+        if self._category_totals is not None:
+            self._category_totals.add(transaction, -1)
+        for forecast in self._forecasts.values():
+            forecast.add_transaction(transaction, -1)
+        self._edits.append(('remove', transaction.id, row))
+        return transaction
+    
+    @property
+    def edit_count(self):
+        """Number of transaction edits and deletions made since the profile was loaded"""
+        return self._edit_base + len(self._edits)
+    
+    def get_edits(self, start=0):
+        """Get (op, transaction id, row) of the edits from number 'start' on
+        
+        'op' is 'update' or 'remove'; 'row' is the row the transaction had
+        when it was changed. Released edits (see release_edits) are gone.
+        """
+        if start < self._edit_base:
+            raise ValueError(f"Edits before number {self._edit_base} of profile '{self.name}' were released")
+        return self._edits[start - self._edit_base:]
+    
+    def release_edits(self, upto):
+        """Forget the edits before number 'upto' once storage has stored them
+        
+        Keeps the edit log from growing with every edit; edit_count still
+        counts the released edits.
+        """
+        count = min(upto, self.edit_count) - self._edit_base
+        if count > 0:
+            del self._edits[:count]
+            self._edit_base += count
+    
+    def _update_totals(self, transaction, sign):
+        """Add (sign=1) or subtract (sign=-1) a transaction from the running totals"""
+        self._balance += sign * transaction.get_amount()
+        if transaction.get_type() == "Income":
+            self._total_income += sign * transaction.amount
+        else:
+            self._total_expenses += sign * transaction.amount
+    
     def get_balance(self):
-        """Calculate and return current balance"""
-        balance = 0
-        for transaction in self.transactions:
-            balance += transaction.get_amount()
-        return balance
+        """Get current balance"""
+        return self._balance
     
     def get_total_income(self):
-        """Calculate total income"""
-        total_income = 0
-        for transaction in self.transactions:
-            if transaction.get_type() == "Income":
-                total_income += transaction.amount
-        return total_income
+        """Get total income"""
+        return self._total_income
     
     def get_total_expenses(self):
-        """Calculate total expenses"""
+        """Get total expenses"""
+        return self._total_expenses
+    
+    def compute_totals(self):
+        """Recompute balance, income and expense totals from all transactions"""
+        balance = 0
+        total_income = 0
         total_expenses = 0
         for transaction in self.transactions:
-            if transaction.get_type() == "Expense":
+            balance += transaction.get_amount()
+            if transaction.get_type() == "Income":
+                total_income += transaction.amount
+            else:
                 total_expenses += transaction.amount
-        return total_expenses
+        return balance, total_income, total_expenses
+    
+    def verify_totals(self):
+        """Check that the running totals match a full recomputation"""
+        expected = self.compute_totals()
+        actual = (self._balance, self._total_income, self._total_expenses)
+        return all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in zip(actual, expected))
+    
+    def _get_running_balances(self):
+        """Get the running balances, building them if needed"""
+        ledger = self.transactions
+        if self._running_balances is None:
+            self._running_balances = RunningBalances(
+                amount if type_flag == INCOME_FLAG else -amount
+                for amount, type_flag in zip(ledger.amounts, ledger.type_flags))
+        return self._running_balances
+    
+    def get_running_balance(self, index):
+        """Get the balance right after the transaction at the given position"""
+        running_balances = self._get_running_balances()
+        if index < 0:
+            index += len(running_balances)
+        if not 0 <= index < len(running_balances):
+            raise IndexError("transaction index out of range")
+        return running_balances.balance(index)
+    
+    def get_running_balances(self, start=0, stop=None):
+        """Get the balances after the transactions at positions start to stop (exclusive)"""
+        return self._get_running_balances().balances(start, stop)
     
     def get_transaction_count(self):
         """Get total number of transactions"""
-        return len(self.transactions)
+        if self._loader is not None:
+            return self._lazy_count
+        return len(self._transactions)
+    
+    def _get_time_index(self):
+        """Get the date-ordered index of the transactions, building it if needed"""
+        ledger = self.transactions
+        if self._time_index is None:
+            self._time_index = TimeIndex(ledger)
+        return self._time_index
     
     def get_recent_transactions(self, count=5):
-        """Get most recent transactions"""
-        return self.transactions[-count:] if count <= len(self.transactions) else self.transactions
+        """Get most recent transactions by date, oldest first"""
+        ledger = self.transactions
+        return [ledger[row] for row in self._get_time_index().latest(count)]
+    
+    def get_transactions_between(self, start=None, end=None):
+        """Get the transactions dated from start (inclusive) to end (exclusive), oldest first"""
+        ledger = self.transactions
+        return [ledger[row] for row in self._get_time_index().between(start, end)]
+    
+    def get_rollup(self, period='month', start=None, end=None):
+        """Get income, expenses, net and count per 'day', 'week' or 'month'
+        
+        The buckets of a period are computed once and then updated as
+        transactions are added or removed.
+        """
+        rollup = self._rollups.get(period)
+        if rollup is None:
+            rollup = PeriodRollup(self.transactions, period)
+            self._rollups[period] = rollup
+        return rollup.summarize(start, end)
+    
+    def _get_search_index(self):
+        """Get the word index of the transactions, building it if needed"""
+        ledger = self.transactions
+        if self._search_index is None:
+            self._search_index = SearchIndex(ledger)
+        return self._search_index
+    
+    def search_rows(self, query='', category=None):
+        """Get the ledger rows whose description, category or tags contain every word of the query
+        
+        Query words match as prefixes, so partial input already finds
+        results. With a category ('' for uncategorized) only its rows are
+        searched.
+        """
+        return self._get_search_index().search(query, category)
+    
+    def search(self, query='', category=None):
+        """Get the transactions matching a query (see search_rows), in ledger order"""
+        ledger = self.transactions
+        return [ledger[row] for row in self.search_rows(query, category)]
+    
+    def complete_word(self, prefix):
+        """Get the description, category and tag words starting with a prefix"""
+        return self._get_search_index().complete(prefix.lower())
+    
+    def _get_category_totals(self):
+        """Get the per-category totals, computing them once"""
+        ledger = self.transactions
+        if self._category_totals is None:
+            self._category_totals = CategoryTotals(ledger)
+        return self._category_totals
+    
+    def get_category_totals(self):
+        """Get income, expenses, net and count per category, largest expenses first
+        
+        Uncategorized transactions are reported under ''. The totals are
+        computed once and then updated as transactions are added or removed.
+        """
+        return self._get_category_totals().summarize()
+    
+    def get_categories(self):
+        """Get the names of the categories in use, sorted"""
+        return self._get_category_totals().categories()
+    
+    def get_recurring_rules(self):
+        """Get the recurring transaction rules, in the order they were added"""
+        return list(self._recurring_rules)
+    
+    def add_recurring_rule(self, rule):
+        """Add a recurring transaction rule; its occurrences are added by post_recurring"""
+        if not isinstance(rule, RecurringRule):
+            raise ValueError("Rule must be an instance of RecurringRule")
+        self._recurring_rules.append(rule)
+        for forecast in self._forecasts.values():
+            forecast.add_rule(rule)
+        self._recurring_changed()
+    
+    def remove_recurring_rule(self, rule):
+        """Remove a recurring transaction rule; transactions it already added stay"""
+        try:
+            self._recurring_rules.remove(rule)
+        except ValueError:
+            raise ValueError("Rule does not belong to this profile")
+        for forecast in self._forecasts.values():
+            forecast.remove_rule(rule)
+        self._recurring_changed()
+    
+    def update_recurring_rule(self, rule, **changes):
+        """Replace a rule by a copy with some attributes changed (see RecurringRule.updated) and return it"""
+        try:
+            position = self._recurring_rules.index(rule)
+        except ValueError:
+            raise ValueError("Rule does not belong to this profile")
+        updated = rule.updated(**changes)
+        self._recurring_rules[position] = updated
+        for forecast in self._forecasts.values():
+            forecast.remove_rule(rule)
+            forecast.add_rule(updated)
+        self._recurring_changed()
+        return updated
+    
+    def _recurring_changed(self):
+        """Count a change of the recurring rules, so storage stores them on the next save"""
+        self.rule_change_count += 1
+    
+    def set_recurring_rules(self, rules):
+        """Replace the recurring rules with stored ones, e.g. merged from another process
+        
+        Unlike adding, updating or removing a rule, this is not counted as a
+        change to save.
+        """
+        self._recurring_rules = list(rules)
+        self._forecasts = {}
+    
+    def has_due_recurring(self, until=None):
+        """Check whether any rule has an occurrence dated before 'until' (default: now) not added yet"""
+        until = until if until is not None else datetime.now()
+        return any(rule.next_date is not None and rule.next_date < until for rule in self._recurring_rules)
+    
+    def post_recurring(self, until=None):
+        """Add the occurrences of every rule dated before 'until' (default: now) as transactions
+        
+        Each rule remembers its next occurrence, so every occurrence is added
+        once. Returns the added transactions, oldest rule first.
+        """
+        until = until if until is not None else datetime.now()
+        if not self.has_due_recurring(until):
+            return []
+        added = []
+        for rule in self._recurring_rules:
+            for moment in rule.pending(until):
+                transaction = rule.create_transaction(moment)
+                self.add_transaction(transaction)
+                added.append(transaction)
+            if rule.next_date is not None and rule.next_date < until:
+                rule.next_date = next(rule.occurrences(until), None)
+                for forecast in self._forecasts.values():
+                    forecast.remove_rule(rule)
+                    forecast.add_rule(rule)
+        self._recurring_changed()
+        return added
+    
+    def get_forecast(self, end, period='month'):
+        """Get the projected closing balance of every day, week or month from today until 'end'
+        
+        Starts from the current balance and adds transactions dated after
+        today and the occurrences of the recurring rules. A forecast is
+        built once per day and horizon, then kept up to date as
+        transactions and rules change (see BalanceForecast).
+        """
+        key = (period, end)
+        forecast = self._forecasts.get(key)
+        if forecast is None or forecast.today != date.today():
+            if forecast is not None:
+                # A new day: every cached horizon starts from the wrong day
+                self._forecasts = {}
+            forecast = self._forecasts[key] = BalanceForecast(self, end, period)
+        return forecast.points(self.get_balance())
     
     def to_dict(self):
         """Convert profile to dictionary for JSON serialization"""
-        return {
+        data = {
             'name': self.name,
             'created_date': self.created_date.isoformat(),
-            'transactions': [transaction.to_dict() for transaction in self.transactions]
+            'transactions': [transaction.to_dict() for transaction in self.transactions],
+            'next_id': self.transactions.next_id
         }
+        # Only written when set, so profiles without rules stay as before
+        if self._recurring_rules:
+            data['recurring'] = [rule.to_dict() for rule in self._recurring_rules]
+        return data
     
     @staticmethod
+    @instrumented('Profile.from_dict')
     def from_dict(data):
         """Create profile from dictionary"""
         profile = Profile(data['name'])
         profile.created_date = datetime.fromisoformat(data['created_date'])
+        profile._recurring_rules = [RecurringRule.from_dict(rule_data) for rule_data in data.get('recurring', ())]
         
-        # Load transactions
-        for transaction_data in data['transactions']:
-            transaction = Transaction.from_dict(transaction_data)
-            profile.transactions.append(transaction)
-            
+        # Load transactions straight into the ledger columns
+        profile.set_ledger(TransactionLedger.from_dicts(data['transactions'], data.get('next_id', 1)))
         return profile
     
     def __str__(self):
         """String representation of profile"""
-        return f"Profile: {self.name} - Balance: Rp {self.get_balance():,.2f} - Transactions: {len(self.transactions)}"
\ No newline at end of file
+        return f"Profile: {self.name} - Balance: {format_rupiah(self.get_balance())} - Transactions: {self.get_transaction_count()}"
\ No newline at end of file
@@ -0,0 +1,71 @@
+import unicodedata
+from .profile import Profile
+
+class ProfileRegistry:
+    """Profiles indexed by name, kept in the order they were added
+    
+    Lookup, membership tests and removal are dictionary operations. With
+    case_insensitive=True names are compared after Unicode normalization
+    and case folding, so 'Budi' and 'budi ' count as the same profile.
+    """
+    
+    def __init__(self, profiles=(), case_insensitive=False):
+        self.case_insensitive = case_insensitive
+        self._profiles = {}
+        self._sorted_names = None
+        for profile in profiles:
+            self.add(profile)
+    
+    def key(self, name):
+        """Get the lookup key of a profile name"""
+        if self.case_insensitive:
+            return unicodedata.normalize('NFKC', name).casefold().strip()
+        return name
+    
+    def add(self, profile):
+        """Register a profile, refusing duplicate names"""
+        if not isinstance(profile, Profile):
+            raise ValueError("Profile must be an instance of Profile class")
+        key = self.key(profile.name)
+        if key in self._profiles:
+            raise ValueError(f"Profile with name '{profile.name}' already exists")
+        self._profiles[key] = profile
+        self._sorted_names = None
+    
+    def unique_name(self, name):
+        """Get the name, or the first of 'name (2)', 'name (3)', ... no registered profile has"""
+        candidate = name
+        number = 2
+        while candidate in self:
+            candidate = f"{name} ({number})"
+            number += 1
+        return candidate
+    
+    def get(self, name):
+        """Get a profile by name, or None"""
+        return self._profiles.get(self.key(name))
+    
+    def remove(self, name):
+        """Remove and return the profile with the given name, or None"""
+        profile = self._profiles.pop(self.key(name), None)
+        if profile is not None:
+            self._sorted_names = None
+        return profile
+    
+    def names(self):
+        """Get the profile names in sorted order, cached until the registry changes"""
+        if self._sorted_names is None:
+            self._sorted_names = sorted((profile.name for profile in self._profiles.values()), key=str.casefold)
+        return self._sorted_names
+    
+    def __contains__(self, name):
+        return self.key(name) in self._profiles
+    
+    def __iter__(self):
+        return iter(list(self._profiles.values()))
+    
+    def __len__(self):
+        return len(self._profiles)
+    
+    def __repr__(self):
+        return f"ProfileRegistry({len(self)} profiles)"
\ No newline at end of file
@@ -0,0 +1,271 @@
+from array import array
+from bisect import bisect_right
+from calendar import monthrange
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+from .transaction import Income, Expense, normalize_tags
+from .time_index import PERIODS, period_start
+from .timestamps import from_timestamp
+from .formatting import format_rupiah
+from .instrumentation import instrumented
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+def add_months(moment, months):
+    """Move a datetime by whole months, keeping the day of the month where the month is long enough"""
+    month_index = moment.month - 1 + months
+    year = moment.year + month_index // 12
+    month = month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, monthrange(year, month)[1]))
+
+class RecurringRule:
+    """An income or expense repeating every 'interval' days, weeks, months or years
+    
+    Occurrences are computed from the start date when asked for and never
+    stored; monthly and yearly rules keep the start's day of the month,
+    falling back to the last day of shorter months. 'next_date' is the
+    first occurrence not yet added to the profile, None once the rule ended.
+    """
+    
+    def __init__(self, description, amount, transaction_type='Expense', frequency='monthly', interval=1,
+                 start=None, end=None, category='', tags=()):
+        transaction_type = transaction_type.capitalize()
+        if transaction_type not in ('Income', 'Expense'):
+            raise ValueError("Transaction type must be 'Income' or 'Expense'")
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency '{frequency}', expected one of {', '.join(FREQUENCIES)}")
+        if int(interval) < 1:
+            raise ValueError("Interval must be at least 1")
+        if not amount > 0:
+            raise ValueError("Amount must be greater than 0")
+        self.description = description
+        self.amount = amount
+        self.transaction_type = transaction_type
+        self.frequency = frequency
+        self.interval = int(interval)
+        self.start = start if start is not None else datetime.now()
+        if end is not None and end <= self.start:
+            raise ValueError("End date must be after the start date")
+        self.end = end
+        self.category = category.strip()
+        self.tags = normalize_tags(tags)
+        self.next_date = self.start
+    
+    def get_amount(self):
+        """Get the amount of each occurrence with the sign of its transaction type"""
+        return self.amount if self.transaction_type == 'Income' else -self.amount
+    
+    def occurrence(self, number):
+        """Get the date of the occurrence with the given number, 0 being the start"""
+        step = number * self.interval
+        if self.frequency == 'daily':
+            return self.start + timedelta(days=step)
+        if self.frequency == 'weekly':
+            return self.start + timedelta(weeks=step)
+        if self.frequency == 'monthly':
+            return add_months(self.start, step)
+        return add_months(self.start, 12 * step)
+    
+    def _first_number_from(self, moment):
+        """Get the number of the first occurrence on or after a moment, computed rather than stepped to"""
+        if moment <= self.start:
+            return 0
+        if self.frequency in ('daily', 'weekly'):
+            days = self.interval * (7 if self.frequency == 'weekly' else 1)
+            number = (moment - self.start) // timedelta(days=days)
+        else:
+            months = self.interval * (12 if self.frequency == 'yearly' else 1)
+            number = max(0, ((moment.year - self.start.year) * 12 + moment.month - self.start.month) // months - 1)
+        while self.occurrence(number) < moment:
+            number += 1
+        return number
+    
+    def occurrences(self, start=None, end=None):
+        """Generate the occurrence dates from start (inclusive) to end (exclusive), oldest first
+        
+        Without an end the generator only stops at the rule's own end date,
+        so callers asking for an open range must stop it themselves.
+        """
+        number = 0 if start is None else self._first_number_from(start)
+        while True:
+            moment = self.occurrence(number)
+            if end is not None and moment >= end or self.end is not None and moment >= self.end:
+                return
+            yield moment
+            number += 1
+    
+    def pending(self, end=None):
+        """Generate the occurrences not yet added to the profile, up to end (exclusive)"""
+        if self.next_date is None:
+            return iter(())
+        return self.occurrences(self.next_date, end)
+    
+    def updated(self, **changes):
+        """Get a copy with some constructor arguments changed, e.g. amount=...
+        
+        Occurrences before the next one not added yet stay added: the copy
+        continues from its first occurrence on or after that date.
+        """
+        values = {
+            'description': self.description,
+            'amount': self.amount,
+            'transaction_type': self.transaction_type,
+            'frequency': self.frequency,
+            'interval': self.interval,
+            'start': self.start,
+            'end': self.end,
+            'category': self.category,
+            'tags': self.tags
+        }
+        unknown = set(changes) - set(values)
+        if unknown:
+            raise ValueError(f"Recurring rules have no attribute '{sorted(unknown)[0]}'")
+        values.update(changes)
+        rule = RecurringRule(**values)
+        rule.next_date = next(rule.occurrences(self.next_date), None) if self.next_date is not None else None
+        return rule
+    
+    def create_transaction(self, moment):
+        """Create the transaction of the occurrence on a given date"""
+        transaction_class = Income if self.transaction_type == 'Income' else Expense
+        transaction = transaction_class(self.description, self.amount, self.category, self.tags)
+        transaction.date = moment
+        return transaction
+    
+    def describe_schedule(self):
+        """Get the schedule as text, e.g. 'monthly' or 'every 2 weeks'"""
+        if self.interval == 1:
+            return self.frequency
+        unit = {'daily': 'days', 'weekly': 'weeks', 'monthly': 'months', 'yearly': 'years'}[self.frequency]
+        return f"every {self.interval} {unit}"
+    
+    def to_dict(self):
+        """Convert the rule to a dictionary for JSON serialization"""
+        data = {
+            'type': self.transaction_type,
+            'description': self.description,
+            'amount': self.amount,
+            'frequency': self.frequency,
+            'interval': self.interval,
+            'start': self.start.isoformat(),
+            'next_date': self.next_date.isoformat() if self.next_date is not None else None
+        }
+        if self.end is not None:
+            data['end'] = self.end.isoformat()
+        if self.category:
+            data['category'] = self.category
+        if self.tags:
+            data['tags'] = list(self.tags)
+        return data
+    
+    @staticmethod
+    def from_dict(data):
+        """Create a rule from a dictionary"""
+        rule = RecurringRule(data['description'], data['amount'], data['type'], data['frequency'],
+                             data.get('interval', 1), datetime.fromisoformat(data['start']),
+                             datetime.fromisoformat(data['end']) if data.get('end') else None,
+                             data.get('category', ''), data.get('tags', ()))
+        next_date = data.get('next_date', data['start'])
+        rule.next_date = datetime.fromisoformat(next_date) if next_date is not None else None
+        return rule
+    
+    def __str__(self):
+        return f"{self.transaction_type}: {self.description} - {format_rupiah(self.amount)} {self.describe_schedule()}"
+
+class BalanceForecast:
+    """Projected balance at the end of every day, week or month from today up to a horizon
+    
+    The change per bucket is summed from the transactions dated after
+    today and the pending occurrences of every recurring rule (occurrences
+    already due but not added yet fall in the first bucket). Each rule's
+    share is kept, so adding, changing or removing a rule or a future
+    transaction only updates its own buckets; past transactions only move
+    the balance the curve starts from, which is read when it is asked for.
+    """
+    
+    @instrumented('BalanceForecast.build')
+    def __init__(self, profile, end, period='month', today=None):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+        today = today if today is not None else date.today()
+        self.period = period
+        self.today = today
+        # Transactions dated from here on are scheduled rather than part of the current balance
+        self.cutoff = datetime.combine(today + timedelta(days=1), time())
+        self.end = end if isinstance(end, datetime) else datetime.combine(end, time())
+        
+        self.keys = []
+        key = period_start(today, period)
+        while key < self.end.date():
+            self.keys.append(key)
+            key = self._next_key(key)
+        self.deltas = array('d', bytes(8 * len(self.keys)))
+        # Sum of every transaction dated after today, also beyond the horizon
+        self.scheduled = 0.0
+        self.rule_deltas = {}
+        
+        ledger = profile.transactions
+        for row in profile._get_time_index().between(self.cutoff):
+            amount = ledger.signed_amount(row)
+            self.scheduled += amount
+            position = self._position(from_timestamp(ledger.timestamps[row]))
+            if position is not None:
+                self.deltas[position] += amount
+        for rule in profile.get_recurring_rules():
+            self.add_rule(rule)
+    
+    def _next_key(self, key):
+        if self.period == 'day':
+            return key + timedelta(days=1)
+        if self.period == 'week':
+            return key + timedelta(weeks=1)
+        return add_months(key, 1)
+    
+    def _position(self, moment):
+        """Get the bucket of a date, the first one for dates before it, None past the horizon"""
+        if moment >= self.end:
+            return None
+        return max(0, bisect_right(self.keys, moment.date()) - 1)
+    
+    def add_rule(self, rule):
+        """Add the pending occurrences of a rule up to the horizon"""
+        deltas = array('d', bytes(8 * len(self.keys)))
+        amount = rule.get_amount()
+        for moment in rule.pending(self.end):
+            deltas[self._position(moment)] += amount
+        self.rule_deltas[rule] = deltas
+        for position, delta in enumerate(deltas):
+            if delta:
+                self.deltas[position] += delta
+    
+    def remove_rule(self, rule):
+        """Take a rule's occurrences back out"""
+        deltas = self.rule_deltas.pop(rule, None)
+        if deltas is not None:
+            for position, delta in enumerate(deltas):
+                if delta:
+                    self.deltas[position] -= delta
+    
+    def update_rule(self, rule):
+        """Recompute the occurrences of a rule that changed or had occurrences added to the profile"""
+        self.remove_rule(rule)
+        self.add_rule(rule)
+    
+    def add_transaction(self, transaction, sign=1):
+        """Account for an added (sign=1) or removed (sign=-1) transaction dated after today"""
+        if transaction.date < self.cutoff:
+            return
+        amount = sign * transaction.get_amount()
+        self.scheduled += amount
+        position = self._position(transaction.date)
+        if position is not None:
+            self.deltas[position] += amount
+    
+    def points(self, balance):
+        """Get the period start, change and projected closing balance of every bucket
+        
+        'balance' is the profile's current balance, future transactions included.
+        """
+        start = balance - self.scheduled
+        return [{'period': key, 'change': delta, 'balance': start + total}
+                for key, delta, total in zip(self.keys, self.deltas, accumulate(self.deltas))]
\ No newline at end of file
@@ -0,0 +1,94 @@
+from array import array
+from itertools import accumulate
+
+class RunningBalances:
+    """Balance after every ledger row, kept as a Fenwick (binary indexed) tree of the signed amounts
+    
+    Tree node i holds the sum of the rows (i - lowbit(i), i], so the
+    balance after a row adds up at most log2(n) nodes and changing one
+    row's amount updates at most log2(n) nodes instead of every later
+    balance. Appending is O(log n) too. Removing a row moves the rows
+    after it, so only their nodes are rebuilt.
+    """
+    
+    def __init__(self, amounts=()):
+        self.amounts = array('d', amounts)
+        self._build()
+    
+    def _build(self):
+        """Build the tree from the amounts in one pass, each node adding itself to its parent"""
+        tree = array('d', [0.0])
+        tree.extend(self.amounts)
+        size = len(self.amounts)
+        for node in range(1, size + 1):
+            parent = node + (node & -node)
+            if parent <= size:
+                tree[parent] += tree[node]
+        self.tree = tree
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    def append(self, amount):
+        """Add a row at the end"""
+        self.amounts.append(amount)
+        node = len(self.amounts)
+        # The new node also covers the rows of the nodes just below it
+        total = amount
+        child = node - 1
+        stop = node - (node & -node)
+        while child > stop:
+            total += self.tree[child]
+            child -= child & -child
+        self.tree.append(total)
+    
+    def set(self, row, amount):
+        """Change the signed amount of a row"""
+        delta = amount - self.amounts[row]
+        self.amounts[row] = amount
+        node = row + 1
+        size = len(self.amounts)
+        while node <= size:
+            self.tree[node] += delta
+            node += node & -node
+    
+    def remove(self, row):
+        """Remove a row; the rows after it move up
+        
+        Nodes before the row cover only earlier rows and keep their sums.
+        The later nodes are rebuilt from the amounts, adding the at most
+        log2(n) earlier nodes whose parents are among them, so removing
+        one of the latest rows is cheap.
+        """
+        del self.amounts[row]
+        size = len(self.amounts)
+        tree = self.tree
+        del tree[row + 1:]
+        tree.extend(self.amounts[row:])
+        child = row
+        while child > 0:
+            parent = child + (child & -child)
+            if parent <= size:
+                tree[parent] += tree[child]
+            child -= child & -child
+        for node in range(row + 1, size + 1):
+            parent = node + (node & -node)
+            if parent <= size:
+                tree[parent] += tree[node]
+    
+    def balance(self, row):
+        """Get the balance right after a row"""
+        total = 0.0
+        node = row + 1
+        while node > 0:
+            total += self.tree[node]
+            node -= node & -node
+        return total
+    
+    def balances(self, start=0, stop=None):
+        """Get the balances after the rows from start to stop (exclusive): one lookup, then a running sum"""
+        stop = len(self.amounts) if stop is None else min(stop, len(self.amounts))
+        if start >= stop:
+            return []
+        before = self.balance(start - 1) if start else 0.0
+        return list(accumulate(self.amounts[start:stop], initial=before))[1:]
\ No newline at end of file
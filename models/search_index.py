@@ -0,0 +1,214 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from .ledger import INCOME_FLAG
+from .instrumentation import instrumented
+
+_WORD = re.compile(r'\w+')
+
+def tokenize(text):
+    """Split text into lower-case words"""
+    return _WORD.findall(text.lower())
+
+class SearchIndex:
+    """Inverted index from words to ledger rows, searched by word prefix
+    
+    Words come from the description, category and tags of every row.
+    Ledgers repeat a small set of distinct descriptions, categories and
+    tags, so each word points at those values (keys) and each key holds
+    its rows in ascending order. A query word matches every indexed word
+    it is a prefix of, found by bisecting the sorted word list; rows must
+    match all query words.
+    """
+    
+    @instrumented('SearchIndex.build')
+    def __init__(self, ledger):
+        self.ledger = ledger
+        # key -> ascending rows; keys are ('description', id), ('category', id) and ('tag', tag)
+        self.postings = {}
+        # word -> keys whose text contains it
+        self.words = {}
+        self.sorted_words = []
+        
+        # One pass per column; rows of each key are collected in ascending order
+        columns = (('description', ledger.description_ids, ledger.descriptions),
+                   ('category', ledger.category_ids, ledger.categories))
+        for kind, ids, table in columns:
+            by_id = {}
+            for row, value_id in enumerate(ids):
+                rows = by_id.get(value_id)
+                if rows is None:
+                    rows = by_id[value_id] = array('I')
+                rows.append(row)
+            for value_id, rows in by_id.items():
+                if kind == 'description' or value_id:
+                    self._key_rows((kind, value_id), table[value_id]).extend(rows)
+        
+        tag_sets = ledger.tag_sets
+        for row, tag_set_id in enumerate(ledger.tag_set_ids):
+            if tag_set_id:
+                for tag in tag_sets[tag_set_id]:
+                    self._key_rows(('tag', tag), tag).append(row)
+    
+    def _key_rows(self, key, text):
+        """Get the rows of a key, indexing the words of its text the first time it is seen"""
+        rows = self.postings.get(key)
+        if rows is None:
+            rows = self.postings[key] = array('I')
+            for word in tokenize(text):
+                keys = self.words.get(word)
+                if keys is None:
+                    keys = self.words[word] = set()
+                    insort(self.sorted_words, word)
+                keys.add(key)
+        return rows
+    
+    def _row_keys(self, row):
+        """Get the (key, text) pairs a row is indexed under"""
+        ledger = self.ledger
+        description_id = ledger.description_ids[row]
+        keys = [(('description', description_id), ledger.descriptions[description_id])]
+        category_id = ledger.category_ids[row]
+        if category_id:
+            keys.append((('category', category_id), ledger.categories[category_id]))
+        keys.extend((('tag', tag), tag) for tag in ledger.tag_sets[ledger.tag_set_ids[row]])
+        return keys
+    
+    def add(self, row):
+        """Index a row that was appended to the ledger"""
+        for key, text in self._row_keys(row):
+            self._key_rows(key, text).append(row)
+    
+    def discard(self, row):
+        """Take a row out of the index before its description, category or tags change
+        
+        Keys left without rows are dropped, so their words are no longer
+        offered as completions.
+        """
+        for key, text in self._row_keys(row):
+            rows = self.postings[key]
+            position = bisect_left(rows, row)
+            if position < len(rows) and rows[position] == row:
+                del rows[position]
+            if not rows:
+                del self.postings[key]
+                for word in tokenize(text):
+                    keys = self.words[word]
+                    keys.discard(key)
+                    if not keys:
+                        del self.words[word]
+                        del self.sorted_words[bisect_left(self.sorted_words, word)]
+    
+    def insert(self, row):
+        """Index a row again after its values changed, keeping every key's rows in order"""
+        for key, text in self._row_keys(row):
+            rows = self._key_rows(key, text)
+            rows.insert(bisect_left(rows, row), row)
+    
+    def remove(self, row):
+        """Drop a row about to be removed from the ledger; the rows after it move up
+        
+        The words need not be tokenized again: only the rows after the
+        removed one are renumbered in each key.
+        """
+        self.discard(row)
+        for rows in self.postings.values():
+            position = bisect_right(rows, row)
+            if position < len(rows):
+                rows[position:] = array('I', [entry - 1 for entry in rows[position:]])
+    
+    def complete(self, prefix):
+        """Get the indexed words starting with a prefix, in sorted order"""
+        words = self.sorted_words
+        position = bisect_left(words, prefix)
+        matches = []
+        while position < len(words) and words[position].startswith(prefix):
+            matches.append(words[position])
+            position += 1
+        return matches
+    
+    def _prefix_rows(self, prefix):
+        """Get the set of rows with any word starting with a prefix"""
+        keys = set()
+        for word in self.complete(prefix):
+            keys.update(self.words[word])
+        return set().union(*(self.postings[key] for key in keys))
+    
+    def category_rows(self, category):
+        """Get the rows of a category in ascending order"""
+        category_id = self.ledger.find_category(category)
+        if category_id < 0:
+            return array('I')
+        if category_id == 0:
+            return array('I', (row for row, row_category in enumerate(self.ledger.category_ids) if not row_category))
+        return self.postings.get(('category', category_id), array('I'))
+    
+    def search(self, query, category=None):
+        """Get the rows matching every word of a query as a prefix, in ascending order
+        
+        With a category only rows of that category ('' for uncategorized)
+        are returned; an empty query then lists the whole category.
+        """
+        prefixes = tokenize(query)
+        if not prefixes:
+            if category is None:
+                return list(range(len(self.ledger)))
+            return list(self.category_rows(category))
+        
+        # Start from the most selective word so intersections stay small
+        row_sets = sorted((self._prefix_rows(prefix) for prefix in set(prefixes)), key=len)
+        rows = row_sets[0]
+        for other in row_sets[1:]:
+            if not rows:
+                break
+            rows = rows.intersection(other)
+        if category is not None and rows:
+            rows = rows.intersection(self.category_rows(category))
+        return sorted(rows)
+
+class CategoryTotals:
+    """Income, expenses and transaction count per category
+    
+    Built with one pass over the ledger columns, then kept up to date as
+    transactions are added or removed, so breakdowns only read the totals.
+    Uncategorized transactions are counted under ''.
+    """
+    
+    def __init__(self, ledger):
+        per_id = {}
+        for category_id, amount, type_flag in zip(ledger.category_ids, ledger.amounts, ledger.type_flags):
+            totals = per_id.get(category_id)
+            if totals is None:
+                totals = per_id[category_id] = [0, 0, 0]
+            totals[0 if type_flag == INCOME_FLAG else 1] += amount
+            totals[2] += 1
+        # category -> [income, expenses, count]
+        self.totals = {ledger.categories[category_id]: totals for category_id, totals in per_id.items()}
+    
+    def add(self, transaction, sign=1):
+        """Add (sign=1) or subtract (sign=-1) a transaction from its category"""
+        totals = self.totals.get(transaction.category)
+        if totals is None:
+            totals = self.totals[transaction.category] = [0, 0, 0]
+        totals[0 if transaction.get_type() == "Income" else 1] += sign * transaction.amount
+        totals[2] += sign
+        if totals[2] == 0:
+            del self.totals[transaction.category]
+    
+    def categories(self):
+        """Get the categories in use, sorted by name"""
+        return sorted(category for category in self.totals if category)
+    
+    def summarize(self):
+        """Get the totals of every category, largest expenses first"""
+        summary = []
+        for category, (income, expenses, count) in self.totals.items():
+            summary.append({
+                'category': category,
+                'income': income,
+                'expenses': expenses,
+                'net': income - expenses,
+                'count': count
+            })
+        summary.sort(key=lambda totals: (-totals['expenses'], -totals['income'], totals['category']))
+        return summary
\ No newline at end of file
@@ -0,0 +1,398 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from functools import partial
+from .profile import Profile
+from .transaction import Transaction
+from .recurring import RecurringRule
+from .ledger import TransactionLedger
+from .file_lock import FileLock
+from .instrumentation import instrumented, span, increment
+from .binary_snapshot import dump_binary_snapshot, read_binary_index, read_binary_ledger
+from .storage import Storage, JSONStorage
+
+MANIFEST_VERSION = 1
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_-]+')
+
+def profile_key(name):
+    """Get the file name stem of a profile: a readable slug plus a hash of the exact name
+    
+    The hash keeps names apart that only differ in case or in characters
+    the file system does not allow.
+    """
+    slug = _UNSAFE.sub('_', name).strip('_')[:40] or 'profile'
+    return f"{slug}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]}"
+
+class ShardedStorage(Storage):
+    """Storage backend keeping every profile in its own files, listed in a small manifest
+    
+    Each profile has a binary shard with its transactions as of its last
+    compaction and an append-only log (JSON lines) of the transactions
+    added, edited or deleted since. Saving only touches the profiles that
+    changed: new transactions and edits are appended to their log, changed
+    recurring rules are only written to the manifest, and a removed
+    profile's files are deleted. The manifest (profile order, totals, next
+    transaction ids, file names and valid log length) is replaced
+    atomically last, so it is the commit point: files it does not point
+    at, or log lines past its length, are ignored.
+    
+    Profiles are read from their shard only when first accessed, unless
+    lazy=False. A profile's log is folded into a new shard once it holds
+    more than 'compact_threshold' transactions and on close.
+    """
+    
+    stores_edits = True
+    stores_rules = True
+    
+    def __init__(self, directory, compact_threshold=1000, lazy=True):
+        super().__init__()
+        self.directory = directory
+        self.data_file = os.path.join(directory, 'manifest.json')
+        self.file_lock = FileLock(self.data_file + '.lock')
+        self.compact_threshold = compact_threshold
+        self.lazy = lazy
+        # name -> manifest entry of the stored data the loaded profiles reflect
+        self._entries = {}
+        self._sequence = 0
+        self._generation = None
+    
+    def locked(self, exclusive=True, blocking=True):
+        """Hold the data lock shared with other processes"""
+        return self.file_lock.acquire(exclusive=exclusive, blocking=blocking)
+    
+    def _path(self, file_name):
+        return os.path.join(self.directory, file_name)
+    
+    @staticmethod
+    def _shard_name(entry):
+        return f"{entry['key']}.{entry['shard']}.shard"
+    
+    @staticmethod
+    def _log_name(entry):
+        return f"{entry['key']}.{entry['shard']}.log"
+    
+    def _read_manifest(self):
+        """Get (manifest entries in order, revision sequence) of the stored data"""
+        if not os.path.exists(self.data_file):
+            return [], 0
+        with open(self.data_file, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version', 1) > MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {manifest['version']}")
+        return manifest['profiles'], manifest.get('sequence', 0)
+    
+    def _write_manifest(self, entries):
+        """Replace the manifest atomically and bump the generation other processes watch"""
+        manifest = {'version': MANIFEST_VERSION, 'sequence': self._sequence, 'profiles': entries}
+        temp_file = self.data_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.data_file)
+        self._generation = self.file_lock.bump_generation()
+    
+    @instrumented('storage.load_profiles')
+    def load_profiles(self):
+        """Create the profiles listed in the manifest, reading their transactions on first access"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.file_lock.acquire(exclusive=False):
+            entries, self._sequence = self._read_manifest()
+            self._generation = self.file_lock.read_generation()
+        self._entries = {entry['name']: entry for entry in entries}
+        self._revisions = {entry['name']: entry['revision'] for entry in entries}
+        
+        profiles = [self._lazy_profile(entry) for entry in entries]
+        increment('storage.profiles_loaded', len(profiles))
+        self.mark_saved(profiles)
+        return profiles
+    
+    def _lazy_profile(self, entry):
+        """Create a profile from a manifest entry, reading its files only when needed"""
+        profile = Profile.lazy(entry['name'], datetime.fromisoformat(entry['created_date']),
+                               entry['transaction_count'], entry['total_income'], entry['total_expenses'],
+                               partial(self._read_profile_ledger, entry),
+                               [RecurringRule.from_dict(rule_data) for rule_data in entry.get('recurring', ())])
+        if not self.lazy:
+            profile.ensure_loaded()
+        return profile
+    
+    @instrumented('storage.read_lazy_profile')
+    def _read_profile_ledger(self, entry):
+        """Read the transactions a manifest entry points at: its shard, then the valid part of its log"""
+        with self.file_lock.acquire(exclusive=False):
+            try:
+                return self._read_entry_ledger(entry)
+            except FileNotFoundError:
+                pass
+            # Another process compacted or replaced the profile since: its stored data
+            # starts with the transactions known here, later ones come with the next merge
+            current = {disk_entry['name']: disk_entry for disk_entry in self._read_manifest()[0]}
+            if entry['name'] not in current:
+                return TransactionLedger()
+            ledger = self._read_entry_ledger(current[entry['name']])
+        if len(ledger) > entry['transaction_count']:
+            known = TransactionLedger()
+            known.append_rows(ledger, 0, entry['transaction_count'])
+            known.reserve_ids(ledger.next_id)
+            ledger = known
+        return ledger
+    
+    def _read_entry_ledger(self, entry):
+        """Read a profile's shard and log as they are on disk; the lock must be held"""
+        path = self._path(self._shard_name(entry))
+        with open(path, 'rb') as file:
+            index = read_binary_index(path)[0]
+            ledger = read_binary_ledger(file, index[0]) if index else TransactionLedger()
+        ledger.reserve_ids(entry.get('next_id', 1))
+        if entry['log_count']:
+            with open(self._path(self._log_name(entry)), 'rb') as file:
+                lines = file.read(entry['log_bytes']).decode('utf-8').splitlines()
+            additions = []
+            for line in lines:
+                data = json.loads(line)
+                if 'op' not in data:
+                    additions.append(data)
+                    continue
+                ledger.append_dicts(additions)
+                additions = []
+                if data['op'] == 'update':
+                    row = ledger.find_id(data['transaction']['id'])
+                    if row >= 0:
+                        ledger.set_row(row, Transaction.from_dict(data['transaction']))
+                elif data['op'] == 'remove':
+                    row = ledger.find_id(data['id'])
+                    if row >= 0:
+                        ledger.pop(row)
+            ledger.append_dicts(additions)
+        return ledger
+    
+    @instrumented('storage.save_profiles')
+    def save_profiles(self, profiles):
+        """Store only the profiles added, changed or removed since the last save
+        
+        Raises RuntimeError if another process stored changes that have not
+        been merged with merge_external_changes, instead of overwriting them.
+        """
+        changed = self.changed_names(profiles)
+        if not changed:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self.file_lock.acquire():
+            if self._generation is not None and self.file_lock.read_generation() != self._generation:
+                raise RuntimeError("Data was changed by another process; merge those changes before saving")
+            
+            rule_changes = self.collect_rule_changes(profiles)
+            # Edits come first in the log, so replaying it finds the rows they refer to
+            log_lines = {}
+            for profile, transactions, removed_ids in self.collect_edits(profiles):
+                log_lines[profile.name] = (
+                    [{'op': 'remove', 'id': transaction_id} for transaction_id in removed_ids]
+                    + [{'op': 'update', 'transaction': transaction.to_dict()} for transaction in transactions])
+            added_profiles, new_transactions, removed_names = self.collect_changes(profiles)
+            obsolete = []
+            for name in removed_names:
+                entry = self._entries.pop(name, None)
+                if entry is not None:
+                    obsolete.append(entry)
+            replaced = {entry['name']: entry for entry in obsolete}
+            for profile in added_profiles:
+                self._sequence += 1
+                self._entries[profile.name] = self._write_shard(profile, self._sequence, replaced.get(profile.name))
+            for profile, transactions in new_transactions:
+                log_lines.setdefault(profile.name, []).extend(transaction.to_dict() for transaction in transactions)
+            for profile in profiles:
+                lines = log_lines.get(profile.name)
+                if not lines:
+                    continue
+                entry = self._entries[profile.name]
+                if entry['log_count'] + len(lines) > self.compact_threshold:
+                    obsolete.append(entry)
+                    entry = self._write_shard(profile, entry['revision'], entry)
+                else:
+                    entry = self._append_log(profile, entry, lines)
+                # Other processes see edits that keep the transaction count by this counter
+                edit_count = sum('op' in line for line in lines)
+                if edit_count:
+                    entry['edits'] = entry.get('edits', 0) + edit_count
+                self._entries[profile.name] = entry
+            for profile in rule_changes:
+                # The manifest carries the rules, so the shard and log stay as they are
+                entry = self._entries[profile.name] = dict(self._entries[profile.name])
+                self._set_rule_dicts(entry, [rule.to_dict() for rule in profile.get_recurring_rules()])
+            
+            self._commit(profiles, obsolete)
+            increment('storage.profiles_saved', len(added_profiles) + len(log_lines) + len(rule_changes))
+    
+    def _write_shard(self, profile, revision, previous=None):
+        """Write a profile's transactions as a new shard file and return its manifest entry
+        
+        The shard number follows the 'previous' entry's, so the files the
+        current manifest points at are never overwritten.
+        """
+        entry = {
+            'name': profile.name,
+            'created_date': profile.created_date.isoformat(),
+            'key': profile_key(profile.name),
+            'revision': revision,
+            'shard': previous['shard'] + 1 if previous is not None else 1,
+            'log_count': 0,
+            'log_bytes': 0
+        }
+        if previous is not None and previous.get('edits'):
+            entry['edits'] = previous['edits']
+        # The manifest carries the rules, so they are known without reading the shard
+        if profile.get_recurring_rules():
+            entry['recurring'] = [rule.to_dict() for rule in profile.get_recurring_rules()]
+        temp_file = self._path(self._shard_name(entry) + '.tmp')
+        with open(temp_file, 'wb') as file, span('storage.write_shard'):
+            dump_binary_snapshot([(profile.name, entry['created_date'], profile.transactions, None)], file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self._path(self._shard_name(entry)))
+        return self._with_totals(entry, profile)
+    
+    def _append_log(self, profile, entry, lines):
+        """Append transaction and edit dictionaries to a profile's log and return its updated manifest entry"""
+        data = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines).encode('utf-8')
+        with open(self._path(self._log_name(entry)), 'ab') as file:
+            # Drop lines an interrupted save wrote past what the manifest accepted
+            file.truncate(entry['log_bytes'])
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        entry = dict(entry, log_count=entry['log_count'] + len(lines),
+                     log_bytes=entry['log_bytes'] + len(data))
+        return self._with_totals(entry, profile)
+    
+    @staticmethod
+    def _with_totals(entry, profile):
+        entry['transaction_count'] = profile.get_transaction_count()
+        entry['total_income'] = profile.get_total_income()
+        entry['total_expenses'] = profile.get_total_expenses()
+        # Kept so ids of deleted transactions are not given out again after a reload
+        entry['next_id'] = profile.transactions.next_id
+        return entry
+    
+    def _commit(self, profiles, obsolete):
+        """Write the manifest for the current profiles, then delete the files it no longer uses"""
+        self._write_manifest([self._entries[profile.name] for profile in profiles])
+        self._revisions = {name: entry['revision'] for name, entry in self._entries.items()}
+        self.mark_saved(profiles)
+        in_use = {self._shard_name(entry) for entry in self._entries.values()}
+        for entry in obsolete:
+            for file_name in (self._shard_name(entry), self._log_name(entry)):
+                if file_name not in in_use:
+                    try:
+                        os.remove(self._path(file_name))
+                    except FileNotFoundError:
+                        pass
+    
+    def compact(self, profiles, background=False):
+        """Save, then fold the log of every loaded profile into a new shard
+        
+        Profiles that were never read cannot have gained transactions here,
+        so their logs are left for a later compaction.
+        """
+        self.save_profiles(profiles)
+        with self.file_lock.acquire():
+            obsolete = []
+            for profile in profiles:
+                entry = self._entries[profile.name]
+                if entry['log_count'] and profile.is_loaded():
+                    obsolete.append(entry)
+                    self._entries[profile.name] = self._write_shard(profile, entry['revision'], entry)
+            if obsolete:
+                self._commit(profiles, obsolete)
+    
+    @instrumented('storage.merge_external_changes')
+    def merge_external_changes(self, profiles):
+        """Merge changes other processes stored since the last load or save
+        
+        Only the profiles whose manifest entry changed are read. Profiles
+        replaced, edited or removed elsewhere win over unsaved additions;
+        edits and deletions made here are applied on top of the stored
+        ones by transaction id (see Storage._merge_edited).
+        """
+        with self.file_lock.acquire(exclusive=False):
+            if self._generation is None or self.file_lock.read_generation() == self._generation:
+                return None
+            entries, self._sequence = self._read_manifest()
+            self._generation = self.file_lock.read_generation()
+            
+            by_name = {profile.name: profile for profile in profiles}
+            disk_names = set()
+            for entry in entries:
+                name = entry['name']
+                disk_names.add(name)
+                local = by_name.get(name)
+                known = name in self._saved_counts
+                count = entry['transaction_count']
+                saved_count = self._saved_counts.get(name)
+                replaced = (not known or entry['revision'] != self._revisions.get(name) or count < saved_count
+                            or entry.get('edits', 0) != self._entries.get(name, {}).get('edits', 0))
+                if not replaced and count == saved_count:
+                    self._entries[name] = entry
+                    if local is not None:
+                        self._merge_rules(local, entry.get('recurring', []))
+                    continue
+                
+                if local is None:
+                    if not known:
+                        by_name[name] = self._adopt_stored(None, self._lazy_profile(entry))
+                    # Otherwise it was removed here and the next save removes it on disk too
+                elif not local.is_loaded():
+                    # Nothing was added here yet, so the stored version can be taken as it is
+                    by_name[name] = self._adopt_stored(local, self._lazy_profile(entry))
+                elif not known:
+                    # Created here too: keep both sides' transactions and store the whole profile again
+                    self._merge_transactions(local, 0, self._read_entry_ledger(entry))
+                    self._rewrite_names.add(name)
+                elif name in self._rewrite_names or self._has_unsaved_edits(local):
+                    # Transactions were edited or removed here: those edits go on top of the stored ones
+                    self._merge_edited(local, count, self._read_entry_ledger(entry))
+                elif replaced:
+                    ledger = self._read_entry_ledger(entry)
+                    ledger.append_rows(local.transactions, saved_count)
+                    ledger.reserve_ids(local.transactions.next_id)
+                    local.set_ledger(ledger)
+                else:
+                    stored = self._read_entry_ledger(entry)
+                    self._merge_transactions(local, saved_count, stored[saved_count:count])
+                if local is not None and local.is_loaded():
+                    self._merge_rules(local, entry.get('recurring', []))
+                self._saved_counts[name] = count
+                self._revisions[name] = entry['revision']
+                self._entries[name] = entry
+            
+            for name in list(self._saved_counts):
+                if name not in disk_names:
+                    # Removed by another process
+                    del self._saved_counts[name]
+                    self._rewrite_names.discard(name)
+                    self._saved_edits.pop(name, None)
+                    self._saved_rules.pop(name, None)
+                    self._pending_edits.pop(name, None)
+                    self._entries.pop(name, None)
+                    by_name.pop(name, None)
+            
+            # Keep the stored order, with profiles added here at the end
+            order = {entry['name']: position for position, entry in enumerate(entries)}
+            return sorted(by_name.values(), key=lambda profile: order.get(profile.name, len(order)))
+    
+    def close(self, profiles):
+        """Save pending changes and fold the logs into shards"""
+        self.compact(profiles)
+        self.file_lock.close()
+
+def migrate_to_shards(json_file, directory):
+    """Copy every profile from a JSON data file (and its journal) into a sharded directory"""
+    profiles = JSONStorage(json_file, use_journal=True).load_profiles()
+    storage = ShardedStorage(directory)
+    if storage.load_profiles():
+        raise ValueError(f"'{directory}' already contains profiles")
+    storage.save_profiles(profiles)
+    return profiles
\ No newline at end of file
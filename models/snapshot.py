@@ -0,0 +1,152 @@
+import json
+import mmap
+import os
+import re
+
+# Strings (with escapes) and the structural characters that change nesting depth
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]', re.DOTALL)
+
+def summarize_profile(profile_data):
+    """Get the index entry fields of a raw profile dictionary"""
+    total_income = 0
+    total_expenses = 0
+    for transaction_data in profile_data['transactions']:
+        if transaction_data['type'] == 'Income':
+            total_income += transaction_data['amount']
+        else:
+            total_expenses += transaction_data['amount']
+    
+    entry = {
+        'name': profile_data['name'],
+        'created_date': profile_data['created_date'],
+        'transaction_count': len(profile_data['transactions']),
+        'total_income': total_income,
+        'total_expenses': total_expenses
+    }
+    # Recurring rules are small, so lazily loaded profiles get them from the index
+    if profile_data.get('recurring'):
+        entry['recurring'] = profile_data['recurring']
+    return entry
+
+def dump_snapshot(profiles, file, indent=None, extra=None):
+    """Write raw profile dictionaries as a snapshot and return its profile index
+    
+    The output matches json.dump of {'profiles': [...], **extra}; each
+    index entry records the byte span of one profile so it can later be
+    parsed on its own. 'profiles' may be a generator, so only one profile
+    needs to be in memory at a time.
+    """
+    newline = '\n' if indent is not None else ''
+    item_indent = ' ' * (2 * indent) if indent is not None else ''
+    key_indent = ' ' * indent if indent is not None else ''
+    item_separator = ',' if indent is not None else ', '
+    
+    def write(text):
+        file.write(text.encode('utf-8'))
+    
+    entries = []
+    write('{' + newline + key_indent + '"profiles": [')
+    for position, profile_data in enumerate(profiles):
+        write((item_separator if position else '') + newline + item_indent)
+        encoded = json.dumps(profile_data, indent=indent, ensure_ascii=False)
+        if indent is not None:
+            encoded = encoded.replace('\n', '\n' + item_indent)
+        encoded = encoded.encode('utf-8')
+        
+        entry = summarize_profile(profile_data)
+        entry['offset'] = file.tell()
+        entry['length'] = len(encoded)
+        entries.append(entry)
+        file.write(encoded)
+    
+    if entries:
+        write(newline + key_indent)
+    write(']')
+    for key, value in (extra or {}).items():
+        write(item_separator + newline + key_indent + json.dumps(key) + ': '
+              + json.dumps(value, indent=indent, ensure_ascii=False))
+    write(newline + '}')
+    return entries
+
+def index_path(data_file):
+    """Get the path of the profile index stored next to a snapshot"""
+    return data_file + '.index'
+
+def snapshot_stamp(data_file):
+    """Identify the exact snapshot file version by size and modification time"""
+    stat = os.stat(data_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def write_index(data_file, entries, extra=None):
+    """Store the profile index of a freshly written snapshot"""
+    index = {'snapshot': snapshot_stamp(data_file), 'profiles': entries}
+    index.update(extra or {})
+    temp_file = f"{index_path(data_file)}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(index, file, ensure_ascii=False)
+    os.replace(temp_file, index_path(data_file))
+
+def read_index(data_file):
+    """Get the stored index of a snapshot, or None if it is missing or stale"""
+    try:
+        with open(index_path(data_file), 'r', encoding='utf-8') as file:
+            index = json.load(file)
+        if index.get('snapshot') == snapshot_stamp(data_file):
+            return index
+    except (OSError, ValueError):
+        pass
+    return None
+
+def scan_snapshot(data_file):
+    """Build a snapshot index by streaming over the file
+    
+    Only one profile is parsed at a time, so the whole document never
+    has to be held in memory.
+    """
+    entries = []
+    extra = {}
+    if os.path.getsize(data_file) == 0:
+        return entries, extra
+    
+    with open(data_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        depth = 0
+        last_key = None
+        in_profiles = False
+        start = None
+        profiles_end = None
+        for match in _TOKEN.finditer(view):
+            token = match.group()
+            if token[:1] == b'"':
+                if depth == 1:
+                    last_key = token
+                continue
+            if token in (b'{', b'['):
+                depth += 1
+                if depth == 2 and token == b'[' and last_key == b'"profiles"':
+                    in_profiles = True
+                elif depth == 3 and in_profiles:
+                    start = match.start()
+            else:
+                if depth == 3 and in_profiles:
+                    profile_data = json.loads(view[start:match.end()].decode('utf-8'))
+                    entry = summarize_profile(profile_data)
+                    entry['offset'] = start
+                    entry['length'] = match.end() - start
+                    entries.append(entry)
+                elif depth == 2 and in_profiles:
+                    in_profiles = False
+                    profiles_end = match.end()
+                depth -= 1
+        
+        # Small keys such as journal_seq are written after the profiles array
+        if profiles_end is not None:
+            tail = view[profiles_end:].decode('utf-8').strip()
+            if tail.startswith(','):
+                extra = json.loads('{' + tail[1:])
+    
+    return entries, extra
+
+def read_profile(file, entry):
+    """Parse the single profile an index entry points at in an open snapshot file"""
+    file.seek(entry['offset'])
+    return json.loads(file.read(entry['length']).decode('utf-8'))
\ No newline at end of file
@@ -0,0 +1,315 @@
+import sqlite3
+import threading
+from datetime import datetime
+from functools import partial
+from .profile import Profile
+from .ledger import TransactionLedger
+from .recurring import RecurringRule
+from .storage import Storage, JSONStorage
+from .timestamps import parse_timestamp
+
+class SQLiteStorage(Storage):
+    """Storage backend keeping profiles and transactions in a SQLite database
+    
+    Profiles are created from SQL aggregates (count and totals), so
+    balances and summaries never read transaction rows; a profile's rows
+    are read with one indexed query when it is first accessed, unless
+    lazy=False. Per-category totals of profiles that were not read are
+    summed in SQL as well.
+    Transactions are stored with their profile-local id, so an edit or
+    deletion updates or deletes just that row; the profile row keeps the
+    next id to give out, so ids of deleted transactions are not reused.
+    Dates are stored as integer microseconds since the epoch, like the
+    ledger keeps them, so rows are read without parsing dates.
+    """
+    
+    stores_edits = True
+    stores_rules = True
+    
+    # Also used to rebuild the transactions table of databases that stored dates as text
+    TRANSACTIONS_TABLE = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            profile_id INTEGER NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+            type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            timestamp INTEGER NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            tags TEXT NOT NULL DEFAULT '',
+            transaction_id INTEGER
+        );
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created_date TEXT NOT NULL
+        );
+    """ + TRANSACTIONS_TABLE.format(name='transactions') + """
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY,
+            profile_id INTEGER NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+            type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT,
+            category TEXT NOT NULL DEFAULT '',
+            tags TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_transactions_profile_type ON transactions(profile_id, type);
+    """
+    
+    # Columns added after the first release per table, with their definitions for ALTER TABLE
+    ADDED_COLUMNS = {
+        'transactions': {
+            'category': "TEXT NOT NULL DEFAULT ''",
+            'tags': "TEXT NOT NULL DEFAULT ''",
+            'transaction_id': "INTEGER"
+        },
+        'profiles': {
+            'next_transaction_id': "INTEGER NOT NULL DEFAULT 1"
+        }
+    }
+    
+    def __init__(self, data_file='data/financial_data.db', lazy=True):
+        super().__init__()
+        self.data_file = data_file
+        self.lazy = lazy
+        self._connection = None
+        # Profiles read their transactions on whichever thread first needs them
+        self._lock = threading.RLock()
+    
+    @property
+    def connection(self):
+        """Open the database on first use and make sure the schema exists"""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.data_file, check_same_thread=False)
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(self.SCHEMA)
+            self._add_missing_columns()
+        return self._connection
+    
+    def _add_missing_columns(self):
+        """Upgrade a database created before the category, tags, transaction id and next id columns existed
+        
+        Transactions of databases that stored dates as ISO text are
+        rewritten with integer timestamps.
+        """
+        with self._connection:
+            for table, columns in self.ADDED_COLUMNS.items():
+                existing = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+                for name, definition in columns.items():
+                    if name not in existing:
+                        self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            if any(row[1] == 'date' for row in self._connection.execute("PRAGMA table_info(transactions)")):
+                self._convert_dates()
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_profile_timestamp ON transactions(profile_id, timestamp)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_profile_category ON transactions(profile_id, category)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_profile_transaction "
+                "ON transactions(profile_id, transaction_id)")
+    
+    def _convert_dates(self):
+        """Rebuild the transactions table with timestamps in place of the ISO date column"""
+        rows = self._connection.execute(
+            "SELECT id, profile_id, type, description, amount, date, category, tags, transaction_id "
+            "FROM transactions").fetchall()
+        self._connection.execute(self.TRANSACTIONS_TABLE.format(name='transactions_converted'))
+        self._connection.executemany(
+            "INSERT INTO transactions_converted (id, profile_id, type, description, amount, timestamp, category, "
+            "tags, transaction_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [row[:5] + (parse_timestamp(row[5]),) + row[6:] for row in rows])
+        self._connection.execute("DROP TABLE transactions")
+        self._connection.execute("ALTER TABLE transactions_converted RENAME TO transactions")
+        self._connection.execute("CREATE INDEX idx_transactions_profile_type ON transactions(profile_id, type)")
+    
+    def load_profiles(self):
+        """Create all profiles from per-profile SQL aggregates, reading their transactions on first access
+        
+        With lazy=False every profile's transactions are read right away.
+        """
+        rules = {}
+        with self._lock:
+            for row in self.connection.execute(
+                    "SELECT profile_id, type, description, amount, frequency, interval, start_date, end_date, "
+                    "next_date, category, tags FROM recurring_rules ORDER BY id"):
+                profile_id, transaction_type, description, amount, frequency, interval, start, end, next_date, \
+                    category, tags = row
+                rules.setdefault(profile_id, []).append(RecurringRule.from_dict({
+                    'type': transaction_type,
+                    'description': description,
+                    'amount': amount,
+                    'frequency': frequency,
+                    'interval': interval,
+                    'start': start,
+                    'end': end,
+                    'next_date': next_date,
+                    'category': category,
+                    'tags': tags.split(',') if tags else ()
+                }))
+            rows = self.connection.execute("""
+                SELECT p.id, p.name, p.created_date, p.next_transaction_id, COUNT(t.id),
+                       COALESCE(SUM(CASE WHEN t.type = 'Income' THEN t.amount ELSE 0 END), 0),
+                       COALESCE(SUM(CASE WHEN t.type = 'Income' THEN 0 ELSE t.amount END), 0)
+                FROM profiles p LEFT JOIN transactions t ON t.profile_id = p.id
+                GROUP BY p.id ORDER BY p.id""").fetchall()
+        
+        profiles = [Profile.lazy(name, datetime.fromisoformat(created_date), count, total_income, total_expenses,
+                                 partial(self._read_ledger, profile_id, next_id), rules.get(profile_id, ()))
+                    for profile_id, name, created_date, next_id, count, total_income, total_expenses in rows]
+        if not self.lazy:
+            for profile in profiles:
+                profile.ensure_loaded()
+        self.mark_saved(profiles)
+        return profiles
+    
+    def _read_ledger(self, profile_id, next_id=1):
+        """Read one profile's transactions in insertion order with a single indexed query"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT id, transaction_id, type, description, amount, timestamp, category, tags FROM transactions "
+                "WHERE profile_id = ? ORDER BY id", (profile_id,)).fetchall()
+            ledger = TransactionLedger()
+            ledger.append_dicts({
+                'id': transaction_id,
+                'type': transaction_type,
+                'description': description,
+                'amount': amount,
+                'timestamp': timestamp,
+                'category': category,
+                'tags': tags.split(',') if tags else ()
+            } for _, transaction_id, transaction_type, description, amount, timestamp, category, tags in rows)
+            ledger.reserve_ids(next_id)
+            # Rows stored before transaction ids existed get the ids the ledger gave them
+            renumbered = [(transaction_id, row[0]) for row, transaction_id in zip(rows, ledger.ids)
+                          if row[1] != transaction_id]
+            if renumbered:
+                with self.connection:
+                    self.connection.executemany("UPDATE transactions SET transaction_id = ? WHERE id = ?",
+                                                renumbered)
+        return ledger
+    
+    def save_profiles(self, profiles):
+        """Insert, update or delete only the profiles and transactions changed since the last save"""
+        edits = self.collect_edits(profiles)
+        rule_changes = self.collect_rule_changes(profiles)
+        added_profiles, new_transactions, removed_names = self.collect_changes(profiles)
+        if not (added_profiles or new_transactions or removed_names or edits or rule_changes):
+            return
+        
+        with self._lock, self.connection:
+            for name in removed_names:
+                self.connection.execute("DELETE FROM profiles WHERE name = ?", (name,))
+            
+            for profile, transactions, removed_ids in edits:
+                profile_id = self._profile_id(profile.name)
+                self.connection.executemany(
+                    "DELETE FROM transactions WHERE profile_id = ? AND transaction_id = ?",
+                    [(profile_id, transaction_id) for transaction_id in removed_ids])
+                if removed_ids:
+                    # The ids of deleted rows are not given out again after a reload
+                    self.connection.execute("UPDATE profiles SET next_transaction_id = ? WHERE id = ?",
+                                            (profile.transactions.next_id, profile_id))
+                self.connection.executemany(
+                    "UPDATE transactions SET type = ?, description = ?, amount = ?, timestamp = ?, category = ?, tags = ? "
+                    "WHERE profile_id = ? AND transaction_id = ?",
+                    [(transaction.get_type(), transaction.description, transaction.amount,
+                      transaction.timestamp, transaction.category, ','.join(transaction.tags),
+                      profile_id, transaction.id)
+                     for transaction in transactions])
+            
+            for profile in added_profiles:
+                self.connection.execute(
+                    "INSERT INTO profiles (name, created_date, next_transaction_id) VALUES (?, ?, ?)",
+                    (profile.name, profile.created_date.isoformat(), profile.transactions.next_id))
+                self._insert_transactions(profile.name, profile.transactions)
+                self._insert_rules(profile.name, profile.get_recurring_rules())
+            
+            for profile, transactions in new_transactions:
+                self._insert_transactions(profile.name, transactions)
+            
+            for profile in rule_changes:
+                self.connection.execute("DELETE FROM recurring_rules WHERE profile_id = ?",
+                                        (self._profile_id(profile.name),))
+                self._insert_rules(profile.name, profile.get_recurring_rules())
+        
+        self.mark_saved(profiles)
+    
+    def _insert_transactions(self, name, transactions):
+        """Insert transactions for the named profile in one batch"""
+        profile_id = self._profile_id(name)
+        self.connection.executemany(
+            "INSERT INTO transactions (profile_id, transaction_id, type, description, amount, timestamp, category, tags) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(profile_id, transaction.id, transaction.get_type(), transaction.description, transaction.amount,
+              transaction.timestamp, transaction.category, ','.join(transaction.tags))
+             for transaction in transactions])
+    
+    def _insert_rules(self, name, rules):
+        """Insert the recurring rules of the named profile in one batch"""
+        profile_id = self._profile_id(name)
+        self.connection.executemany(
+            "INSERT INTO recurring_rules (profile_id, type, description, amount, frequency, interval, start_date, "
+            "end_date, next_date, category, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(profile_id, rule.transaction_type, rule.description, rule.amount, rule.frequency, rule.interval,
+              rule.start.isoformat(), rule.end.isoformat() if rule.end is not None else None,
+              rule.next_date.isoformat() if rule.next_date is not None else None,
+              rule.category, ','.join(rule.tags))
+             for rule in rules])
+    
+    def _profile_id(self, name):
+        """Get the row id of the named profile"""
+        row = self.connection.execute("SELECT id FROM profiles WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise ValueError(f"Profile '{name}' is not stored")
+        return row[0]
+    
+    def get_category_totals(self, name):
+        """Sum the stored income, expenses and count per category of a profile in SQL, like Profile.get_category_totals"""
+        with self._lock:
+            rows = self.connection.execute("""
+                SELECT t.category, SUM(CASE WHEN t.type = 'Income' THEN t.amount ELSE 0 END),
+                       SUM(CASE WHEN t.type = 'Income' THEN 0 ELSE t.amount END), COUNT(*)
+                FROM transactions t JOIN profiles p ON p.id = t.profile_id
+                WHERE p.name = ? GROUP BY t.category""", (name,)).fetchall()
+        summary = [{
+            'category': category,
+            'income': income,
+            'expenses': expenses,
+            'net': income - expenses,
+            'count': count
+        } for category, income, expenses, count in rows]
+        summary.sort(key=lambda totals: (-totals['expenses'], -totals['income'], totals['category']))
+        return summary
+    
+    def close(self, profiles):
+        """Save pending changes and close the database"""
+        self.save_profiles(profiles)
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+def migrate_json_to_sqlite(json_file, db_file):
+    """Copy every profile from a JSON data file (and its journal) into a SQLite database"""
+    profiles = JSONStorage(json_file, use_journal=True).load_profiles()
+    storage = SQLiteStorage(db_file)
+    stored = []
+    try:
+        stored = storage.load_profiles()
+        if stored:
+            raise ValueError(f"Database '{db_file}' already contains profiles")
+        storage.save_profiles(profiles)
+        stored = profiles
+    finally:
+        # Closing saves the profiles it is given, so only ever the ones already stored
+        storage.close(stored)
+    return len(profiles)
\ No newline at end of file
@@ -0,0 +1,1047 @@
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+import json
+import os
+import threading
+from datetime import datetime
+from functools import partial
+from .transaction import Transaction
+from .profile import Profile
+from .recurring import RecurringRule
+from .ledger import TransactionLedger
+from .journal import Journal
+from .file_lock import FileLock
+from .instrumentation import instrumented, span, increment
+from .snapshot import (dump_snapshot, index_path, read_index, write_index, scan_snapshot, read_profile,
+                       snapshot_stamp)
+from .binary_snapshot import (MAGIC, is_binary_snapshot, dump_binary_snapshot, read_binary_index,
+                              read_binary_ledger)
+
+# Journal operations changing single stored transactions, by id
+EDIT_OPS = ('update_transaction', 'remove_transaction')
+
+class Storage(ABC):
+    """Abstract base class for profile storage backends
+    
+    Backends that can store single transaction edits and deletions set
+    stores_edits, and those that can store a profile's recurring rules
+    without its transactions set stores_rules; the others store a profile
+    with such changes again in full.
+    """
+    
+    stores_edits = False
+    stores_rules = False
+    
+    def __init__(self):
+        self._saved_counts = {}
+        # Names of profiles to store again in full on the next save
+        self._rewrite_names = set()
+        self._saved_edits = {}
+        self._saved_rules = {}
+        # name -> (ids of changed, ids of removed) stored transactions whose edits made here
+        # are not saved yet, carried over when stored changes were merged in
+        self._pending_edits = {}
+        # Number of times each profile was removed or replaced in storage
+        self._revisions = {}
+    
+    @abstractmethod
+    def load_profiles(self):
+        """Load and return the list of stored profiles"""
+        pass
+    
+    @abstractmethod
+    def save_profiles(self, profiles):
+        """Persist the given list of profiles"""
+        pass
+    
+    def close(self, profiles):
+        """Persist pending changes and release any open resources"""
+        self.save_profiles(profiles)
+    
+    def sync(self):
+        """Force what was saved so far to disk, for backends that buffer writes"""
+        pass
+    
+    def locked(self, exclusive=True, blocking=True):
+        """Context manager holding the lock other processes using the same data respect, if any"""
+        return nullcontext()
+    
+    def merge_external_changes(self, profiles):
+        """Merge changes other processes stored since the last load or save
+        
+        Returns the updated list of profiles, or None if nothing changed.
+        Backends that are not shared between processes never report changes.
+        """
+        return None
+    
+    def mark_saved(self, profiles):
+        """Remember which profiles and transactions are already stored"""
+        self._saved_counts = {profile.name: profile.get_transaction_count() for profile in profiles}
+        self._rewrite_names = set()
+        self._saved_edits = {profile.name: profile.edit_count for profile in profiles}
+        self._saved_rules = {profile.name: profile.rule_change_count for profile in profiles}
+        self._pending_edits = {}
+    
+    def release_edits(self, profiles):
+        """Let the profiles forget the edits already stored, so their edit logs stay short"""
+        for profile in profiles:
+            saved = self._saved_edits.get(profile.name)
+            if saved is not None:
+                profile.release_edits(saved)
+    
+    def invalidate(self, names=None):
+        """Make the named profiles (all by default) be stored again in full on the next save"""
+        for name in list(self._saved_counts) if names is None else names:
+            if name in self._saved_counts:
+                self._rewrite_names.add(name)
+    
+    def collect_changes(self, profiles):
+        """Get (added profiles, (profile, new transactions) pairs, removed names) since the last save
+        
+        Removed names are meant to be applied before added profiles, and
+        the edits from collect_edits before new transactions.
+        """
+        added_profiles = []
+        new_transactions = []
+        current_names = set()
+        replaced_names = []
+        
+        for profile in profiles:
+            current_names.add(profile.name)
+            saved_count = self._saved_counts.get(profile.name)
+            if saved_count is None:
+                added_profiles.append(profile)
+            elif (profile.name in self._rewrite_names
+                    or not self.stores_edits and self._has_unsaved_edits(profile)
+                    or not self.stores_rules and profile.rule_change_count != self._saved_rules.get(profile.name)):
+                # Marked to be stored in full, or transactions edited or rules changed and the
+                # backend cannot store that on its own: store the profile again from scratch
+                replaced_names.append(profile.name)
+                added_profiles.append(profile)
+            else:
+                if self._has_unsaved_edits(profile):
+                    saved_count = self._stored_edits(profile)[2]
+                if profile.get_transaction_count() > saved_count:
+                    new_transactions.append((profile, profile.transactions[saved_count:]))
+        
+        removed_names = [name for name in self._saved_counts if name not in current_names]
+        return added_profiles, new_transactions, removed_names + replaced_names
+    
+    def collect_edits(self, profiles):
+        """Get (profile, changed transactions, removed transaction ids) for every edited profile
+        
+        Only for backends that store edits; profiles collect_changes stores
+        from scratch are left out.
+        """
+        edits = []
+        for profile in profiles:
+            name = profile.name
+            if (name in self._saved_counts and name not in self._rewrite_names
+                    and self._has_unsaved_edits(profile)):
+                updated_ids, removed_ids, _ = self._stored_edits(profile)
+                if updated_ids or removed_ids:
+                    edits.append((profile, [profile.get_transaction(transaction_id)
+                                            for transaction_id in updated_ids], removed_ids))
+        return edits
+    
+    def collect_rule_changes(self, profiles):
+        """Get the profiles whose recurring rules changed since the last save
+        
+        Only for backends that store rules; profiles collect_changes stores
+        from scratch are left out.
+        """
+        return [profile for profile in profiles
+                if profile.name in self._saved_counts
+                and profile.name not in self._rewrite_names
+                and profile.rule_change_count != self._saved_rules.get(profile.name)]
+    
+    def _has_unsaved_edits(self, profile):
+        """Check whether transactions of a profile were edited or deleted since the last save"""
+        return profile.edit_count != self._saved_edits.get(profile.name) or profile.name in self._pending_edits
+    
+    def _stored_edits(self, profile):
+        """Get (ids of changed, ids of removed, number of remaining) stored transactions of a profile
+        
+        Only edits of rows before the saved count concern stored
+        transactions; later rows are stored with their current values
+        when they are added. Every removed stored row lowers the count.
+        """
+        pending_updated, pending_removed = self._pending_edits.get(profile.name, ((), ()))
+        saved_count = self._saved_counts[profile.name] - len(pending_removed)
+        updated = dict.fromkeys(pending_updated, True)
+        removed = list(pending_removed)
+        for op, transaction_id, row in profile.get_edits(self._saved_edits.get(profile.name, 0)):
+            if row >= saved_count:
+                continue
+            if op == 'remove':
+                saved_count -= 1
+                updated.pop(transaction_id, None)
+                removed.append(transaction_id)
+            else:
+                updated[transaction_id] = True
+        return list(updated), removed, saved_count
+    
+    def changed_names(self, profiles):
+        """Get the names of the profiles added, changed or removed since the last save
+        
+        Compares transaction, edit and rule change counts only, so no
+        transactions are read; an empty list means saving would store nothing.
+        """
+        changed = []
+        current_names = set()
+        for profile in profiles:
+            current_names.add(profile.name)
+            if (self._saved_counts.get(profile.name) != profile.get_transaction_count()
+                    or profile.name in self._rewrite_names
+                    or self._saved_edits.get(profile.name) != profile.edit_count
+                    or profile.name in self._pending_edits
+                    or self._saved_rules.get(profile.name) != profile.rule_change_count):
+                changed.append(profile.name)
+        # A save on another thread may be updating the counts meanwhile
+        changed.extend(name for name in list(self._saved_counts) if name not in current_names)
+        return changed
+    
+    def _adopt_stored(self, local, stored):
+        """Mark a profile just read from storage as saved and return it
+        
+        'stored' replaces 'local' (None for a profile new here); rule
+        changes made to 'local' and not saved yet are kept.
+        """
+        name = stored.name
+        self._rewrite_names.discard(name)
+        self._saved_edits[name] = stored.edit_count
+        self._pending_edits.pop(name, None)
+        if local is not None and local.rule_change_count != self._saved_rules.get(name):
+            stored.set_recurring_rules(local.get_recurring_rules())
+            stored.rule_change_count = local.rule_change_count
+        else:
+            self._saved_rules[name] = stored.rule_change_count
+        return stored
+    
+    def _merge_rules(self, profile, rule_dicts):
+        """Take the stored recurring rules of a profile, unless they were changed here too"""
+        if profile.rule_change_count != self._saved_rules.get(profile.name):
+            # The next save stores this side's rules
+            return
+        if [rule.to_dict() for rule in profile.get_recurring_rules()] != list(rule_dicts):
+            profile.set_recurring_rules([RecurringRule.from_dict(rule_data) for rule_data in rule_dicts])
+    
+    @staticmethod
+    def _set_rule_dicts(data, rule_dicts):
+        """Store rule dictionaries in a profile dictionary or index entry, leaving the key out when there are none"""
+        if rule_dicts:
+            data['recurring'] = rule_dicts
+        else:
+            data.pop('recurring', None)
+    
+    def _merge_edited(self, profile, count, ledger=None, transactions=()):
+        """Merge stored changes into a profile whose transactions were edited or deleted here too
+        
+        'ledger' holds the 'count' stored transactions as they are now,
+        with the edits and deletions other processes stored; the edits and
+        deletions made here are applied on top of it by transaction id and
+        the transactions added here follow. Without 'ledger' the stored
+        transactions only gained 'transactions'. Either way the next save
+        stores just the edits made here, unless a transaction edited here
+        was deleted elsewhere: it is then kept and the whole profile is
+        stored again.
+        """
+        name = profile.name
+        updated_ids, removed_ids, remaining = self._stored_edits(profile)
+        if ledger is None:
+            self._merge_transactions(profile, remaining, transactions)
+        else:
+            local = profile.transactions
+            conflict = False
+            for transaction_id in updated_ids:
+                transaction = local[local.find_id(transaction_id)]
+                row = ledger.find_id(transaction_id)
+                if row >= 0:
+                    ledger.set_row(row, transaction)
+                else:
+                    # Deleted elsewhere but edited here: this side's version is kept
+                    ledger.append(transaction)
+                    conflict = True
+            # Transactions deleted on both sides are already gone
+            removed_ids = [transaction_id for transaction_id in removed_ids if ledger.find_id(transaction_id) >= 0]
+            for transaction_id in removed_ids:
+                ledger.pop(ledger.find_id(transaction_id))
+            ledger.append_rows(local, remaining)
+            ledger.reserve_ids(local.next_id)
+            profile.set_ledger(ledger)
+            if conflict:
+                self._rewrite_names.add(name)
+        self._saved_counts[name] = count
+        self._saved_edits[name] = profile.edit_count
+        self._pending_edits[name] = (updated_ids, removed_ids)
+    
+    @staticmethod
+    def _merge_transactions(profile, saved_count, transactions):
+        """Insert stored transactions after the first 'saved_count' ones, before unsaved additions"""
+        if profile.get_transaction_count() == saved_count:
+            for transaction in transactions:
+                profile.add_transaction(transaction)
+            return
+        
+        ledger = profile.transactions
+        merged = TransactionLedger()
+        merged.append_rows(ledger, 0, saved_count)
+        for transaction in transactions:
+            merged.append(transaction)
+        merged.append_rows(ledger, saved_count)
+        merged.reserve_ids(ledger.next_id)
+        profile.set_ledger(merged)
+
+class TransactionIds:
+    """Positions of the raw transaction dictionaries of a profile dictionary by id, for applying journaled edits
+    
+    Dictionaries without an id, or with one that is already taken, get
+    the id TransactionLedger would give their row.
+    """
+    
+    def __init__(self, profile_data):
+        self.profile_data = profile_data
+        self.transaction_dicts = transaction_dicts = profile_data['transactions']
+        self.positions = {}
+        self.next_id = 1
+        for position, data in enumerate(transaction_dicts):
+            self._number(data, position)
+    
+    def _number(self, data, position):
+        transaction_id = data.get('id')
+        if transaction_id is None or transaction_id in self.positions:
+            transaction_id = data['id'] = self.next_id
+        self.next_id = max(self.next_id, transaction_id + 1)
+        self.positions[transaction_id] = position
+    
+    def append(self, data):
+        """Add a transaction dictionary at the end"""
+        self.transaction_dicts.append(data)
+        self._number(data, len(self.transaction_dicts) - 1)
+    
+    def apply(self, record):
+        """Apply an update_transaction or remove_transaction journal record"""
+        if record['op'] == 'update_transaction':
+            position = self.positions.get(record['transaction']['id'])
+            if position is not None:
+                self.transaction_dicts[position] = record['transaction']
+            return
+        # The id stays taken, so a reload does not give it to a new transaction
+        self.profile_data['next_id'] = max(self.profile_data.get('next_id', 1), record['id'] + 1)
+        position = self.positions.pop(record['id'], None)
+        if position is not None:
+            del self.transaction_dicts[position]
+            for later in range(position, len(self.transaction_dicts)):
+                self.positions[self.transaction_dicts[later]['id']] = later
+
+class JSONStorage(Storage):
+    """Storage backend keeping all profiles in a JSON file, optionally with an append-only journal
+    
+    With snapshot_format='binary' the snapshot is written in the compact
+    binary format instead; either format is detected automatically on load.
+    With the journal, edited and deleted transactions are journaled by id
+    and changed recurring rules as a profile's new rule list; without it
+    every save rewrites the file anyway.
+    """
+    
+    SNAPSHOT_FORMATS = ('json', 'binary')
+    
+    def __init__(self, data_file, use_journal=False, compact_threshold=1000, lazy=False,
+                 snapshot_format='json'):
+        super().__init__()
+        if snapshot_format not in self.SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format '{snapshot_format}'")
+        self.data_file = data_file
+        self.file_lock = FileLock(data_file + '.lock')
+        self.snapshot_format = snapshot_format
+        self.use_journal = use_journal
+        self.compact_threshold = compact_threshold
+        self.lazy = lazy
+        self.journal = Journal(data_file) if use_journal else None
+        self.stores_edits = use_journal
+        self.stores_rules = use_journal
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        self._snapshot_lock = threading.RLock()
+        self._index_entries = {}
+        self._pending_transactions = {}
+        # (generation, snapshot stamp) of the data the loaded profiles reflect
+        self._disk_version = None
+    
+    def locked(self, exclusive=True, blocking=True):
+        """Hold the data file lock shared with other processes"""
+        return self.file_lock.acquire(exclusive=exclusive, blocking=blocking)
+    
+    def _read_disk_version(self):
+        """Get (generation, snapshot stamp) of the data on disk"""
+        stamp = snapshot_stamp(self.data_file) if os.path.exists(self.data_file) else None
+        return self.file_lock.read_generation(), stamp
+    
+    @instrumented('storage.load_profiles')
+    def load_profiles(self):
+        """Load profiles from the JSON file, replaying the journal if enabled"""
+        with self.file_lock.acquire():
+            self._disk_version = self._read_disk_version()
+            if self.lazy or is_binary_snapshot(self.data_file):
+                return self._load_lazy_profiles()
+            
+            if self.use_journal:
+                data = self._read_snapshot()
+                self._revisions = dict(data.get('revisions', {}))
+                self.journal.start_after(data.get('journal_seq', 0))
+                apply_record = self._record_applier(data)
+                for record in self._count_revisions(self.journal.replay(after=data.get('journal_seq', 0)),
+                                                    self._revisions):
+                    apply_record(record)
+            elif os.path.exists(self.data_file):
+                with open(self.data_file, 'r', encoding='utf-8') as file, span('storage.parse_json'):
+                    data = json.load(file)
+                self._revisions = dict(data.get('revisions', {}))
+            else:
+                return []
+        
+        profiles = [Profile.from_dict(profile_data) for profile_data in data.get('profiles', [])]
+        increment('storage.profiles_loaded', len(profiles))
+        self.mark_saved(profiles)
+        return profiles
+    
+    @instrumented('storage.save_profiles')
+    def save_profiles(self, profiles):
+        """Save profiles, appending only the changes when the journal is enabled
+        
+        Raises RuntimeError if another process stored changes that have not
+        been merged with merge_external_changes, instead of overwriting them.
+        """
+        with self.file_lock.acquire():
+            if self._disk_version is not None and (self._read_disk_version() != self._disk_version
+                                                   or self.use_journal and self.journal.has_new()):
+                raise RuntimeError("Data was changed by another process; merge those changes before saving")
+            
+            if self.use_journal:
+                self._append_changes(profiles)
+                if self.journal.record_count >= self.compact_threshold:
+                    self.compact(profiles, background=True)
+                return
+            
+            for name in self.collect_changes(profiles)[2]:
+                self._revisions[name] = self._revisions.get(name, 0) + 1
+            extra = {'revisions': self._revisions} if self._revisions else None
+            
+            # Readers never see a partially written snapshot
+            temp_file = self.data_file + '.tmp'
+            with open(temp_file, 'wb') as file:
+                entries = self._dump(profiles, file, indent=2, extra=extra)
+                file.flush()
+                os.fsync(file.fileno())
+            
+            self._replace_snapshot(temp_file, entries, extra)
+            self._adopt_snapshot(entries, {})
+            self.mark_saved(profiles)
+    
+    def _append_changes(self, profiles):
+        """Append only what changed since the last save to the journal"""
+        edits = self.collect_edits(profiles)
+        rule_changes = self.collect_rule_changes(profiles)
+        added_profiles, new_transactions, removed_names = self.collect_changes(profiles)
+        record_count = self.journal.record_count
+        
+        for name in removed_names:
+            self.journal.append({'op': 'remove_profile', 'name': name})
+            self._revisions[name] = self._revisions.get(name, 0) + 1
+            del self._saved_counts[name]
+            self._rewrite_names.discard(name)
+            self._saved_edits.pop(name, None)
+            self._saved_rules.pop(name, None)
+        
+        for profile in added_profiles:
+            self.journal.append({'op': 'add_profile', 'profile': profile.to_dict()})
+            self._saved_counts[profile.name] = profile.get_transaction_count()
+            self._rewrite_names.discard(profile.name)
+        
+        # Edits before additions, so replaying them finds the same rows
+        for profile, transactions, removed_ids in edits:
+            for transaction_id in removed_ids:
+                self.journal.append({'op': 'remove_transaction', 'profile': profile.name, 'id': transaction_id})
+                self._saved_counts[profile.name] -= 1
+            for transaction in transactions:
+                self.journal.append({
+                    'op': 'update_transaction',
+                    'profile': profile.name,
+                    'transaction': transaction.to_dict()
+                })
+            self._revisions[profile.name] = (self._revisions.get(profile.name, 0)
+                                             + len(removed_ids) + len(transactions))
+        for profile in rule_changes:
+            self.journal.append({
+                'op': 'set_recurring',
+                'profile': profile.name,
+                'recurring': [rule.to_dict() for rule in profile.get_recurring_rules()]
+            })
+        for profile in profiles:
+            self._saved_edits[profile.name] = profile.edit_count
+            self._saved_rules[profile.name] = profile.rule_change_count
+        self._pending_edits = {}
+        
+        for profile, transactions in new_transactions:
+            for transaction in transactions:
+                self.journal.append({
+                    'op': 'add_transaction',
+                    'profile': profile.name,
+                    'transaction': transaction.to_dict()
+                })
+                self._saved_counts[profile.name] += 1
+        increment('journal.records_appended', self.journal.record_count - record_count)
+    
+    def _read_snapshot(self):
+        """Read the snapshot file as raw data, or an empty snapshot"""
+        if not os.path.exists(self.data_file):
+            return {'profiles': []}
+        with open(self.data_file, 'r', encoding='utf-8') as file, span('storage.parse_json'):
+            return json.load(file)
+    
+    def _record_applier(self, data):
+        """Return a function applying journal records to raw snapshot data"""
+        profiles = data.setdefault('profiles', [])
+        by_name = {profile_data['name']: profile_data for profile_data in profiles}
+        # name -> TransactionIds, for profiles with edits
+        ids = {}
+        
+        def apply_record(record):
+            op = record.get('op')
+            if op == 'add_profile':
+                profile_data = record['profile']
+                if profile_data['name'] not in by_name:
+                    profiles.append(profile_data)
+                    by_name[profile_data['name']] = profile_data
+            elif op == 'remove_profile':
+                profile_data = by_name.pop(record['name'], None)
+                ids.pop(record['name'], None)
+                if profile_data is not None:
+                    profiles.remove(profile_data)
+            elif op == 'add_transaction':
+                profile_data = by_name.get(record['profile'])
+                if record['profile'] in ids:
+                    ids[record['profile']].append(record['transaction'])
+                elif profile_data is not None:
+                    profile_data['transactions'].append(record['transaction'])
+            elif op in EDIT_OPS:
+                profile_data = by_name.get(record['profile'])
+                if profile_data is not None:
+                    if record['profile'] not in ids:
+                        ids[record['profile']] = TransactionIds(profile_data)
+                    ids[record['profile']].apply(record)
+            elif op == 'set_recurring':
+                profile_data = by_name.get(record['profile'])
+                if profile_data is not None:
+                    self._set_rule_dicts(profile_data, record['recurring'])
+        
+        return apply_record
+    
+    @staticmethod
+    def _count_revisions(records, revisions):
+        """Pass journal records through, counting profile removals and transaction edits in 'revisions'"""
+        for record in records:
+            op = record.get('op')
+            if op == 'remove_profile':
+                revisions[record['name']] = revisions.get(record['name'], 0) + 1
+            elif op in EDIT_OPS:
+                revisions[record['profile']] = revisions.get(record['profile'], 0) + 1
+            yield record
+    
+    def compact(self, profiles, background=False):
+        """Fold the journal into a new snapshot file"""
+        if not self.use_journal:
+            self.save_profiles(profiles)
+            return
+        
+        self._append_changes(profiles)
+        if background and self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        
+        # A running background compaction finds its segments already folded in and stops
+        upto = self.journal.rotate()
+        if background:
+            self._compaction_thread = threading.Thread(target=self._write_compacted_snapshot,
+                                                       args=(upto,), daemon=True)
+            self._compaction_thread.start()
+        else:
+            self._write_compacted_snapshot(upto)
+    
+    @instrumented('storage.compact')
+    def _write_compacted_snapshot(self, upto):
+        """Merge the snapshot with journal segments up to 'upto' and replace it atomically
+        
+        Profiles are streamed one at a time from the old snapshot into the new one.
+        If no other process changed the data since this one last read it, lazy
+        reads switch to the new snapshot right away; otherwise that happens
+        when the changes are merged.
+        """
+        with self.file_lock.acquire(), self._compaction_lock:
+            try:
+                in_sync = self._disk_version == self._read_disk_version() and not self.journal.has_new()
+                entries, extra = self._snapshot_index()
+                journal_seq = extra.get('journal_seq', 0)
+                if upto <= journal_seq:
+                    return
+                revisions = extra.get('revisions', {})
+                records = self._count_revisions(self.journal.records(after=journal_seq, upto=upto), revisions)
+                state = self._replay_onto_index(entries, records)
+                
+                extra['journal_seq'] = max(upto, journal_seq)
+                if revisions:
+                    extra['revisions'] = revisions
+                temp_file = self.data_file + '.tmp'
+                with open(temp_file, 'wb') as file:
+                    new_entries = self._dump(state.values(), file, extra=extra)
+                    file.flush()
+                    os.fsync(file.fileno())
+                
+                self._replace_snapshot(temp_file, new_entries, extra)
+                self.journal.remove_segments(upto)
+                if in_sync:
+                    self.journal.start_after(upto)
+                    self._adopt_snapshot(new_entries, self._replay_onto_index(new_entries,
+                                                                              self.journal.records(after=upto)))
+            
+            except Exception as e:
+                print(f"Error compacting data: {e}")
+    
+    def _replace_snapshot(self, temp_file, entries, extra=None):
+        """Move a freshly written snapshot into place and bump the generation
+        
+        Lazily loaded profiles notice the replacement by the snapshot stamp,
+        see _read_lazy_transactions.
+        """
+        with self.file_lock.acquire():
+            os.replace(temp_file, self.data_file)
+            if self.snapshot_format == 'json':
+                write_index(self.data_file, entries, extra)
+            elif os.path.exists(index_path(self.data_file)):
+                os.remove(index_path(self.data_file))
+            self.file_lock.bump_generation()
+    
+    def _snapshot_index(self):
+        """Get (index entries, extra keys) of the snapshot, scanning it if the stored index is stale"""
+        if not os.path.exists(self.data_file):
+            return [], {}
+        if is_binary_snapshot(self.data_file):
+            return read_binary_index(self.data_file)
+        
+        index = read_index(self.data_file)
+        if index is not None:
+            extra = {key: value for key, value in index.items() if key not in ('snapshot', 'profiles')}
+            return index['profiles'], extra
+        
+        entries, extra = scan_snapshot(self.data_file)
+        try:
+            write_index(self.data_file, entries, extra)
+        except OSError:
+            pass
+        return entries, extra
+    
+    def _replay_onto_index(self, entries, records):
+        """Apply journal records to the index entries of the current snapshot
+        
+        Returns a dict mapping each profile name, in order, to either a raw
+        profile dictionary (added through the journal, or read from the
+        snapshot to apply edits to) or an (index entry, journaled
+        transactions) pair.
+        """
+        state = {entry['name']: (entry, []) for entry in entries}
+        # name -> TransactionIds, for profiles with edits
+        ids = {}
+        for record in records:
+            op = record.get('op')
+            if op == 'add_profile':
+                profile_data = record['profile']
+                if profile_data['name'] not in state:
+                    state[profile_data['name']] = profile_data
+            elif op == 'remove_profile':
+                state.pop(record['name'], None)
+                ids.pop(record['name'], None)
+            elif op == 'add_transaction':
+                target = state.get(record['profile'])
+                if record['profile'] in ids:
+                    ids[record['profile']].append(record['transaction'])
+                elif isinstance(target, dict):
+                    target['transactions'].append(record['transaction'])
+                elif target is not None:
+                    target[1].append(record['transaction'])
+            elif op in EDIT_OPS:
+                name = record['profile']
+                if name not in state:
+                    continue
+                if name not in ids:
+                    if not isinstance(state[name], dict):
+                        state[name] = self._as_dict(state[name])
+                    ids[name] = TransactionIds(state[name])
+                ids[name].apply(record)
+            elif op == 'set_recurring':
+                target = state.get(record['profile'])
+                if isinstance(target, dict):
+                    self._set_rule_dicts(target, record['recurring'])
+                elif target is not None:
+                    # The snapshot keeps its old rules, so the entry gets the new ones
+                    entry = dict(target[0])
+                    self._set_rule_dicts(entry, record['recurring'])
+                    state[record['profile']] = (entry, target[1])
+        return state
+    
+    def _load_lazy_profiles(self):
+        """Create profiles from the snapshot index without parsing their transactions"""
+        entries, extra = self._snapshot_index()
+        records = ()
+        self._revisions = dict(extra.get('revisions', {}))
+        if self.use_journal:
+            self.journal.start_after(extra.get('journal_seq', 0))
+            records = self._count_revisions(self.journal.replay(after=extra.get('journal_seq', 0)), self._revisions)
+        state = self._replay_onto_index(entries, records)
+        self._adopt_snapshot(entries, state)
+        
+        profiles = [self._profile_from_target(name, target) for name, target in state.items()]
+        increment('storage.profiles_loaded', len(profiles))
+        self.mark_saved(profiles)
+        return profiles
+    
+    def _adopt_snapshot(self, entries, state):
+        """Point lazy reads at the current snapshot and the journaled transactions not in it yet"""
+        with self._snapshot_lock:
+            self._disk_version = self._read_disk_version()
+            self._index_entries = {entry['name']: entry for entry in entries}
+            self._pending_transactions = {name: target[1] for name, target in state.items()
+                                          if not isinstance(target, dict)}
+    
+    def _profile_from_target(self, name, target):
+        """Create a profile from a replayed snapshot item, reading its transactions only when needed"""
+        if isinstance(target, dict):
+            return Profile.from_dict(target)
+        
+        entry, appended = target
+        total_income = entry['total_income']
+        total_expenses = entry['total_expenses']
+        for transaction_data in appended:
+            if transaction_data['type'] == 'Income':
+                total_income += transaction_data['amount']
+            else:
+                total_expenses += transaction_data['amount']
+        
+        profile = Profile.lazy(name, datetime.fromisoformat(entry['created_date']),
+                               entry['transaction_count'] + len(appended), total_income,
+                               total_expenses, partial(self._read_lazy_transactions, name),
+                               [RecurringRule.from_dict(rule_data) for rule_data in entry.get('recurring', ())])
+        if not self.lazy:
+            profile.ensure_loaded()
+        return profile
+    
+    @instrumented('storage.read_lazy_profile')
+    def _read_lazy_transactions(self, name):
+        """Read the transactions of one profile from the snapshot and journal"""
+        with self._snapshot_lock:
+            with open(self.data_file, 'rb') as file:
+                # Index offsets are only valid for the exact snapshot they were taken from
+                if snapshot_stamp(file.fileno()) == self._disk_version[1]:
+                    ledger = self._read_entry_ledger(self._index_entries[name], file)
+                    ledger.append_dicts(self._pending_transactions.get(name, []))
+                    return ledger
+        
+        # Another process replaced the snapshot: its data starts with the transactions
+        # known here, anything after them is picked up by the next merge
+        with self.file_lock.acquire(exclusive=False):
+            state = self._disk_state()[0]
+        target = state.get(name)
+        ledger = self._as_ledger_item(target)[2] if target is not None else TransactionLedger()
+        known_count = self._saved_counts.get(name, len(ledger))
+        if len(ledger) > known_count:
+            known = TransactionLedger()
+            known.append_rows(ledger, 0, known_count)
+            known.reserve_ids(ledger.next_id)
+            ledger = known
+        return ledger
+    
+    def _read_entry_ledger(self, entry, file=None):
+        """Read the transactions an index entry points at as a TransactionLedger"""
+        if file is None:
+            with open(self.data_file, 'rb') as file:
+                return self._read_entry_ledger(entry, file)
+        
+        file.seek(0)
+        if file.read(len(MAGIC)) == MAGIC:
+            return read_binary_ledger(file, entry)
+        profile_data = read_profile(file, entry)
+        return TransactionLedger.from_dicts(profile_data['transactions'], profile_data.get('next_id', 1))
+    
+    def _disk_state(self, advance_journal=False):
+        """Get (replayed snapshot items, profile revisions, index entries) of the data on disk
+        
+        With advance_journal=True the journal's read position moves past
+        every record that was read.
+        """
+        entries, extra = self._snapshot_index()
+        revisions = dict(extra.get('revisions', {}))
+        journal_seq = extra.get('journal_seq', 0)
+        records = ()
+        if self.use_journal:
+            if advance_journal:
+                self.journal.start_after(journal_seq)
+                self.journal.read_position = (journal_seq + 1, 0)
+                records = self.journal.read_new()
+            else:
+                records = self.journal.records(after=journal_seq)
+        state = self._replay_onto_index(entries, self._count_revisions(records, revisions))
+        return state, revisions, entries
+    
+    @instrumented('storage.merge_external_changes')
+    def merge_external_changes(self, profiles):
+        """Merge changes other processes stored since the last load or save
+        
+        Only profiles that changed are read. After the snapshot was
+        replaced, changes are found by comparing transaction counts and
+        revisions with the snapshot index; otherwise only the journal
+        records appended since the last read are applied. Profiles
+        replaced or removed elsewhere win over unsaved additions; edits
+        and deletions made here are applied on top of the stored ones by
+        transaction id (see _merge_edited).
+        """
+        with self.file_lock.acquire(exclusive=False):
+            if self._disk_version is None:
+                return None
+            if self._read_disk_version() != self._disk_version:
+                changes, rules = self._snapshot_changes()
+            elif self.use_journal and self.journal.has_new():
+                changes, rules = self._journal_changes()
+            else:
+                return None
+            return self._apply_changes(profiles, changes, rules)
+    
+    def _snapshot_changes(self):
+        """Compare the replaced snapshot (plus journal) with what was loaded, per profile
+        
+        Returns (changes, stored recurring rule dictionaries of every profile).
+        """
+        state, revisions, entries = self._disk_state(advance_journal=True)
+        self._adopt_snapshot(entries, state)
+        
+        changes = {}
+        rules = {}
+        for name, target in state.items():
+            if isinstance(target, dict):
+                count = len(target['transactions'])
+                rules[name] = target.get('recurring', [])
+            else:
+                count = target[0]['transaction_count'] + len(target[1])
+                rules[name] = target[0].get('recurring', [])
+            saved_count = self._saved_counts.get(name)
+            if (saved_count is None or count < saved_count
+                    or revisions.get(name, 0) != self._revisions.get(name, 0)):
+                changes[name] = ('replace', target, count)
+            elif count > saved_count:
+                changes[name] = ('append', target, count)
+        for name in self._saved_counts:
+            if name not in state:
+                changes[name] = None
+        
+        self._revisions = revisions
+        return changes, rules
+    
+    def _journal_changes(self):
+        """Collect the journal records other processes appended since the last read, per profile
+        
+        Returns (changes, new recurring rule dictionaries of the profiles whose rules changed).
+        """
+        changes = {}
+        edited = set()
+        rules = {}
+        
+        def stored(name):
+            return changes[name] is not None if name in changes else name in self._saved_counts
+        
+        for record in self._count_revisions(self.journal.read_new(), self._revisions):
+            op = record.get('op')
+            if op == 'add_profile':
+                profile_data = record['profile']
+                if not stored(profile_data['name']):
+                    changes[profile_data['name']] = ('replace', profile_data, None)
+                    rules.pop(profile_data['name'], None)
+            elif op == 'remove_profile':
+                if stored(record['name']):
+                    changes[record['name']] = None
+                    rules.pop(record['name'], None)
+            elif op == 'add_transaction':
+                name = record['profile']
+                if name not in changes and stored(name):
+                    changes[name] = ('append', [], None)
+                if changes.get(name) is not None:
+                    target = changes[name][1]
+                    (target['transactions'] if isinstance(target, dict) else target).append(record['transaction'])
+            elif op in EDIT_OPS:
+                if stored(record['profile']):
+                    edited.add(record['profile'])
+            elif op == 'set_recurring':
+                if stored(record['profile']):
+                    rules[record['profile']] = record['recurring']
+        
+        if edited:
+            # Edits apply to the stored rows, so edited profiles are read again as a whole
+            state = self._disk_state()[0]
+            for name in edited:
+                if changes.get(name, ()) is not None and name in state:
+                    changes[name] = ('replace', self._as_dict(state[name]), None)
+        
+        changes = {name: change if change is None or change[2] is not None
+                   else (change[0], change[1], self._target_count(name, change))
+                   for name, change in changes.items()}
+        return changes, rules
+    
+    def _target_count(self, name, change):
+        """Get the number of stored transactions a journal change leaves a profile with"""
+        kind, target, _ = change
+        if kind == 'replace':
+            return len(target['transactions'])
+        return self._saved_counts[name] + len(target)
+    
+    def _new_transactions(self, target, saved_count):
+        """Get the transactions of a change that come after the 'saved_count' already merged"""
+        if isinstance(target, list):
+            return [Transaction.from_dict(transaction_data) for transaction_data in target]
+        return self._as_ledger_item(target)[2][saved_count:]
+    
+    def _apply_changes(self, profiles, changes, rules):
+        """Apply per-profile changes and stored recurring rules found on disk to the loaded profiles and return them"""
+        by_name = {profile.name: profile for profile in profiles}
+        for name, change in changes.items():
+            local = by_name.get(name)
+            known = name in self._saved_counts
+            if change is None:
+                # Removed by another process
+                if known:
+                    del self._saved_counts[name]
+                    self._rewrite_names.discard(name)
+                    self._saved_edits.pop(name, None)
+                    self._saved_rules.pop(name, None)
+                    self._pending_edits.pop(name, None)
+                    by_name.pop(name, None)
+                continue
+            
+            kind, target, count = change
+            if local is None:
+                if not known:
+                    by_name[name] = self._adopt_stored(None, self._profile_from_target(name, target))
+                # Otherwise it was removed here and the next save removes it on disk too
+                self._saved_counts[name] = count
+                continue
+            
+            if not local.is_loaded():
+                # Nothing was added here yet, so the stored version can be taken as it is
+                if isinstance(target, list):
+                    self._pending_transactions.setdefault(name, []).extend(target)
+                if kind == 'append':
+                    target = (self._index_entries[name], self._pending_transactions.setdefault(name, []))
+                stored = self._profile_from_target(name, target)
+                if kind == 'append':
+                    # The index entry has the snapshot's rules; the profile has any journaled since
+                    stored.set_recurring_rules(local.get_recurring_rules())
+                by_name[name] = self._adopt_stored(local, stored)
+                self._saved_counts[name] = count
+                continue
+            
+            saved_count = self._saved_counts.get(name, 0)
+            if not known:
+                # Created here too: keep both sides' transactions and store the whole profile again
+                self._merge_transactions(local, 0, self._new_transactions(target, 0))
+                self._saved_counts[name] = count
+                self._rewrite_names.add(name)
+            elif name in self._rewrite_names or self._has_unsaved_edits(local):
+                # Transactions were edited or removed here: those edits go on top of the stored ones
+                if kind == 'append':
+                    self._merge_edited(local, count, transactions=self._new_transactions(target, saved_count))
+                else:
+                    _, _, ledger, rule_dicts = self._as_ledger_item(target)
+                    self._merge_edited(local, count, ledger)
+                    self._merge_rules(local, rule_dicts)
+            elif kind == 'replace':
+                _, _, ledger, rule_dicts = self._as_ledger_item(target)
+                ledger.append_rows(local.transactions, saved_count)
+                ledger.reserve_ids(local.transactions.next_id)
+                local.set_ledger(ledger)
+                self._merge_rules(local, rule_dicts)
+                self._saved_counts[name] = count
+            else:
+                self._merge_transactions(local, saved_count, self._new_transactions(target, saved_count))
+                self._saved_counts[name] = count
+        
+        for name, rule_dicts in rules.items():
+            if name in by_name:
+                self._merge_rules(by_name[name], rule_dicts)
+        return list(by_name.values())
+    
+    def _dump(self, items, file, indent=None, extra=None):
+        """Write a snapshot in the configured format and return its profile index
+        
+        Items are Profile objects, raw profile dictionaries or
+        (index entry, journaled transactions) pairs from the current snapshot.
+        """
+        if self.snapshot_format == 'binary':
+            return dump_binary_snapshot((self._as_ledger_item(item) for item in items), file, extra=extra)
+        return dump_snapshot((self._as_dict(item) for item in items), file, indent=indent, extra=extra)
+    
+    def _as_dict(self, item):
+        """Get a snapshot item as a raw profile dictionary"""
+        if isinstance(item, Profile):
+            return item.to_dict()
+        if isinstance(item, dict):
+            return item
+        
+        entry, appended = item
+        with open(self.data_file, 'rb') as file:
+            if file.read(len(MAGIC)) == MAGIC:
+                ledger = read_binary_ledger(file, entry)
+                profile_data = {
+                    'name': entry['name'],
+                    'created_date': entry['created_date'],
+                    'transactions': [transaction.to_dict() for transaction in ledger],
+                    'next_id': ledger.next_id
+                }
+            else:
+                profile_data = read_profile(file, entry)
+        # The entry has the rules of journaled rule changes too
+        self._set_rule_dicts(profile_data, entry.get('recurring', []))
+        profile_data['transactions'].extend(appended)
+        return profile_data
+    
+    def _as_ledger_item(self, item):
+        """Get a snapshot item as a (name, created date, ledger, recurring rule dicts) tuple"""
+        if isinstance(item, Profile):
+            return (item.name, item.created_date.isoformat(), item.transactions,
+                    [rule.to_dict() for rule in item.get_recurring_rules()])
+        if isinstance(item, dict):
+            return (item['name'], item['created_date'],
+                    TransactionLedger.from_dicts(item['transactions'], item.get('next_id', 1)),
+                    item.get('recurring', []))
+        
+        entry, appended = item
+        ledger = self._read_entry_ledger(entry)
+        ledger.append_dicts(appended)
+        return entry['name'], entry['created_date'], ledger, entry.get('recurring', [])
+    
+    def wait_for_compaction(self):
+        """Wait for a background compaction to finish
+        
+        Call this before taking the data file lock for a compaction of
+        your own, since the background thread needs that lock to finish.
+        """
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+    
+    def sync(self):
+        """Force the journal records appended so far to disk"""
+        if self.journal is not None:
+            self.journal.sync()
+    
+    def close(self, profiles):
+        """Flush pending changes and compact the journal"""
+        if self.use_journal:
+            self.compact(profiles)
+            self.journal.close()
+        else:
+            self.save_profiles(profiles)
\ No newline at end of file
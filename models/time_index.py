@@ -0,0 +1,174 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, time, timedelta
+from .ledger import INCOME_FLAG
+from .timestamps import to_timestamp
+
+PERIODS = ('day', 'week', 'month')
+
+_DAY = 86_400_000_000  # microseconds
+_EPOCH_DATE = date(1970, 1, 1)
+
+def _as_datetime(moment):
+    """Accept a date or datetime as a range bound"""
+    if isinstance(moment, datetime):
+        return moment
+    return datetime.combine(moment, time())
+
+def period_start(day, period):
+    """Get the first day of the day, week (Monday) or month bucket containing a date"""
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+
+def next_period_start(start, period):
+    """Get the first day of the bucket after the one starting on 'start'"""
+    if period == 'day':
+        return start + timedelta(days=1)
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+
+class TimeIndex:
+    """Ledger rows ordered by transaction date
+    
+    Range queries bisect the sorted timestamps instead of scanning the
+    ledger. Rows with equal dates keep their insertion order.
+    """
+    
+    def __init__(self, ledger):
+        timestamps = ledger.timestamps
+        self.rows = array('I', sorted(range(len(ledger)), key=timestamps.__getitem__))
+        self.timestamps = array('q', [timestamps[row] for row in self.rows])
+    
+    def add(self, row, timestamp):
+        """Index a row that was appended to the ledger
+        
+        A row dated at or after the latest one is appended in O(1); an
+        earlier date is bisected to its place, but inserting it there moves
+        every later entry, so that case is O(n).
+        """
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.rows.append(row)
+            self.timestamps.append(timestamp)
+        else:
+            position = bisect_right(self.timestamps, timestamp)
+            self.rows.insert(position, row)
+            self.timestamps.insert(position, timestamp)
+    
+    def move(self, row, old_timestamp, timestamp):
+        """Re-sort a row whose date changed, keeping row order among equal dates"""
+        low = bisect_left(self.timestamps, old_timestamp)
+        high = bisect_right(self.timestamps, old_timestamp, low)
+        position = bisect_left(self.rows, row, low, high)
+        del self.rows[position]
+        del self.timestamps[position]
+        
+        low = bisect_left(self.timestamps, timestamp)
+        high = bisect_right(self.timestamps, timestamp, low)
+        position = bisect_left(self.rows, row, low, high)
+        self.rows.insert(position, row)
+        self.timestamps.insert(position, timestamp)
+    
+    def remove(self, row, timestamp):
+        """Drop a row removed from the ledger; the rows after it move up
+        
+        The entry is found by bisecting, but renumbering the later rows
+        takes one pass over the index, without sorting again.
+        """
+        low = bisect_left(self.timestamps, timestamp)
+        high = bisect_right(self.timestamps, timestamp, low)
+        position = bisect_left(self.rows, row, low, high)
+        del self.rows[position]
+        del self.timestamps[position]
+        self.rows = array('I', [entry - 1 if entry > row else entry for entry in self.rows])
+    
+    def between(self, start=None, end=None):
+        """Get the rows dated from start (inclusive) to end (exclusive), oldest first"""
+        low = 0 if start is None else bisect_left(self.timestamps, to_timestamp(_as_datetime(start)))
+        high = len(self.rows) if end is None else bisect_left(self.timestamps, to_timestamp(_as_datetime(end)))
+        return self.rows[low:high]
+    
+    def latest(self, count):
+        """Get the rows of the 'count' most recent transactions, oldest first"""
+        if count <= 0:
+            return array('I')
+        return self.rows[-count:]
+
+class PeriodRollup:
+    """Income, expenses and transaction count per day, week or month
+    
+    Built with one pass over the ledger columns, then kept up to date as
+    transactions are added or removed, so reports only read the buckets.
+    """
+    
+    def __init__(self, ledger, period):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+        self.period = period
+        # period start -> [income, expenses, count]
+        self.buckets = {}
+        
+        per_day = {}
+        for timestamp, amount, type_flag in zip(ledger.timestamps, ledger.amounts, ledger.type_flags):
+            day_number = timestamp // _DAY
+            totals = per_day.get(day_number)
+            if totals is None:
+                totals = per_day[day_number] = [0, 0, 0]
+            totals[0 if type_flag == INCOME_FLAG else 1] += amount
+            totals[2] += 1
+        
+        for day_number, (income, expenses, count) in per_day.items():
+            key = period_start(_EPOCH_DATE + timedelta(days=day_number), period)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [0, 0, 0]
+            bucket[0] += income
+            bucket[1] += expenses
+            bucket[2] += count
+        self.keys = sorted(self.buckets)
+    
+    def add(self, transaction, sign=1):
+        """Add (sign=1) or subtract (sign=-1) a transaction from its bucket"""
+        key = period_start(_EPOCH_DATE + timedelta(days=transaction.timestamp // _DAY), self.period)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [0, 0, 0]
+            insort(self.keys, key)
+        bucket[0 if transaction.get_type() == "Income" else 1] += sign * transaction.amount
+        bucket[2] += sign
+        if bucket[2] == 0:
+            del self.buckets[key]
+            del self.keys[bisect_left(self.keys, key)]
+    
+    def summarize(self, start=None, end=None):
+        """Get the buckets overlapping start (inclusive) to end (exclusive), oldest first"""
+        low = 0
+        high = len(self.keys)
+        if start is not None:
+            low = bisect_left(self.keys, period_start(_as_datetime(start).date(), self.period))
+        if end is not None:
+            end = _as_datetime(end)
+            # A bucket starting on the end date overlaps the range unless the range ends at midnight
+            if end.time() == time():
+                high = bisect_left(self.keys, end.date())
+            else:
+                high = bisect_right(self.keys, end.date())
+        
+        summary = []
+        for key in self.keys[low:high]:
+            income, expenses, count = self.buckets[key]
+            summary.append({
+                'period': key,
+                'income': income,
+                'expenses': expenses,
+                'net': income - expenses,
+                'count': count
+            })
+        return summary
\ No newline at end of file
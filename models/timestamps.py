@@ -0,0 +1,18 @@
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# Microseconds per minute, the resolution dates are displayed with
+MINUTE = 60_000_000
+
+def to_timestamp(date):
+    """Convert a naive datetime to integer microseconds since the epoch"""
+    return (date - EPOCH) // MICROSECOND
+
+def from_timestamp(timestamp):
+    """Convert integer microseconds since the epoch back to a naive datetime"""
+    return EPOCH + timedelta(microseconds=timestamp)
+
+def parse_timestamp(text):
+    """Convert an ISO date string, as stored before timestamps were used, to a timestamp"""
+    return to_timestamp(datetime.fromisoformat(text))
\ No newline at end of file
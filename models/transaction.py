@@ -1,14 +1,52 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
 import json
+from .instrumentation import instrumented
+from .timestamps import to_timestamp, from_timestamp, parse_timestamp
+from .formatting import format_timestamp, format_rupiah
+
+def normalize_tags(tags):
+    """Get tags as a tuple of distinct lower-case words, in their original order
+    
+    Accepts an iterable of tags or a single string of comma-separated
+    tags; spaces inside a tag become dashes.
+    """
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    normalized = []
+    for tag in tags:
+        tag = '-'.join(tag.lower().split())
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return tuple(normalized)
 
 class Transaction(ABC):
     """Abstract base class for all transactions"""
     
-    def __init__(self, description, amount):
+    # The date is kept as integer microseconds since the epoch; the datetime
+    # object is only built when 'date' is read. 'id' is None until the
+    # transaction is added to a profile, which numbers it.
+    __slots__ = ('id', 'description', 'amount', 'timestamp', '_date', 'category', 'tags')
+    
+    def __init__(self, description, amount, category='', tags=()):
+        self.id = None
         self.description = description
         self.amount = abs(amount)  # Store absolute value
+        self.category = category.strip()  # '' when uncategorized
+        self.tags = normalize_tags(tags)
         self.date = datetime.now()
+    
+    @property
+    def date(self):
+        """Date and time of the transaction"""
+        if self._date is None:
+            self._date = from_timestamp(self.timestamp)
+        return self._date
+    
+    @date.setter
+    def date(self, date):
+        self.timestamp = to_timestamp(date)
+        self._date = date
         
     @abstractmethod
     def get_amount(self):
@@ -22,37 +60,63 @@ class Transaction(ABC):
     
     def to_dict(self):
         """Convert transaction to dictionary for JSON serialization"""
-        return {
+        data = {
+            'id': self.id,
             'type': self.get_type(),
             'description': self.description,
             'amount': self.amount,
-            'date': self.date.isoformat()
+            'timestamp': self.timestamp
         }
+        # Only written when set, so uncategorized transactions stay as small as before
+        if self.category:
+            data['category'] = self.category
+        if self.tags:
+            data['tags'] = list(self.tags)
+        if self.id is None:
+            del data['id']
+        return data
     
     @staticmethod
+    @instrumented('Transaction.from_dict')
     def from_dict(data):
-        """Create transaction from dictionary"""
-        transaction_type = data['type']
-        description = data['description']
-        amount = data['amount']
-        date_str = data['date']
+        """Create transaction from dictionary
         
-        if transaction_type == 'Income':
-            transaction = Income(description, amount)
-        else:
-            transaction = Expense(description, amount)
-            
-        # Restore the original date
-        transaction.date = datetime.fromisoformat(date_str)
+        Accepts the integer 'timestamp' written now as well as the ISO
+        'date' string of older files.
+        """
+        transaction_class = Income if data['type'] == 'Income' else Expense
+        transaction = transaction_class.__new__(transaction_class)
+        transaction.id = data.get('id')
+        transaction.description = data['description']
+        transaction.amount = abs(data['amount'])
+        timestamp = data.get('timestamp')
+        transaction.timestamp = parse_timestamp(data['date']) if timestamp is None else timestamp
+        transaction._date = None
+        transaction.category = data.get('category', '')
+        transaction.tags = tuple(data.get('tags', ()))
         return transaction
     
+    def __eq__(self, other):
+        """Transactions are equal when type, description, amount and date match"""
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return (self.get_type() == other.get_type() and self.description == other.description
+                and self.amount == other.amount and self.timestamp == other.timestamp)
+    
+    def __hash__(self):
+        return hash((self.get_type(), self.description, self.amount, self.timestamp))
+    
     def __str__(self):
         """String representation of transaction"""
-        return f"{self.get_type()}: {self.description} - Rp {self.amount:,.2f} ({self.date.strftime('%Y-%m-%d %H:%M')})"
+        category = f" [{self.category}]" if self.category else ""
+        return (f"{self.get_type()}: {self.description}{category} - {format_rupiah(self.amount)} "
+                f"({format_timestamp(self.timestamp)})")
 
 class Income(Transaction):
     """Class representing income transactions"""
     
+    __slots__ = ()
+    
     def get_amount(self):
         """Income returns positive amount"""
         return self.amount
@@ -64,6 +128,8 @@ class Income(Transaction):
 class Expense(Transaction):
     """Class representing expense transactions"""
     
+    __slots__ = ()
+    
     def get_amount(self):
         """Expense returns negative amount"""
         return -self.amount
@@ -0,0 +1,589 @@
+"""Local sync server sharing one set of finance data over HTTP/JSON
+
+Devices and scripts talk to this server instead of opening the data file
+themselves. Connections are served concurrently by one asyncio event
+loop; reads are answered from memory, while every change goes through a
+single writer task that applies all queued changes and saves them with
+one write (group commit) before answering.
+
+Each profile has a version that increases with every commit touching it.
+Clients remember the version they last saw and ask for
+/profiles/<name>/transactions?since=<version> to get only the
+transactions added after it; "full": true in the answer means the
+profile changed in another way (a transaction was edited or deleted, or
+the version is too old) and the complete list was sent instead.
+
+If saving fails, the changes stay applied in memory and are saved by a
+later commit; their answers carry "pending": true and a "save_error",
+so clients know not to send them again.
+
+Endpoints:
+    GET    /profiles                          profiles with totals and versions
+    POST   /profiles                          {"name": ...}
+    GET    /profiles/<name>                   one profile
+    DELETE /profiles/<name>
+    GET    /profiles/<name>/transactions      ?since=V | ?from=DATE&to=DATE&last=N
+    POST   /profiles/<name>/transactions      one transaction object or a list of them
+    PATCH  /profiles/<name>/transactions/<id> the fields to change
+    DELETE /profiles/<name>/transactions/<id>
+    GET    /profiles/<name>/summary           ?period=day|week|month&from=DATE&to=DATE
+    GET    /profiles/<name>/categories
+    GET    /summary                           totals of all profiles
+
+Usage: python server.py [--data-file PATH] [--host 127.0.0.1] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import re
+import signal
+import sys
+import time
+from urllib.parse import unquote, urlsplit, parse_qs
+from cli import DEFAULT_DATA_FILE, transaction_record, profile_record
+
+MAX_BODY = 16 * 1024 * 1024
+# Versions further back than this are answered with the full transaction list
+VERSION_HISTORY = 1000
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HTTPError(Exception):
+    """Error answered to the client with a status code and {"error": message}"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ProfileVersions:
+    """Version counter of every profile, with the transaction count after each recent version
+    
+    A profile whose transactions only grew since version V can send the
+    rows after count(V); after anything else (an edit, a removal, a merge
+    of another process' changes, a recreated profile) its history restarts
+    and older versions get the full list. Versions start at the server's
+    start time in milliseconds, so versions handed out before a restart
+    never match the history of the new run.
+    """
+    
+    def __init__(self):
+        self.base = time.time_ns() // 1000000
+        # name -> (first version in counts, transaction count after each version from it on)
+        self._history = {}
+        self._edits = {}
+    
+    def current(self, name):
+        """Get the latest version of a profile"""
+        first, counts = self._history.get(name, (self.base, [None]))
+        return first + len(counts) - 1
+    
+    def record(self, profile, restart=False):
+        """Start a new version of a profile after a commit"""
+        name = profile.name
+        count = profile.get_transaction_count()
+        version = self.current(name) + 1
+        first, counts = self._history.get(name, (self.base, [None]))
+        if (restart or counts[-1] is None or count < counts[-1]
+                or profile.edit_count != self._edits.get(name)):
+            self._history[name] = (version, [count])
+        else:
+            counts.append(count)
+            if len(counts) > VERSION_HISTORY:
+                del counts[0]
+                first += 1
+            self._history[name] = (first, counts)
+        self._edits[name] = profile.edit_count
+        return version
+    
+    def forget(self, name):
+        """Start a new version of a removed profile, so no older version matches"""
+        version = self.current(name) + 1
+        self._history[name] = (version, [None])
+        self._edits.pop(name, None)
+        return version
+    
+    def restart_all(self, profiles):
+        """Start a new history for every profile, after changes of unknown shape"""
+        for profile in profiles:
+            self.record(profile, restart=True)
+    
+    def count_at(self, name, version):
+        """Get the transaction count a client at 'version' has seen, or None if it needs everything"""
+        first, counts = self._history.get(name, (self.base, [None]))
+        if not first <= version < first + len(counts):
+            return None
+        return counts[version - first]
+
+class SyncServer:
+    """HTTP/JSON front end of a FinancialManager with a single writer"""
+    
+    def __init__(self, manager, max_batch=256, refresh_interval=2.0):
+        self.manager = manager
+        self.max_batch = max_batch
+        self.refresh_interval = refresh_interval
+        self.versions = ProfileVersions()
+        self.commit_count = 0
+        self.queue = None
+        self.connections = set()
+        self.routes = [
+            ('GET', re.compile(r'/profiles'), self.list_profiles),
+            ('POST', re.compile(r'/profiles'), self.add_profile),
+            ('GET', re.compile(r'/profiles/([^/]+)'), self.get_profile),
+            ('DELETE', re.compile(r'/profiles/([^/]+)'), self.remove_profile),
+            ('GET', re.compile(r'/profiles/([^/]+)/transactions'), self.list_transactions),
+            ('POST', re.compile(r'/profiles/([^/]+)/transactions'), self.add_transactions),
+            ('PATCH', re.compile(r'/profiles/([^/]+)/transactions/(\d+)'), self.update_transaction),
+            ('DELETE', re.compile(r'/profiles/([^/]+)/transactions/(\d+)'), self.delete_transaction),
+            ('GET', re.compile(r'/profiles/([^/]+)/summary'), self.profile_summary),
+            ('GET', re.compile(r'/profiles/([^/]+)/categories'), self.profile_categories),
+            ('GET', re.compile(r'/summary'), self.summary)
+        ]
+    
+    # Writer
+    
+    async def submit(self, change):
+        """Queue a change for the writer and wait until it is saved
+        
+        'change' runs on the writer task and returns (names of the changed
+        profiles, response data); the response gets the new versions.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((change, future))
+        return await future
+    
+    async def writer(self):
+        """Apply queued changes in batches, saving each batch with one write"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._apply_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+    
+    async def _apply_batch(self, batch):
+        applied = []
+        changed_names = set()
+        with self.manager.lock:
+            for change, future in batch:
+                try:
+                    names, response = change()
+                except Exception as e:
+                    # Answered by dispatch(); the rest of the batch still commits
+                    settle(future, exception=e)
+                    continue
+                changed_names.update(names)
+                applied.append((names, response, future))
+        if not applied:
+            return
+        
+        merge_count = self.manager.merge_count
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.manager.write_data)
+        except (OSError, RuntimeError) as e:
+            # The changes stay in memory and the next commit (at the latest the
+            # refresher's) saves them; an error would make clients apply them twice
+            save_error = f"Could not save data: {e}"
+        else:
+            save_error = None
+            self.commit_count += 1
+        
+        if self.manager.merge_count != merge_count:
+            self.versions.restart_all(self.manager.get_all_profiles())
+        else:
+            for name in changed_names:
+                profile = self.manager.get_profile(name)
+                if profile is not None:
+                    self.versions.record(profile)
+        for names, response, future in applied:
+            if names:
+                response['version'] = self.versions.current(names[0])
+            if save_error is not None:
+                response['pending'] = True
+                response['save_error'] = save_error
+            settle(future, response)
+    
+    async def refresher(self):
+        """Pick up changes other processes saved to the data file"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.submit(self._refresh)
+    
+    def _refresh(self):
+        if self.manager.refresh_data(blocking=False):
+            self.versions.restart_all(self.manager.get_all_profiles())
+        return [], {}
+    
+    # Handlers
+    
+    def _profile(self, name):
+        profile = self.manager.get_profile(name)
+        if profile is None:
+            raise HTTPError(404, f"Profile '{name}' does not exist")
+        return profile
+    
+    def _profile_record(self, profile):
+        return dict(profile_record(profile), version=self.versions.current(profile.name))
+    
+    async def list_profiles(self, query, body):
+        return 200, [self._profile_record(self.manager.get_profile(name))
+                     for name in self.manager.get_profile_names()]
+    
+    async def get_profile(self, query, body, name):
+        return 200, self._profile_record(self._profile(name))
+    
+    async def add_profile(self, query, body):
+        from models.profile import Profile
+        if not isinstance(body, dict) or not str(body.get('name', '')).strip():
+            raise HTTPError(400, "Expected {\"name\": ...}")
+        name = str(body['name']).strip()
+        
+        def change():
+            if self.manager.has_profile(name):
+                raise HTTPError(409, f"Profile '{name}' already exists")
+            self.manager.profiles.add(Profile(name))
+            return [name], {'profile': name}
+        
+        return 201, await self.submit(change)
+    
+    async def remove_profile(self, query, body, name):
+        def change():
+            if self.manager.profiles.remove(name) is None:
+                raise HTTPError(404, f"Profile '{name}' does not exist")
+            return [], {'removed': name, 'version': self.versions.forget(name)}
+        
+        return 200, await self.submit(change)
+    
+    async def add_transactions(self, query, body, name):
+        items = body if isinstance(body, list) else [body]
+        transactions = [parse_transaction(item) for item in items]
+        
+        def change():
+            profile = self._profile(name)
+            for transaction in transactions:
+                profile.add_transaction(transaction)
+            return [profile.name], {
+                'profile': profile.name,
+                'added': len(transactions),
+                'transactions': profile.get_transaction_count(),
+                'balance': profile.get_balance()
+            }
+        
+        return 201, await self.submit(change)
+    
+    def _transaction_id(self, profile, transaction_id):
+        transaction_id = int(transaction_id)
+        if profile.get_transaction(transaction_id) is None:
+            raise HTTPError(404, f"Profile '{profile.name}' has no transaction {transaction_id}")
+        return transaction_id
+    
+    async def update_transaction(self, query, body, name, transaction_id):
+        changes = parse_transaction_changes(body)
+        
+        def change():
+            profile = self._profile(name)
+            transaction = profile.update_transaction(self._transaction_id(profile, transaction_id), **changes)
+            return [profile.name], {
+                'profile': profile.name,
+                'transaction': transaction_record(transaction),
+                'balance': profile.get_balance()
+            }
+        
+        return 200, await self.submit(change)
+    
+    async def delete_transaction(self, query, body, name, transaction_id):
+        def change():
+            profile = self._profile(name)
+            transaction = profile.delete_transaction(self._transaction_id(profile, transaction_id))
+            return [profile.name], {
+                'profile': profile.name,
+                'deleted': transaction_record(transaction),
+                'transactions': profile.get_transaction_count(),
+                'balance': profile.get_balance()
+            }
+        
+        return 200, await self.submit(change)
+    
+    async def list_transactions(self, query, body, name):
+        profile = self._profile(name)
+        version = self.versions.current(profile.name)
+        if 'since' in query:
+            since = parse_int(query, 'since')
+            count = self.versions.count_at(profile.name, since)
+            ledger = profile.transactions
+            # Rows the writer applied but has not saved yet belong to the next version
+            committed = self.versions.count_at(profile.name, version)
+            end = committed if committed is not None else len(ledger)
+            transactions = ledger[count if count is not None else 0:end]
+            return 200, {
+                'profile': profile.name,
+                'version': version,
+                'full': count is None,
+                'transactions': [transaction_record(transaction) for transaction in transactions]
+            }
+        
+        start = parse_query_date(query, 'from')
+        end = parse_query_date(query, 'to')
+        last = parse_int(query, 'last') if 'last' in query else None
+        if start is not None or end is not None:
+            transactions = profile.get_transactions_between(start, end)
+            if last is not None:
+                transactions = transactions[-last:] if last > 0 else []
+        elif last is not None:
+            transactions = profile.get_recent_transactions(last)
+        else:
+            transactions = profile.transactions
+        return 200, {
+            'profile': profile.name,
+            'version': version,
+            'transactions': [transaction_record(transaction) for transaction in transactions]
+        }
+    
+    async def profile_summary(self, query, body, name):
+        profile = self._profile(name)
+        period = query.get('period')
+        if period is None:
+            return 200, self._profile_record(profile)
+        try:
+            buckets = profile.get_rollup(period, parse_query_date(query, 'from'), parse_query_date(query, 'to'))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        return 200, {'profile': profile.name, 'period': period, 'buckets': buckets}
+    
+    async def profile_categories(self, query, body, name):
+        profile = self._profile(name)
+        return 200, {'profile': profile.name, 'categories': profile.get_category_totals()}
+    
+    async def summary(self, query, body):
+        return 200, self.manager.get_summary_statistics()
+    
+    # HTTP
+    
+    def route(self, method, path):
+        """Get (handler, path arguments) for a request, raising HTTPError if there is none"""
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match:
+                if route_method == method:
+                    return handler, [unquote(argument) for argument in match.groups()]
+                allowed = True
+        if allowed:
+            raise HTTPError(405, f"{method} is not supported on {path}")
+        raise HTTPError(404, f"No such endpoint: {path}")
+    
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one keep-alive connection in order"""
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {'error': "Invalid Content-Length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': "Request body is too large"}, keep_alive=False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b''
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                
+                status, data = await self.dispatch(method, target, raw_body)
+                await self.respond(writer, status, data, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+    
+    async def dispatch(self, method, target, raw_body):
+        """Run the handler of a request; returns (status, response data)"""
+        url = urlsplit(target)
+        try:
+            handler, arguments = self.route(method, url.path.rstrip('/') or '/')
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                body = json.loads(raw_body) if raw_body else None
+            except ValueError:
+                raise HTTPError(400, "Request body is not valid JSON")
+            return await handler(query, body, *arguments)
+        except HTTPError as e:
+            return e.status, {'error': str(e)}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+    
+    async def respond(self, writer, status, data, keep_alive=True):
+        body = json.dumps(data, ensure_ascii=False, default=lambda value: value.isoformat()).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+    
+    async def serve(self, host, port, ready=None):
+        """Run until SIGINT or SIGTERM; 'ready' is called with the bound (host, port)
+        
+        Changes already queued are still saved before returning.
+        """
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stopped.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C still raises KeyboardInterrupt in main()
+                pass
+        
+        self.queue = asyncio.Queue()
+        writer = asyncio.create_task(self.writer())
+        refresher = asyncio.create_task(self.refresher())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        try:
+            await stopped.wait()
+        finally:
+            server.close()
+            for connection in list(self.connections):
+                connection.close()
+            await server.wait_closed()
+            refresher.cancel()
+            await self.queue.join()
+            writer.cancel()
+
+def settle(future, result=None, exception=None):
+    """Resolve a future unless its client went away and it was cancelled"""
+    if future.cancelled():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+def parse_int(query, key):
+    try:
+        return int(query[key])
+    except ValueError:
+        raise HTTPError(400, f"'{key}' must be an integer")
+
+def parse_query_date(query, key):
+    """Parse an optional date query parameter in any format statements may use"""
+    if key not in query:
+        return None
+    from models.importer import DateParser
+    try:
+        return DateParser()(query[key])
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+
+def parse_transaction(data):
+    """Build a transaction from a JSON object with type, amount, description and optional date, category, tags"""
+    from models.transaction import Income, Expense
+    from models.importer import DateParser
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Expected a transaction object")
+    transaction_type = str(data.get('type', '')).lower()
+    if transaction_type not in ('income', 'expense'):
+        raise HTTPError(400, "'type' must be 'income' or 'expense'")
+    description = str(data.get('description', '')).strip()
+    if not description:
+        raise HTTPError(400, "Missing description")
+    try:
+        amount = float(data['amount'])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPError(400, "'amount' must be a number")
+    if not amount > 0:
+        raise HTTPError(400, "Amount must be greater than 0")
+    
+    transaction = (Income if transaction_type == 'income' else Expense)(
+        description, amount, str(data.get('category') or ''), data.get('tags') or ())
+    if data.get('date'):
+        transaction.date = DateParser()(str(data['date']))
+    return transaction
+
+def parse_transaction_changes(data):
+    """Get the changed fields of a transaction from a JSON object with any of type, amount, description, date, category, tags"""
+    from models.importer import DateParser
+    if not isinstance(data, dict) or not data:
+        raise HTTPError(400, "Expected an object with the fields to change")
+    unknown = set(data) - {'type', 'amount', 'description', 'date', 'category', 'tags'}
+    if unknown:
+        raise HTTPError(400, f"Unknown field '{sorted(unknown)[0]}'")
+    changes = {}
+    if 'type' in data:
+        transaction_type = str(data['type']).lower()
+        if transaction_type not in ('income', 'expense'):
+            raise HTTPError(400, "'type' must be 'income' or 'expense'")
+        changes['transaction_type'] = transaction_type
+    if 'description' in data:
+        changes['description'] = str(data['description']).strip()
+        if not changes['description']:
+            raise HTTPError(400, "Missing description")
+    if 'amount' in data:
+        try:
+            changes['amount'] = float(data['amount'])
+        except (TypeError, ValueError):
+            raise HTTPError(400, "'amount' must be a number")
+        if not changes['amount'] > 0:
+            raise HTTPError(400, "Amount must be greater than 0")
+    if 'date' in data:
+        changes['date'] = DateParser()(str(data['date']))
+    if 'category' in data:
+        changes['category'] = str(data['category'] or '')
+    if 'tags' in data:
+        changes['tags'] = data['tags'] or ()
+    return changes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the finance data to other devices over HTTP/JSON")
+    parser.add_argument('--data-file', default=DEFAULT_DATA_FILE,
+                        help=f"data file to use (default: {DEFAULT_DATA_FILE})")
+    parser.add_argument('--layout', choices=['single', 'sharded'], default='single')
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on, 0 for any free port")
+    args = parser.parse_args(argv)
+    
+    from models.financial_manager import FinancialManager
+    manager = FinancialManager(args.data_file, use_journal=True, lazy=True, layout=args.layout)
+    server = SyncServer(manager)
+    
+    def ready(address):
+        # One JSON line, so scripts starting the server can read the bound port
+        print(json.dumps({'listening': f"http://{address[0]}:{address[1]}"}), flush=True)
+    
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
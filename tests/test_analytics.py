@@ -0,0 +1,39 @@
+from datetime import date, datetime
+import pytest
+from models.analytics import HAS_NUMPY, LedgerAnalytics
+from models.profile import Profile
+from models.transaction import Income, Expense
+
+MODES = [False, True] if HAS_NUMPY else [False]
+
+def make_profile(entries):
+    profile = Profile('Ann')
+    for day, amount in entries:
+        transaction = Income('pay', amount) if amount > 0 else Expense('spend', -amount)
+        transaction.date = datetime(2024, 1, day, 12)
+        profile.add_transaction(transaction)
+    return profile
+
+@pytest.mark.parametrize('use_numpy', MODES)
+def test_moving_average_counts_days_without_transactions_as_zero(use_numpy):
+    analytics = LedgerAnalytics(make_profile([(1, 300), (2, -60), (5, 90)]), use_numpy=use_numpy)
+    assert analytics.moving_average(3) == [
+        (date(2024, 1, 3), 80), (date(2024, 1, 4), -20), (date(2024, 1, 5), 30)]
+    assert analytics.moving_average(6) == []
+
+@pytest.mark.parametrize('use_numpy', MODES)
+def test_reports_follow_profile_changes(use_numpy):
+    profile = make_profile([(1, 300), (2, -60), (3, -40)])
+    analytics = LedgerAnalytics(profile, use_numpy=use_numpy)
+    assert analytics.totals() == (300, 100)
+    
+    profile.update_transaction(2, amount=10)
+    assert analytics.totals() == (300, 50)
+    profile.delete_transaction(1)
+    profile.add_transaction(Income('refund', 5))
+    assert analytics.totals() == (5, 50)
+    assert list(analytics.running_balances()) == [-10, -50, -45]
+    
+    # Same transaction count and edit count, but a different ledger
+    profile.set_ledger(make_profile([(1, 1), (2, -2), (3, 3)]).transactions)
+    assert analytics.totals() == (4, 2)
\ No newline at end of file
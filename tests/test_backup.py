@@ -0,0 +1,43 @@
+from datetime import datetime
+from models.backup import BackupStore
+from models.profile import Profile
+from models.transaction import Income, Expense
+
+def make_profile(name='Ann'):
+    profile = Profile(name)
+    profile.created_date = datetime(2024, 1, 1)
+    for number in range(1, 8):
+        transaction_class = Income if number % 2 else Expense
+        profile.add_transaction(transaction_class(f'item {number}', 1000 * number, 'food'))
+    return profile
+
+def rows(profile):
+    return [(transaction.id, transaction.description, transaction.amount) for transaction in profile.transactions]
+
+def test_backups_share_unchanged_chunks(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'), chunk_size=3)
+    profile = make_profile()
+    first = store.backup([profile])
+    profile.add_transaction(Expense('taxi', 35000))
+    second = store.backup([profile])
+    
+    first_chunks = store._read_manifest(first)['profiles'][0]['chunks']
+    second_chunks = store._read_manifest(second)['profiles'][0]['chunks']
+    assert second_chunks[:2] == first_chunks[:2]
+    assert [rows(restored) for restored in store.restore(first)] == [rows(make_profile())]
+    assert [rows(restored) for restored in store.restore()] == [rows(profile)]
+
+def test_prune_without_any_chunks(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'))
+    backup_ids = [store.backup([Profile('Empty')]) for _ in range(3)]
+    removed = store.prune(keep_last=1, keep_daily=0)
+    assert len(removed) == 2
+    assert store.list_backups() == [backup_id for backup_id in backup_ids if backup_id not in removed]
+    assert [profile.name for profile in store.restore()] == ['Empty']
+def test_restore_keeps_whitespace_inside_tags(tmp_path):
+    store = BackupStore(str(tmp_path / 'backups'))
+    data = make_profile().to_dict()
+    data['transactions'][0]['tags'] = ['new york', 'trip ']
+    store.backup([Profile.from_dict(data)])
+    [restored] = store.restore()
+    assert restored.transactions[0].tags == ('new york', 'trip ')
\ No newline at end of file
@@ -0,0 +1,26 @@
+from models.financial_manager import FinancialManager
+from models.profile import Profile
+from models.transaction import Income
+
+def test_names_colliding_when_ignoring_case_are_renamed_on_load(tmp_path, capsys):
+    data_file = str(tmp_path / 'data.json')
+    exact = FinancialManager(data_file, use_journal=True)
+    for name, amount in (('Budi', 100), ('budi', 200)):
+        profile = Profile(name)
+        profile.add_transaction(Income('salary', amount))
+        exact.add_profile(profile)
+    exact.close()
+    
+    manager = FinancialManager(data_file, use_journal=True, case_insensitive_names=True)
+    assert "renamed it to 'budi (2)'" in capsys.readouterr().out
+    assert manager.get_profile_names() == ['Budi', 'budi (2)']
+    assert manager.get_profile('BUDI').get_balance() == 100
+    assert manager.get_profile('Budi (2)').get_balance() == 200
+    assert manager.case_insensitive_names
+    
+    manager.write_data()
+    manager.close()
+    stored = FinancialManager(data_file, use_journal=True)
+    assert [(profile.name, profile.get_balance()) for profile in stored.get_all_profiles()] == [
+        ('Budi', 100), ('budi (2)', 200)]
+    stored.close()
\ No newline at end of file
@@ -0,0 +1,57 @@
+from datetime import datetime
+import pytest
+from models.importer import parse_amount, DateParser
+
+@pytest.mark.parametrize('text, amount', [
+    ('1,234.50', 1234.5),
+    ('1.234,50', 1234.5),
+    ('12,50', 12.5),
+    ('1,234', 1234),
+    ('Rp 50.000', 50000),
+    ('IDR 1.250.000', 1250000),
+    ('1.234.567', 1234567),
+    ('50.000', 50.0),
+    ('1.500', 1.5),
+    ('12.5', 12.5),
+    ('(75.00)', -75),
+    ('-20', -20)
+])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
+
+def test_parse_amount_decimal_comma_setting():
+    assert parse_amount('50.000', decimal_comma=True) == 50000
+    assert parse_amount('Rp 50.000', decimal_comma=False) == 50.0
+    with pytest.raises(ValueError):
+        parse_amount('1.234.567', decimal_comma=False)
+
+@pytest.mark.parametrize('text', ['', 'Rp', 'abc', 'inf', 'nan'])
+def test_parse_amount_rejects_invalid_text(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+@pytest.mark.parametrize('text, date', [
+    ('2024-01-05', datetime(2024, 1, 5)),
+    ('2024-01-05 10:30', datetime(2024, 1, 5, 10, 30)),
+    ('05/01/2024', datetime(2024, 1, 5)),
+    ('05-01-2024', datetime(2024, 1, 5)),
+    ('2024/01/05', datetime(2024, 1, 5)),
+    ('20240105', datetime(2024, 1, 5)),
+    ('202401051030', datetime(2024, 1, 5, 10, 30)),
+    ('20240105120000.000[-7:MST]', datetime(2024, 1, 5, 12)),
+    ('2024-01-05T10:00:00+07:00', datetime(2024, 1, 5, 10))
+])
+def test_date_parser(text, date):
+    assert DateParser()(text) == date
+
+@pytest.mark.parametrize('text', ['2024010512', 'yesterday', '31/02/2024'])
+def test_date_parser_rejects_unknown_dates(text):
+    with pytest.raises(ValueError):
+        DateParser()(text)
+
+def test_date_parser_tries_the_last_matching_format_first():
+    parse = DateParser()
+    assert parse('05/01/2024') == datetime(2024, 1, 5)
+    assert parse.last_format == '%d/%m/%Y'
+    assert parse('2024-02-03') == datetime(2024, 2, 3)
+    assert parse.last_format == '%Y-%m-%d'
\ No newline at end of file
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from models.profile import Profile
+from models.transaction import Income, Expense
+
+START = datetime(2024, 1, 1)
+WORDS = ('coffee', 'rent', 'salary', 'grocery', 'fuel', 'book', 'cinema')
+CATEGORIES = ('', 'food', 'home', 'work', 'fun')
+
+def random_transaction(rng, minutes):
+    """Build a transaction with whole amounts, so incremental and full sums are exactly equal"""
+    transaction_class = Income if rng.random() < 0.3 else Expense
+    transaction = transaction_class(f'{rng.choice(WORDS)} {rng.choice(WORDS)}', rng.randint(1, 500) * 1000,
+                                    rng.choice(CATEGORIES), rng.sample(WORDS, rng.randint(0, 2)))
+    transaction.date = START + timedelta(minutes=minutes.pop())
+    return transaction
+
+def reports(profile):
+    """Everything the incrementally kept indexes answer"""
+    count = profile.get_transaction_count()
+    return {
+        'totals': (profile.get_balance(), profile.get_total_income(), profile.get_total_expenses()),
+        'balances': profile.get_running_balances(),
+        'last balance': profile.get_running_balance(count - 1) if count else None,
+        'recent': [transaction.id for transaction in profile.get_recent_transactions(7)],
+        'between': [transaction.id for transaction in profile.get_transactions_between(
+            START + timedelta(days=3), START + timedelta(days=20))],
+        'days': profile.get_rollup('day'),
+        'weeks': profile.get_rollup('week'),
+        'months': profile.get_rollup('month', START + timedelta(days=10)),
+        'categories': profile.get_category_totals(),
+        'category names': profile.get_categories(),
+        'search': [transaction.id for transaction in profile.search('co')],
+        'search in category': [transaction.id for transaction in profile.search('rent', 'home')],
+        'completions': profile.complete_word('c')
+    }
+
+def rebuilt(profile):
+    return Profile.from_dict(profile.to_dict())
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_indexes_match_a_full_rebuild(seed):
+    rng = random.Random(seed)
+    minutes = rng.sample(range(60 * 24 * 60), 400)
+    profile = Profile('Ann')
+    for _ in range(60):
+        profile.add_transaction(random_transaction(rng, minutes))
+    # Build every index, so the changes below update them instead of rebuilding them
+    assert reports(profile) == reports(rebuilt(profile))
+    
+    for _ in range(120):
+        action = rng.random()
+        ids = [transaction.id for transaction in profile.transactions]
+        if action < 0.4 or not ids:
+            profile.add_transaction(random_transaction(rng, minutes))
+        elif action < 0.75:
+            changes = rng.choice([
+                {'amount': rng.randint(1, 500) * 1000},
+                {'description': f'{rng.choice(WORDS)} edited'},
+                {'category': rng.choice(CATEGORIES)},
+                {'tags': rng.sample(WORDS, 2)},
+                {'transaction_type': rng.choice(['Income', 'Expense'])},
+                {'date': START + timedelta(minutes=minutes.pop())}
+            ])
+            profile.update_transaction(rng.choice(ids), **changes)
+        else:
+            profile.delete_transaction(rng.choice(ids))
+        if rng.random() < 0.2:
+            assert reports(profile) == reports(rebuilt(profile))
+    
+    assert reports(profile) == reports(rebuilt(profile))
+    assert profile.verify_totals()
+
+def test_indexes_follow_a_transaction_added_before_the_latest_date():
+    profile = Profile('Ann')
+    for day in (1, 5, 9):
+        transaction = Expense(f'item {day}', 1000)
+        transaction.date = START + timedelta(days=day)
+        profile.add_transaction(transaction)
+    assert [transaction.description for transaction in profile.get_recent_transactions(2)] == ['item 5', 'item 9']
+    
+    earlier = Income('refund', 500)
+    earlier.date = START + timedelta(days=3)
+    profile.add_transaction(earlier)
+    assert reports(profile) == reports(rebuilt(profile))
+    assert profile.get_recent_transactions(0) == []
\ No newline at end of file
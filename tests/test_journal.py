@@ -0,0 +1,119 @@
+import json
+from models.financial_manager import FinancialManager
+from models.journal import Journal
+from models.profile import Profile
+from models.storage import JSONStorage
+from models.transaction import Income, Expense
+
+def test_replay_yields_records_of_newer_segments_in_order(tmp_path):
+    journal = Journal(str(tmp_path / 'data.json'))
+    for number in range(3):
+        journal.append({'op': 'add', 'number': number})
+    upto = journal.rotate()
+    for number in range(3, 5):
+        journal.append({'op': 'add', 'number': number})
+    journal.close()
+    
+    replayed = Journal(str(tmp_path / 'data.json'))
+    assert [record['number'] for record in replayed.replay()] == [0, 1, 2, 3, 4]
+    assert replayed.record_count == 5
+    assert [record['number'] for record in Journal(str(tmp_path / 'data.json')).replay(after=upto)] == [3, 4]
+
+def test_replay_cuts_off_a_torn_tail(tmp_path):
+    journal = Journal(str(tmp_path / 'data.json'))
+    journal.append({'op': 'add', 'number': 1})
+    journal.append({'op': 'add', 'number': 2})
+    journal.close()
+    path = journal.segment_path(1)
+    with open(path, 'ab') as file:
+        file.write(b'{"op": "add", "num')
+    
+    replayed = Journal(str(tmp_path / 'data.json'))
+    assert [record['number'] for record in replayed.replay()] == [1, 2]
+    with open(path, 'rb') as file:
+        assert file.read().endswith(b'\n')
+    
+    # Records appended after the cut are read back whole
+    replayed.append({'op': 'add', 'number': 3})
+    replayed.close()
+    assert [record['number'] for record in Journal(str(tmp_path / 'data.json')).replay()] == [1, 2, 3]
+
+def test_read_new_returns_only_records_appended_by_others(tmp_path):
+    writer = Journal(str(tmp_path / 'data.json'))
+    reader = Journal(str(tmp_path / 'data.json'))
+    writer.append({'op': 'add', 'number': 1})
+    assert reader.has_new()
+    assert [record['number'] for record in reader.read_new()] == [1]
+    assert not reader.has_new()
+    writer.append({'op': 'add', 'number': 2})
+    writer.close()
+    assert [record['number'] for record in reader.read_new()] == [2]
+
+def test_storage_replays_journal_and_ignores_a_torn_record(tmp_path):
+    data_file = str(tmp_path / 'data.json')
+    storage = JSONStorage(data_file, use_journal=True)
+    profile = Profile('Ann')
+    profile.add_transaction(Income('salary', 5000000, 'work'))
+    storage.save_profiles([profile])
+    storage.compact([profile])
+    profile.add_transaction(Expense('lunch', 50000, 'food'))
+    storage.save_profiles([profile])
+    storage.journal.close()
+    
+    path = storage.journal.segments()[-1][1]
+    with open(path, 'ab') as file:
+        file.write(json.dumps({'op': 'add_transaction', 'profile': 'Ann'}).encode('utf-8')[:20])
+    
+    [loaded] = JSONStorage(data_file, use_journal=True).load_profiles()
+    assert [(transaction.id, transaction.description, transaction.amount) for transaction in loaded.transactions] == [
+        (1, 'salary', 5000000), (2, 'lunch', 50000)]
+    assert loaded.get_balance() == 4950000
+def test_storage_replays_journaled_edits_and_deletions(tmp_path):
+    data_file = str(tmp_path / 'data.json')
+    storage = JSONStorage(data_file, use_journal=True)
+    profile = Profile('Ann')
+    profile.add_transaction(Income('salary', 5000000, 'work'))
+    profile.add_transaction(Expense('lunch', 50000, 'food'))
+    storage.save_profiles([profile])
+    storage.compact([profile])
+    profile.update_transaction(1, amount=6000000)
+    profile.delete_transaction(2)
+    profile.add_transaction(Expense('taxi', 35000, 'transport'))
+    storage.save_profiles([profile])
+    storage.journal.close()
+    
+    [loaded] = JSONStorage(data_file, use_journal=True).load_profiles()
+    assert [(transaction.id, transaction.description, transaction.amount) for transaction in loaded.transactions] == [
+        (1, 'salary', 6000000), (3, 'taxi', 35000)]
+    assert loaded.get_balance() == 5965000
+def test_append_syncs_once_the_oldest_unsynced_record_is_old_enough(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr('models.journal.os.fsync', synced.append)
+    clock = [100.0]
+    monkeypatch.setattr('models.journal.time.monotonic', lambda: clock[0])
+    journal = Journal(str(tmp_path / 'data.json'), sync_every=50, sync_interval=1.0)
+    journal.append({'op': 'add', 'number': 1})
+    clock[0] += 0.5
+    journal.append({'op': 'add', 'number': 2})
+    assert synced == []
+    clock[0] += 0.5
+    journal.append({'op': 'add', 'number': 3})
+    assert len(synced) == 1
+    
+    # The interval counts from the first record after a sync
+    clock[0] += 5
+    journal.append({'op': 'add', 'number': 4})
+    assert len(synced) == 1
+    journal.close()
+    assert len(synced) == 2
+
+def test_worker_syncs_the_journal_when_it_runs_out_of_requests(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr('models.journal.os.fsync', synced.append)
+    manager = FinancialManager(str(tmp_path / 'data.json'), use_journal=True)
+    worker = manager.start_worker()
+    manager.add_profile(Profile('Ann'))
+    worker.flush()
+    assert len(synced) == 1
+    assert manager.storage.journal.record_count == 1
+    manager.close()
\ No newline at end of file
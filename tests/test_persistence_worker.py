@@ -0,0 +1,29 @@
+from models.financial_manager import FinancialManager
+from models.persistence_worker import PersistenceWorker
+from models.profile import Profile
+from models.transaction import Income
+
+def drain(worker):
+    results = []
+    while not worker.results.empty():
+        results.append(worker.results.get_nowait())
+    return results
+
+def test_saves_and_refreshes_report_through_the_results_queue(tmp_path):
+    data_file = str(tmp_path / 'data.json')
+    manager = FinancialManager(data_file, use_journal=True)
+    worker = manager.start_worker()
+    manager.add_profile(Profile('Ann'))
+    worker.request_save()
+    worker.flush()
+    assert drain(worker) == [(PersistenceWorker.SAVE, True, None)]
+    
+    other = FinancialManager(data_file, use_journal=True)
+    other.get_profile('Ann').add_transaction(Income('salary', 5000))
+    other.write_data()
+    worker.request_refresh()
+    assert worker.results.get(timeout=5) == (PersistenceWorker.REFRESH, True, True)
+    assert manager.get_profile('Ann').get_balance() == 5000
+    
+    for financial_manager in (manager, other):
+        financial_manager.close()
\ No newline at end of file
@@ -0,0 +1,49 @@
+from itertools import accumulate
+import pytest
+from models.profile import Profile
+from models.transaction import Income, Expense
+
+def make_profile():
+    profile = Profile('Ann')
+    for number in range(1, 11):
+        transaction_class = Income if number % 3 == 0 else Expense
+        profile.add_transaction(transaction_class(f'item {number}', 1000 * number))
+    return profile
+
+def totals(profile):
+    return profile.get_balance(), profile.get_total_income(), profile.get_total_expenses()
+
+def test_totals_follow_added_transactions():
+    profile = make_profile()
+    assert totals(profile) == (-19000, 18000, 37000)
+    assert totals(profile) == profile.compute_totals()
+    assert profile.verify_totals()
+
+def test_totals_follow_removed_transactions():
+    profile = make_profile()
+    profile.remove_transaction(profile.transactions[2])
+    profile.remove_transaction(profile.transactions[0])
+    assert totals(profile) == (-21000, 15000, 36000)
+    assert totals(profile) == profile.compute_totals()
+    
+    with pytest.raises(ValueError):
+        profile.remove_transaction(Income('elsewhere', 1))
+
+def test_running_balances_are_prefix_sums():
+    profile = make_profile()
+    amounts = [transaction.get_amount() for transaction in profile.transactions]
+    assert profile.get_running_balances() == list(accumulate(amounts))
+    assert profile.get_running_balance(-1) == profile.get_balance()
+    
+    profile.add_transaction(Income('bonus', 500))
+    profile.remove_transaction(profile.transactions[4])
+    amounts = [transaction.get_amount() for transaction in profile.transactions]
+    assert profile.get_running_balances() == list(accumulate(amounts))
+    with pytest.raises(IndexError):
+        profile.get_running_balance(len(amounts))
+
+def test_totals_are_computed_once_when_loaded():
+    profile = make_profile()
+    loaded = Profile.from_dict(profile.to_dict())
+    assert totals(loaded) == totals(profile)
+    assert loaded.get_running_balances() == profile.get_running_balances()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import sqlite3
+from datetime import datetime
+import pytest
+from models.profile import Profile
+from models.sqlite_storage import SQLiteStorage, migrate_json_to_sqlite
+from models.storage import JSONStorage
+from models.transaction import Income
+
+# Transactions table of databases that stored dates as text and had no transaction ids yet
+LEGACY_SCHEMA = """
+    CREATE TABLE profiles (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, created_date TEXT NOT NULL);
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY,
+        profile_id INTEGER NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+        type TEXT NOT NULL,
+        description TEXT NOT NULL,
+        amount REAL NOT NULL,
+        date TEXT NOT NULL
+    );
+    CREATE INDEX idx_transactions_profile_date ON transactions(profile_id, date);
+"""
+
+def columns(db_file):
+    connection = sqlite3.connect(db_file)
+    try:
+        return {row[1]: row[2] for row in connection.execute("PRAGMA table_info(transactions)")}
+    finally:
+        connection.close()
+
+def test_dates_are_stored_as_integer_timestamps(tmp_path):
+    db_file = str(tmp_path / 'data.db')
+    storage = SQLiteStorage(db_file)
+    profile = Profile('Ann')
+    transaction = Income('salary', 5000)
+    transaction.date = datetime(2024, 3, 1, 9, 30, 15, 250)
+    profile.add_transaction(transaction)
+    storage.save_profiles([profile])
+    storage.close([profile])
+    
+    assert 'date' not in columns(db_file)
+    assert columns(db_file)['timestamp'] == 'INTEGER'
+    connection = sqlite3.connect(db_file)
+    assert connection.execute("SELECT timestamp FROM transactions").fetchone() == (transaction.timestamp,)
+    connection.close()
+    [loaded] = SQLiteStorage(db_file).load_profiles()
+    assert loaded.transactions[0].date == transaction.date
+
+def test_text_dates_of_older_databases_are_converted(tmp_path):
+    db_file = str(tmp_path / 'data.db')
+    connection = sqlite3.connect(db_file)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("INSERT INTO profiles (name, created_date) VALUES ('Ann', '2024-01-01T00:00:00')")
+    connection.executemany("INSERT INTO transactions (profile_id, type, description, amount, date) VALUES (1, ?, ?, ?, ?)",
+                           [('Income', 'salary', 5000, '2024-01-25T08:00:00'),
+                            ('Expense', 'lunch', 50, '2024-01-26T12:15:30.000500')])
+    connection.commit()
+    connection.close()
+    
+    [profile] = SQLiteStorage(db_file).load_profiles()
+    assert [(transaction.id, transaction.description, transaction.date) for transaction in profile.transactions] == [
+        (1, 'salary', datetime(2024, 1, 25, 8)), (2, 'lunch', datetime(2024, 1, 26, 12, 15, 30, 500))]
+    assert 'date' not in columns(db_file)
+    assert profile.get_balance() == 4950
+
+def test_migration_leaves_a_database_with_profiles_alone(tmp_path):
+    json_file = str(tmp_path / 'data.json')
+    db_file = str(tmp_path / 'data.db')
+    JSONStorage(json_file, use_journal=True).save_profiles([Profile('Budi')])
+    assert migrate_json_to_sqlite(json_file, db_file) == 1
+    
+    JSONStorage(json_file, use_journal=True).save_profiles([Profile('Ann')])
+    with pytest.raises(ValueError):
+        migrate_json_to_sqlite(json_file, db_file)
+    assert [profile.name for profile in SQLiteStorage(db_file).load_profiles()] == ['Budi']
\ No newline at end of file
@@ -0,0 +1,246 @@
+import os
+from datetime import datetime
+import pytest
+from models.financial_manager import FinancialManager
+from models.profile import Profile
+from models.recurring import RecurringRule
+from models.sharded_storage import ShardedStorage
+from models.sqlite_storage import SQLiteStorage
+from models.storage import JSONStorage
+from models.transaction import Income, Expense
+
+STORAGES = {
+    'json': lambda path: JSONStorage(os.path.join(path, 'data.json')),
+    'journal': lambda path: JSONStorage(os.path.join(path, 'data.json'), use_journal=True),
+    'lazy': lambda path: JSONStorage(os.path.join(path, 'data.json'), use_journal=True, lazy=True),
+    'binary': lambda path: JSONStorage(os.path.join(path, 'data.json'), use_journal=True, snapshot_format='binary'),
+    'sharded': lambda path: ShardedStorage(os.path.join(path, 'data')),
+    'sqlite': lambda path: SQLiteStorage(os.path.join(path, 'data.db'))
+}
+
+# Manager options of the layouts several processes can share
+SHARED_LAYOUTS = {
+    'json': {},
+    'journal': {'use_journal': True},
+    'lazy': {'use_journal': True, 'lazy': True},
+    'binary': {'use_journal': True, 'snapshot_format': 'binary'},
+    'sharded': {'layout': 'sharded'}
+}
+
+def make_profile(name='Ann'):
+    profile = Profile(name)
+    profile.created_date = datetime(2024, 1, 1)
+    for day in range(1, 21):
+        transaction_class = Income if day % 4 == 0 else Expense
+        transaction = transaction_class(f'item {day}', 1000 * day, 'food' if day % 2 else '',
+                                        'cash' if day % 3 == 0 else ())
+        transaction.date = datetime(2024, 1, day, 12)
+        profile.add_transaction(transaction)
+    profile.add_recurring_rule(RecurringRule('rent', 1500000, 'Expense', 'monthly', 1, datetime(2024, 2, 1)))
+    return profile
+
+def rows(profile):
+    return [(transaction.id, transaction.get_type(), transaction.description, transaction.amount,
+             transaction.date, transaction.category, transaction.tags) for transaction in profile.transactions]
+
+def rule_dicts(profile):
+    return [rule.to_dict() for rule in profile.get_recurring_rules()]
+
+def reload(make, path):
+    storage = make(path)
+    return {profile.name: profile for profile in storage.load_profiles()}
+
+@pytest.mark.parametrize('kind', STORAGES)
+def test_round_trip(tmp_path, kind):
+    make = STORAGES[kind]
+    profiles = [make_profile('Ann'), make_profile('Budi')]
+    storage = make(str(tmp_path))
+    storage.save_profiles(profiles)
+    if hasattr(storage, 'compact'):
+        profiles[0].add_transaction(Income('bonus', 250000))
+        storage.compact(profiles)
+    
+    loaded = reload(make, str(tmp_path))
+    assert list(loaded) == ['Ann', 'Budi']
+    for profile in profiles:
+        stored = loaded[profile.name]
+        # Totals come from the stored index, before the transactions are read
+        assert stored.get_balance() == profile.get_balance()
+        assert stored.get_transaction_count() == profile.get_transaction_count()
+        assert rows(stored) == rows(profile)
+        assert rule_dicts(stored) == rule_dicts(profile)
+        assert stored.created_date == profile.created_date
+
+@pytest.mark.parametrize('kind', ['lazy', 'sharded', 'sqlite'])
+def test_lazy_profiles_read_transactions_on_first_access(tmp_path, kind):
+    make = STORAGES[kind]
+    storage = make(str(tmp_path))
+    storage.save_profiles([make_profile()])
+    if hasattr(storage, 'compact'):
+        # Profiles added through the journal are read in full until they are in the snapshot
+        storage.compact([make_profile()])
+    
+    profile = reload(make, str(tmp_path))['Ann']
+    assert not profile.is_loaded()
+    assert profile.get_total_income() == make_profile().get_total_income()
+    assert rows(profile) == rows(make_profile())
+    assert profile.is_loaded()
+
+@pytest.mark.parametrize('kind', STORAGES)
+def test_later_saves_add_only_new_transactions(tmp_path, kind):
+    make = STORAGES[kind]
+    profile = make_profile()
+    storage = make(str(tmp_path))
+    storage.save_profiles([profile])
+    profile.add_transaction(Expense('taxi', 35000, 'transport'))
+    storage.save_profiles([profile])
+    storage.save_profiles([profile])
+    
+    stored = reload(make, str(tmp_path))['Ann']
+    assert rows(stored) == rows(profile)
+    assert stored.get_total_expenses() == profile.get_total_expenses()
+@pytest.mark.parametrize('kind', STORAGES)
+def test_recurring_rule_changes_persist(tmp_path, kind):
+    make = STORAGES[kind]
+    profile = make_profile()
+    storage = make(str(tmp_path))
+    storage.save_profiles([profile])
+    
+    [rent] = profile.get_recurring_rules()
+    profile.update_recurring_rule(rent, amount=1750000)
+    profile.add_recurring_rule(RecurringRule('salary', 9000000, 'Income', 'monthly', 1, datetime(2024, 2, 25)))
+    storage.save_profiles([profile])
+    
+    stored = reload(make, str(tmp_path))['Ann']
+    assert rule_dicts(stored) == rule_dicts(profile)
+    assert rows(stored) == rows(profile)
+
+@pytest.mark.parametrize('kind', STORAGES)
+def test_edits_and_deletions_persist(tmp_path, kind):
+    make = STORAGES[kind]
+    profile = make_profile()
+    storage = make(str(tmp_path))
+    storage.save_profiles([profile])
+    
+    profile.update_transaction(3, amount=777, description='changed', category='rent')
+    profile.delete_transaction(5)
+    profile.delete_transaction(20)
+    storage.save_profiles([profile])
+    
+    stored = reload(make, str(tmp_path))['Ann']
+    assert rows(stored) == rows(profile)
+    assert stored.get_balance() == profile.get_balance()
+    # The id of the deleted newest transaction is not given out again
+    transaction = Income('new', 1)
+    stored.add_transaction(transaction)
+    assert transaction.id == 21
+
+@pytest.mark.parametrize('layout', SHARED_LAYOUTS)
+def test_merge_keeps_additions_of_both_managers(tmp_path, layout):
+    data_file = str(tmp_path / 'data.json')
+    options = SHARED_LAYOUTS[layout]
+    first = FinancialManager(data_file, **options)
+    first.add_profile(make_profile())
+    first.write_data()
+    
+    second = FinancialManager(data_file, **options)
+    first.get_profile('Ann').add_transaction(Income('first', 10))
+    first.add_profile(make_profile('Budi'))
+    first.write_data()
+    second.get_profile('Ann').add_transaction(Income('second', 20))
+    second.write_data()
+    
+    expected = rows(second.get_profile('Ann'))
+    assert [row[2] for row in expected[-2:]] == ['first', 'second']
+    assert len({row[0] for row in expected}) == len(expected)
+    assert second.get_profile('Budi') is not None
+    
+    first.refresh_data()
+    assert rows(first.get_profile('Ann')) == expected
+    assert rows(FinancialManager(data_file, **options).get_profile('Ann')) == expected
+    for manager in (first, second):
+        manager.close()
+
+@pytest.mark.parametrize('layout', SHARED_LAYOUTS)
+def test_merge_keeps_edits_and_deletions_of_both_managers(tmp_path, layout):
+    data_file = str(tmp_path / 'data.json')
+    options = SHARED_LAYOUTS[layout]
+    first = FinancialManager(data_file, **options)
+    first.add_profile(make_profile())
+    first.write_data()
+    
+    second = FinancialManager(data_file, **options)
+    first.get_profile('Ann').delete_transaction(3)
+    first.get_profile('Ann').add_transaction(Income('first', 10))
+    first.write_data()
+    second.get_profile('Ann').update_transaction(1, description='second edit')
+    second.get_profile('Ann').add_transaction(Income('second', 20))
+    second.write_data()
+    
+    expected = rows(second.get_profile('Ann'))
+    descriptions = [row[2] for row in expected]
+    assert 'item 3' not in descriptions
+    assert descriptions[0] == 'second edit'
+    assert descriptions[-2:] == ['first', 'second']
+    assert len({row[0] for row in expected}) == len(expected)
+    
+    first.refresh_data()
+    assert rows(first.get_profile('Ann')) == expected
+    assert rows(FinancialManager(data_file, **options).get_profile('Ann')) == expected
+    for manager in (first, second):
+        manager.close()
+
+@pytest.mark.parametrize('layout', SHARED_LAYOUTS)
+def test_merge_keeps_a_transaction_edited_here_and_deleted_elsewhere(tmp_path, layout):
+    data_file = str(tmp_path / 'data.json')
+    options = SHARED_LAYOUTS[layout]
+    first = FinancialManager(data_file, **options)
+    first.add_profile(make_profile())
+    first.write_data()
+    
+    second = FinancialManager(data_file, **options)
+    first.get_profile('Ann').delete_transaction(4)
+    first.write_data()
+    second.get_profile('Ann').update_transaction(4, amount=444)
+    second.write_data()
+    
+    stored = FinancialManager(data_file, **options).get_profile('Ann')
+    assert stored.get_transaction(4).amount == 444
+    assert rows(stored) == rows(second.get_profile('Ann'))
+    for manager in (first, second):
+        manager.close()
+@pytest.mark.parametrize('layout', SHARED_LAYOUTS)
+def test_saving_releases_stored_edits(tmp_path, layout):
+    data_file = str(tmp_path / 'data.json')
+    options = SHARED_LAYOUTS[layout]
+    manager = FinancialManager(data_file, **options)
+    manager.add_profile(make_profile())
+    manager.write_data()
+    
+    profile = manager.get_profile('Ann')
+    profile.update_transaction(2, amount=222)
+    profile.delete_transaction(6)
+    manager.write_data()
+    assert profile.edit_count == 2
+    assert profile.get_edits(2) == []
+    with pytest.raises(ValueError):
+        profile.get_edits(0)
+    
+    profile.update_transaction(7, description='after release')
+    manager.write_data()
+    assert rows(FinancialManager(data_file, **options).get_profile('Ann')) == rows(profile)
+    manager.close()
+@pytest.mark.parametrize('kind', ['binary', 'sharded'])
+def test_binary_blocks_keep_whitespace_inside_tags(tmp_path, kind):
+    make = STORAGES[kind]
+    data = make_profile().to_dict()
+    # Older data files may hold tags that were not normalized
+    data['transactions'][0]['tags'] = ['new york', 'trip ']
+    profile = Profile.from_dict(data)
+    storage = make(str(tmp_path))
+    storage.save_profiles([profile])
+    storage.compact([profile])
+    
+    stored = reload(make, str(tmp_path))['Ann']
+    assert stored.transactions[0].tags == ('new york', 'trip ')
+    assert rows(stored) == rows(profile)
\ No newline at end of file